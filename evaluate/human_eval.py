@@ -1,9 +1,15 @@
+import sys
 from pathlib import Path
-from typing import Iterable, TypeVar
+from typing import Iterable, Optional, TypeVar
 
 import datasets
 
 from tdg import parse_humaneval
+from tdg.batch import OpenAIBatchSubmitter
+from tdg.cassette import CassetteDeck, CassetteMode
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.pool import WorkerPool
+from tdg.executors.sharding import ShardedRunner
 
 
 import itertools
@@ -27,7 +33,11 @@ def chunked_iterable(iterable: T, chunk_size) -> Iterable[T]:
 CHUNK = 50
 
 
-def main():
+def main(
+    batched: bool = False,
+    cassette_mode: Optional[CassetteMode] = None,
+    runner: Optional[str] = None,
+):
     data = datasets.load_dataset("evalplus/humanevalplus")
 
     dataset = [HEPItem.model_validate(item) for item in data["test"]]
@@ -37,24 +47,35 @@ def main():
     without_failures = (h for h in hep_suites if h)
     batches = chunked_iterable(without_failures, chunk_size=CHUNK)
 
-    for it, batch in enumerate(batches):
+    for it, chunk in enumerate(batches):
         # keep track of originals for evaluation
         originals = []
         # randomly select 10 tests for prompting
         inputs = []
-        for item in batch:
+        for item in chunk:
             originals.append(item.copy())
             item, _ = item.split(10)
             inputs.append(item)
 
         # do the pipeline
-        gen = Generator(inputs[0])
-        # gen = Generator(*inputs)
-        gen.generate()
+        cassettes = None
+        if cassette_mode:
+            cassettes = CassetteDeck(Path(__file__).parent / "cassettes", cassette_mode)
+        runners = {"pool": WorkerPool, "fork": ForkServer, "shard": ShardedRunner}
+        test_runner = runners[runner]() if runner else None
+        gen = Generator(inputs[0], cassettes=cassettes, runner=test_runner)
+        # gen = Generator(*inputs, cassettes=cassettes)
+        if batched:
+            gen.generate_batched(OpenAIBatchSubmitter())
+        else:
+            gen.generate()
+        gen.save_usage(Path(__file__).parent / "results" / f"usage_{it}.json")
         return
 
         gen.save(Path(__file__).parent / "results")
 
 
 if __name__ == "__main__":
-    main()
+    mode = next((m for m in ["record", "replay"] if f"--{m}" in sys.argv), None)
+    runner = next((r for r in ["pool", "fork", "shard"] if f"--{r}" in sys.argv), None)
+    main(batched="--batch" in sys.argv, cassette_mode=mode, runner=runner)
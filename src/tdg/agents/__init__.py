@@ -1,7 +1,7 @@
 from .base import Agent
 from .nav import NavAgent
 from .test import TestAgent
-from .dev import DevAgent
+from .dev import DevAgent, DraftDevAgent
 
 
-__all__ = ["Agent", "NavAgent", "TestAgent", "DevAgent"]
+__all__ = ["Agent", "NavAgent", "TestAgent", "DevAgent", "DraftDevAgent"]
@@ -3,17 +3,31 @@ import importlib
 import inspect
 import json
 import textwrap
+import time
 from pathlib import Path
-from typing import Optional, Literal, Callable, Any, Union
+from typing import Optional, Literal, Callable, Any, Union, Sequence
 
 import aiofiles
 import openai
-from openai.types.chat import ChatCompletion
 from pydantic import BaseModel, Field
 
-from tdg import parsing
-from tdg.config import Settings
+from tdg import parsing, repair
+from tdg.agents import templates
+from tdg.backends.base import Backend, Completion
+from tdg.backends.openai_backend import OpenAIBackend
+from tdg.budget import Budget
+from tdg.cache import CompletionCache, completion_key, default_completion_cache
+from tdg.cassette import Cassette
+from tdg.clients import ClientRegistry, default_registry
 from tdg.extract import UndefinedFinder
+from tdg.journal import HistoryJournal
+from tdg.limits import (
+    MESSAGE_OVERHEAD_TOKENS,
+    RateLimiter,
+    estimate_prompt_tokens,
+    estimate_tokens,
+)
+from tdg.metrics import CallRecord, UsageSummary
 from tdg.parse_humaneval import HEPSuite
 from tdg.parsing import find_gen_signatures, nl_join
 
@@ -105,6 +119,47 @@ class Message(BaseModel):
         return cls(role="assistant", content=content)
 
 
+def window_messages(messages: list[Message], budget: int) -> list[Message]:
+    """
+    Fit a message chain into a token budget for sending to the LLM.
+
+    The system prompt, the original request and the latest message are always kept. Beyond that,
+    the most recent exchanges that fit are kept whole, starting from an LLM response so that
+    feedback is never separated from the code it refers to; older turns are replaced with a note.
+
+    Args:
+        messages: The full chain: system, original request, then alternating responses and requests.
+        budget: Estimated token budget for the returned chain.
+
+    Returns:
+        list[Message]: The windowed chain (the input chain, if it already fits).
+    """
+
+    def tokens(chain: list[Message]) -> int:
+        return sum(
+            estimate_tokens(message.content) + MESSAGE_OVERHEAD_TOKENS
+            for message in chain
+        )
+
+    if len(messages) <= 3 or tokens(messages) <= budget:
+        return messages
+
+    head, tail = messages[:2], messages[2:]
+    kept = tail[-1:]
+    # tail alternates response, request, ...; so responses are at even indices
+    for start in range(len(tail) - 2, -1, -2):
+        if tokens(head + tail[start:]) > budget:
+            break
+        kept = tail[start:]
+
+    if n_omitted := len(tail) - len(kept):
+        note = Message.system(
+            f"[{n_omitted} earlier messages were omitted to save context.]"
+        )
+        return head + [note] + kept
+    return head + kept
+
+
 class GenerationHistory(BaseModel):
     memory: dict[str, Message] = Field(default_factory=dict)
     """Mapping of user messages to remembered system messages"""
@@ -115,10 +170,21 @@ class GenerationHistory(BaseModel):
     def messages_dict(self) -> list[dict[str, str]]:
         return [item.dict() for item in self.messages]
 
+    def windowed_messages_dict(self, budget: Optional[int]) -> list[dict[str, str]]:
+        """The message chain to send to the LLM, fit to a token budget if one is given."""
+        if budget is None:
+            return self.messages_dict()
+        return [item.dict() for item in window_messages(self.messages, budget)]
+
     def alter_initial(self, content: str):
         self.messages[2].content = content
         self.messages = self.messages[:3]
 
+    def replace_last_response(self, content: str):
+        """Swap the content of the latest LLM response, e.g. for a preferred alternative choice."""
+        if self.messages[-1].role == "assistant":
+            self.messages[-1].content = content
+
 
 class MaxIterExceeded(BaseException):
     pass
@@ -128,13 +194,29 @@ class Agent(abc.ABC):
     """Agent interface for multiagent generation."""
 
     def __init__(
-        self, config: Optional[AgentConfig] = None, pipeline_id: str = "no_id"
+        self,
+        config: Optional[AgentConfig] = None,
+        pipeline_id: str = "no_id",
+        cache: Optional[CompletionCache] = None,
+        clients: Optional[ClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+        context_budget: Optional[int] = None,
+        backend: Optional[Backend] = None,
+        cassette: Optional[Cassette] = None,
+        budget: Optional[Budget] = None,
     ):
-        self.client = openai.AsyncClient(
-            api_key=Settings.from_dotenv().OPENAI_API_KEY.get_secret_value()
-        )
+        self.clients = clients or default_registry()
+        self.backend = backend or OpenAIBackend(self.clients, limiter)
+        """Where completions come from; the OpenAI API unless given a local backend."""
+        self.cassette = cassette
+        """Records every request and its choices, or serves them back in replay mode."""
+        self.budget = budget
+        """Tokens spent by this agent's requests are charged here; none are sent once it's spent."""
+        self.context_budget = context_budget
+        """Estimated token budget for the message chain sent per request; unbounded if None."""
         self.config = config or AgentConfig()
         self.pipeline_id = pipeline_id
+        self.cache = cache if cache is not None else default_completion_cache()
 
         self.history = GenerationHistory.model_validate(
             {
@@ -144,9 +226,24 @@ class Agent(abc.ABC):
             }
         )
 
+        self.choices: list[Message] = []
+        """Every choice the LLM returned for the latest generation."""
+
+        self.calls: list[CallRecord] = []
+        """Latency and usage of every request this agent made."""
+
+        self.batched: dict[str, Completion] = {}
+        """Completions a batch job already made for requests to come, by completion_key."""
+
+        self._journal: Optional[HistoryJournal] = None
+
     def __repr__(self):
         return f"{self.__class__.__name__}({self.pipeline_id})"
 
+    @property
+    def client(self) -> openai.AsyncClient:
+        return self.clients.client()
+
     @abc.abstractmethod
     def system_prompt(self) -> str:
         raise NotImplementedError()
@@ -161,20 +258,34 @@ class Agent(abc.ABC):
 
     @property
     def cache_file(self) -> Path:
-        return Path.home() / ".tdg" / self.pipeline_id / f"{self.cache_key}.json"
+        return Path.home() / ".tdg" / self.pipeline_id / f"{self.cache_key}.jsonl"
+
+    @property
+    def legacy_cache_file(self) -> Path:
+        """Where histories were saved, as a single JSON document, before journaling."""
+        return self.cache_file.with_suffix(".json")
+
+    @property
+    def journal(self) -> HistoryJournal:
+        if self._journal is None or self._journal.path != self.cache_file:
+            self._journal = HistoryJournal(self.cache_file)
+        return self._journal
 
     async def save_state(self):
-        self.cache_file.parent.mkdir(exist_ok=True, parents=True)
-        async with aiofiles.open(self.cache_file, "w") as f:
-            await f.write(self.history.json())
+        """Journal the history's changes since the last save."""
+        await self.journal.append(self.history)
 
     async def load_state(self):
-        if self.cache_file.is_file():
-            async with aiofiles.open(self.cache_file, "r") as f:
+        if content := await self.journal.replay():
+            self.history = GenerationHistory.model_validate(content)
+            print(f"Loaded history from {self.cache_file}")
+        elif self.legacy_cache_file.is_file():
+            async with aiofiles.open(self.legacy_cache_file, "r") as f:
                 content = await f.read()
                 content = json.loads(content)
                 self.history = GenerationHistory.model_validate(content)
-                print(f"Loaded history from {self.cache_file}")
+            await self.journal.compact(self.history)
+            print(f"Loaded history from {self.legacy_cache_file}")
 
     async def _communicate_with_openai(self, message: str) -> Message:
         # error if too many iterations
@@ -185,6 +296,7 @@ class Agent(abc.ABC):
 
         # return from memory if exists!
         response = self.history.memory.get(message)
+        self.choices = [response] if response else []
         if not response:
             # else, generate
 
@@ -193,16 +305,15 @@ class Agent(abc.ABC):
             # store it
             self.history.messages.append(user_message)
 
-            # send the updated message history (user message last!) to LLM
-            result: ChatCompletion = await self.client.chat.completions.create(
-                messages=self.history.messages_dict(),
-                **self.config.non_null(),
+            # send the updated message history (user message last!) to LLM,
+            # unless an identical request has been answered before
+            self.choices = await self._complete(
+                self.history.windowed_messages_dict(self.context_budget)
             )
 
-            # for now, just pick the first option
-            # TODO: search over multiple options
-            choice = result.choices[0]
-            response = Message(role=choice.message.role, content=choice.message.content)
+            # the first choice drives the conversation; subclasses may use the others.
+            # A stream can end before any choice arrives; validation then asks again
+            response = self.choices[0] if self.choices else Message.assistant("")
 
             # add LLM response to message history
             self.history.messages.append(response)
@@ -215,15 +326,115 @@ class Agent(abc.ABC):
 
         return await self.ensure_output_valid(response)
 
+    async def _complete(self, messages: list[dict[str, str]]) -> list[Message]:
+        """Get the LLM's choices for a message chain, consulting the shared completion cache first."""
+        config = self.request_config()
+        record = CallRecord(
+            agent=self.__class__.__name__,
+            pipeline_id=self.pipeline_id,
+            model=config["model"],
+        )
+        self.calls.append(record)
+        start = time.perf_counter()
+
+        if self.cassette and self.cassette.replaying:
+            replayed = self.cassette.play(messages, config)
+            record.replayed = True
+            record.latency = time.perf_counter() - start
+            return [Message.model_validate(choice) for choice in replayed]
+
+        if completion := self.batched.pop(completion_key(messages, config), None):
+            record.batched = True
+        else:
+            if cached := await self.cache.aget_choices(messages, config):
+                record.cache_hit = True
+                record.latency = time.perf_counter() - start
+                self.record_interaction(messages, config, cached)
+                return [Message.model_validate(choice) for choice in cached]
+
+            if self.budget:
+                self.budget.check()
+            completion = await self.backend.complete(
+                messages, config, validate=self.validate_partial
+            )
+        choices = [Message.model_validate(choice) for choice in completion.choices]
+
+        record.latency = time.perf_counter() - start
+        record.retries = completion.attempts - 1
+        record.model = completion.model or record.model
+        if completion.prompt_tokens is not None:
+            record.prompt_tokens = completion.prompt_tokens
+            record.completion_tokens = completion.completion_tokens or 0
+        else:
+            record.estimated = True
+            record.prompt_tokens = estimate_prompt_tokens(messages)
+            record.completion_tokens = sum(estimate_tokens(c.content) for c in choices)
+        # a batch's tokens were charged when its results came back
+        if self.budget and not record.batched:
+            self.budget.charge(record.prompt_tokens + record.completion_tokens)
+
+        # e.g. a hedge answered, so these are another model's choices than the one requested
+        answered = {**config, "model": record.model}
+        # an aborted stream is not the answer to this request, so don't remember it
+        if completion.finished:
+            await self.cache.aset_choices(messages, answered, completion.choices)
+        self.record_interaction(messages, config, completion.choices, record.model)
+        return choices
+
+    def record_interaction(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        choices: list[dict[str, str]],
+        model: Optional[str] = None,
+    ):
+        if self.cassette and not self.cassette.replaying:
+            # keyed by the request, so a replay finds it, but noting whichever model answered
+            self.cassette.record(
+                messages,
+                config,
+                choices,
+                agent=self.__class__.__name__,
+                model=model or config["model"],
+            )
+
+    def request_config(self) -> dict[str, Any]:
+        """The config this agent's requests are sent, and cached, with."""
+        return self.backend.request_config(self.config.non_null())
+
+    def validate_partial(self, content: str) -> bool:
+        """Return False if a partially streamed response is already known to be invalid."""
+        return True
+
     @abc.abstractmethod
     async def ensure_output_valid(self, message: Message):
         """Validate the message, returning if good, recursing back to generate again if not."""
         raise NotImplementedError()
 
+    def usage(self) -> UsageSummary:
+        return UsageSummary.of(self.calls)
+
     @property
     def response_key(self):
         return self.__class__.__name__.lower().replace("agent", "") + "_response"
 
+    def answer_from_batch(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        completion: Completion,
+    ):
+        """Have the request for messages answered with a batch job's completion when it's made."""
+        self.batched[completion_key(messages, config)] = completion
+
+    def pending_messages(self, message: Optional[str] = None) -> list[dict[str, str]]:
+        """The message chain generate(message) would send to the LLM."""
+        message = message or self.user_prompt()
+        chain = self.history.messages + [Message.user(message)]
+        if self.context_budget is not None:
+            chain = window_messages(chain, self.context_budget)
+        return [item.dict() for item in chain]
+
     async def generate(self, message: Optional[str] = None) -> Message:
         """Continue generation with openai."""
 
@@ -237,33 +448,69 @@ class CodeAgent(Agent):
     An Agent Subclass that generates code.
     """
 
-    def __init__(self, *args, **kwargs):
+    def __init__(
+        self,
+        *args,
+        package_allowlist: Sequence[str] = templates.DEFAULT_PACKAGE_ALLOWLIST,
+        full_package_list: bool = False,
+        **kwargs,
+    ):
+        # needed by system_prompt, which Agent.__init__ renders
+        self.package_allowlist = package_allowlist
+        self.full_package_list = full_package_list
+
         super().__init__(*args, **kwargs)
 
         self.imports: list[str] = []
+        self.candidates: list[str] = []
+        """Distinct valid code generations from the latest request; the validated response is first."""
+
+    def code_generator_prompt(self, *context: str) -> str:
+        """Code output instructions, offering the packages relevant to the given context."""
+        return templates.code_generator(
+            *context, allowlist=self.package_allowlist, full=self.full_package_list
+        )
 
     async def ensure_output_valid(self, message: Message):
         return await self.ensure_valid_code(message)
 
+    def validate_partial(self, content: str) -> bool:
+        return parsing.streamed_code_is_valid(content)
+
     async def ensure_valid_code(self, choice: Message) -> Message:
-        try:
-            choice.content = parsing.clean_openai_code_or_error(choice.content)
-        except SyntaxError:
+        # fix what we can here, asking the LLM to try again only if that isn't enough
+        repaired = repair.repair_code(choice.content)
+        if repaired.code is None:
             return await self.generate(
                 "Your generation contained invalid python syntax. Please try again.",
             )
 
-        good_imports, bad_imports = parsing.extract_and_filter_imports(choice.content)
-        if bad_imports:
+        if repaired.bad_imports:
             return await self.generate(
                 nl_join(
                     "Your generation imported libraries or modules that are not",
                     "available on our system:",
-                    nl_join(*bad_imports),
+                    nl_join(*repaired.bad_imports),
                     "Please alter or remove the affected code.",
                 )
             )
 
-        self.imports = good_imports
+        if repaired.fixes:
+            print(f"{self}: repaired output locally ({', '.join(repaired.fixes)})")
+            if self.calls:
+                self.calls[-1].local_repairs += 1
+
+        choice.content = parsing.format_code(repaired.code)
+        self.imports, _ = parsing.extract_and_filter_imports(choice.content)
+        self.candidates = self.valid_alternatives(choice.content)
 
         return choice
+
+    def valid_alternatives(self, validated: str) -> list[str]:
+        """The validated code plus any other usable choices, deduplicated by AST."""
+        codes = [validated]
+        for alternative in self.choices[1:]:
+            repaired = repair.repair_code(alternative.content)
+            if repaired.code is not None and not repaired.bad_imports:
+                codes.append(parsing.format_code(repaired.code))
+        return parsing.dedupe_code(*codes)
@@ -1,27 +1,48 @@
+from typing import Optional
+
 from tdg.agents import templates
 from tdg.agents.base import CodeAgent, CodeContext, Message
 from tdg.parsing import nl_join
 
 
 class DevAgent(CodeAgent):
-    def __init__(self, test_response: Message, code_context: CodeContext) -> None:
+    def __init__(
+        self,
+        test_response: Message,
+        code_context: CodeContext,
+        nav_response: Optional[Message] = None,
+        **kwargs,
+    ) -> None:
         self.code_context = code_context
         self.test_suite = nl_join("```python", test_response.content, "```")
+        self.nav_response = nav_response
 
-        super().__init__()
+        super().__init__(**kwargs)
 
     def system_prompt(self) -> str:
+        reasoning = []
+        if self.nav_response:
+            reasoning.append(
+                nl_join(
+                    "The reasoning provided by the Navigator role is the following:",
+                    self.nav_response.content,
+                )
+            )
+
         return templates.SystemTemplate(
             role="Developer",
             description="Developers implement python code that satisfies the test constraints provided by the Test Designer role agent.",
             extra_context=[
                 templates.PERFORMANCE_CRITICAL,
                 templates.AVOID_PITFALLS,
+                *reasoning,
                 nl_join(
                     "The test suite your code must pass is as follows:",
                     self.test_suite,
                 ),
-                templates.CODE_GENERATOR,
+                self.code_generator_prompt(
+                    *self.code_context.signatures, self.test_suite
+                ),
             ],
         ).render()
 
@@ -39,3 +60,22 @@ class DevAgent(CodeAgent):
                 "As such, you do not need to reimplement any of the provided tests.",
             ),
         ).render()
+
+
+class DraftDevAgent(DevAgent):
+    """
+    A Developer working from the user's tests and the Navigator's reasoning alone.
+
+    Its draft can be written while the Test Designer is still writing, then checked against the
+    full suite once it arrives.
+    """
+
+    def __init__(
+        self, nav_response: Message, code_context: CodeContext, **kwargs
+    ) -> None:
+        super().__init__(
+            test_response=Message.assistant(nl_join(*code_context.test_sources)),
+            code_context=code_context,
+            nav_response=nav_response,
+            **kwargs,
+        )
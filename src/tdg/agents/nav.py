@@ -4,9 +4,9 @@ from tdg.parsing import nl_join
 
 
 class NavAgent(Agent):
-    def __init__(self, code_context: CodeContext):
+    def __init__(self, code_context: CodeContext, **kwargs):
         self.code_context = code_context
-        super().__init__()
+        super().__init__(**kwargs)
 
     def system_prompt(self) -> str:
         return templates.SystemTemplate(
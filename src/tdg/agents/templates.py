@@ -1,5 +1,10 @@
 import abc
+import functools
 import importlib
+import importlib.metadata
+import re
+import sys
+from typing import Sequence
 
 from pydantic import BaseModel, Field
 
@@ -14,6 +19,39 @@ def list_installed_packages():
     return package_list
 
 
+DEFAULT_PACKAGE_ALLOWLIST: tuple[str, ...] = ("pytest",)
+"""Third party packages always offered to code generating agents."""
+
+_identifier_pattern = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+
+@functools.lru_cache(None)
+def installed_import_names() -> frozenset[str]:
+    """Top level import names provided by installed (non-stdlib) distributions."""
+    return frozenset(
+        name
+        for name in importlib.metadata.packages_distributions()
+        if not name.startswith("_") and name not in sys.stdlib_module_names
+    )
+
+
+def relevant_packages(
+    *context: str, allowlist: Sequence[str] = DEFAULT_PACKAGE_ALLOWLIST
+) -> list[str]:
+    """
+    The allowlisted packages, plus any installed package whose import name appears in the context.
+
+    Args:
+        *context: Text the generated code must work with, e.g. tests and signatures.
+        allowlist: Packages to offer regardless of the context.
+
+    Returns:
+        list[str]: Sorted import names.
+    """
+    mentioned = set(_identifier_pattern.findall(nl_join(*context)))
+    return sorted(set(allowlist) | (mentioned & installed_import_names()))
+
+
 PERFORMANCE_CRITICAL = """
 Please also note that you are running in a performance-critical environment; your generated responses should be:
     * short
@@ -28,13 +66,36 @@ You should avoid:
     * meta-commentary on the problem
 """
 
-CODE_GENERATOR = f"""
+
+def code_generator(
+    *context: str,
+    allowlist: Sequence[str] = DEFAULT_PACKAGE_ALLOWLIST,
+    full: bool = False,
+) -> str:
+    """
+    Instructions for agents whose output is code, including which libraries they may import.
+
+    Rather than every installed distribution, only the standard library and the relevant_packages
+    for the context are offered, which keeps the prompt short.
+
+    Args:
+        *context: Text the generated code must work with, e.g. tests and signatures.
+        allowlist: Packages to offer regardless of the context.
+        full: Offer every installed distribution instead.
+    """
+    packages = (
+        list_installed_packages()
+        if full
+        else ", ".join(relevant_packages(*context, allowlist=allowlist))
+    )
+    return f"""
 IMPORTANT: Your output will be passed directly to a python interpreter.
 As such, you should *only* output code; any commentary you provide should
 be in the form of # python comments or docstrings.
 
-If you need to import a library, you should only import packages that are already installed on this system; those are:
-{list_installed_packages()}
+If you need to import a library, you should only import from the python standard library,
+or from the following packages, which are already installed on this system:
+{packages}
 
 Do NOT use any libraries not listed above, even if doing so would lead to a more-optimal solution.
 If you do, your response will be rejected.
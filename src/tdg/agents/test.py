@@ -8,13 +8,13 @@ from tdg.parsing import nl_join
 
 
 class TestAgent(CodeAgent):
-    def __init__(self, nav_response: Message, code_context: CodeContext):
+    def __init__(self, nav_response: Message, code_context: CodeContext, **kwargs):
         self.code_context = code_context
         self.nav_response = nav_response
 
         self.tests: list[str] = []
 
-        super().__init__()
+        super().__init__(**kwargs)
 
     def system_prompt(self) -> str:
         prompt = templates.SystemTemplate(
@@ -35,7 +35,9 @@ class TestAgent(CodeAgent):
                     "Navigator Reasoning:",
                     self.nav_response.content,
                 ),
-                templates.CODE_GENERATOR,
+                self.code_generator_prompt(
+                    *self.code_context.signatures, *self.code_context.test_sources
+                ),
             ],
         ).render()
 
@@ -0,0 +1,203 @@
+"""
+A single content-addressed store for what pipelines produce: test scripts, reports and histories.
+"""
+
+import functools
+import hashlib
+import sqlite3
+import time
+import zlib
+from pathlib import Path
+from typing import Optional
+
+from pydantic import BaseModel
+
+from tdg.cache import SqliteStore, default_cache_dir
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+class Artifact(BaseModel):
+    """Where one piece of pipeline output is stored."""
+
+    pipeline_id: str
+    kind: str
+    """e.g. script, report or history."""
+    name: str
+    """Unique per pipeline and kind, e.g. iter_0_1a2b3c4d."""
+    digest: str
+    """sha256 of the content, which addresses its blob."""
+    size: int
+    """Uncompressed bytes."""
+    created: float
+
+
+class ArtifactStore(SqliteStore):
+    """
+    Pipeline artifacts in one SQLite file, instead of a file per artifact under ~/.tdg.
+
+    Contents are zlib-compressed blobs keyed by their sha256, so identical scripts produced by
+    different iterations or pipelines are stored once. Once the compressed blobs exceed `max_bytes`,
+    the least recently used are evicted along with the artifacts that refer to them.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = DEFAULT_MAX_BYTES):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+
+        self.evictions = 0
+
+    def _create_tables(self, conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS blobs ("
+            "digest TEXT PRIMARY KEY, data BLOB NOT NULL, "
+            "stored_size INTEGER NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS blobs_last_used ON blobs (last_used)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS artifacts ("
+            "pipeline_id TEXT NOT NULL, kind TEXT NOT NULL, name TEXT NOT NULL, "
+            "digest TEXT NOT NULL, size INTEGER NOT NULL, created REAL NOT NULL, "
+            "PRIMARY KEY (pipeline_id, kind, name))"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS artifacts_digest ON artifacts (digest)"
+        )
+
+    def put(self, pipeline_id: str, kind: str, name: str, content: str) -> Artifact:
+        """Store content as a pipeline's artifact, replacing any artifact of the same name."""
+        data = content.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self._lock:
+            updated = self.conn.execute(
+                "UPDATE blobs SET last_used = ? WHERE digest = ?", (now, digest)
+            ).rowcount
+            if not updated:
+                compressed = zlib.compress(data)
+                self.conn.execute(
+                    "INSERT INTO blobs (digest, data, stored_size, last_used) VALUES (?, ?, ?, ?)",
+                    (digest, compressed, len(compressed), now),
+                )
+            self.conn.execute(
+                "INSERT OR REPLACE INTO artifacts "
+                "(pipeline_id, kind, name, digest, size, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (pipeline_id, kind, name, digest, len(data), now),
+            )
+            self._evict()
+            self.conn.commit()
+        return Artifact(
+            pipeline_id=pipeline_id,
+            kind=kind,
+            name=name,
+            digest=digest,
+            size=len(data),
+            created=now,
+        )
+
+    async def aput(
+        self, pipeline_id: str, kind: str, name: str, content: str
+    ) -> Artifact:
+        return await self.off_loop(self.put, pipeline_id, kind, name, content)
+
+    def content(self, digest: str) -> Optional[str]:
+        """The content with a digest, or None if it was never stored or has been evicted."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT data FROM blobs WHERE digest = ?", (digest,)
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute(
+                "UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), digest)
+            )
+            self.conn.commit()
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def get(self, pipeline_id: str, kind: str, name: str) -> Optional[str]:
+        """The content of a pipeline's artifact, or None if there is none."""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT digest FROM artifacts WHERE pipeline_id = ? AND kind = ? AND name = ?",
+                (pipeline_id, kind, name),
+            ).fetchone()
+        return self.content(row[0]) if row else None
+
+    async def aget(self, pipeline_id: str, kind: str, name: str) -> Optional[str]:
+        return await self.off_loop(self.get, pipeline_id, kind, name)
+
+    def artifacts(self, pipeline_id: str, kind: Optional[str] = None) -> list[Artifact]:
+        """A pipeline's artifacts (optionally of one kind), oldest first."""
+        query = "SELECT pipeline_id, kind, name, digest, size, created FROM artifacts WHERE pipeline_id = ?"
+        params: tuple = (pipeline_id,)
+        if kind is not None:
+            query += " AND kind = ?"
+            params += (kind,)
+        with self._lock:
+            rows = self.conn.execute(
+                query + " ORDER BY created, name", params
+            ).fetchall()
+        fields = Artifact.model_fields.keys()
+        return [Artifact(**dict(zip(fields, row))) for row in rows]
+
+    def pipelines(self) -> list[str]:
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT DISTINCT pipeline_id FROM artifacts ORDER BY pipeline_id"
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def stored_bytes(self) -> int:
+        """Compressed bytes held, which max_bytes bounds."""
+        with self._lock:
+            return self._stored_bytes()
+
+    def _stored_bytes(self) -> int:
+        (total,) = self.conn.execute("SELECT SUM(stored_size) FROM blobs").fetchone()
+        return total or 0
+
+    def _evict(self):
+        excess = self._stored_bytes() - self.max_bytes
+        if excess <= 0:
+            return
+        evicted = []
+        for digest, stored_size in self.conn.execute(
+            "SELECT digest, stored_size FROM blobs ORDER BY last_used ASC"
+        ):
+            if excess <= 0:
+                break
+            evicted.append((digest,))
+            excess -= stored_size
+        self.conn.executemany("DELETE FROM blobs WHERE digest = ?", evicted)
+        self.conn.executemany("DELETE FROM artifacts WHERE digest = ?", evicted)
+        self.evictions += len(evicted)
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            (blobs,) = self.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+            (artifacts,) = self.conn.execute(
+                "SELECT COUNT(*) FROM artifacts"
+            ).fetchone()
+            return {
+                "artifacts": artifacts,
+                "blobs": blobs,
+                "stored_bytes": self._stored_bytes(),
+                "evictions": self.evictions,
+            }
+
+    def delete_pipeline(self, pipeline_id: str):
+        """Forget a pipeline's artifacts, and any content no other artifact refers to."""
+        with self._lock:
+            self.conn.execute(
+                "DELETE FROM artifacts WHERE pipeline_id = ?", (pipeline_id,)
+            )
+            self.conn.execute(
+                "DELETE FROM blobs WHERE digest NOT IN (SELECT digest FROM artifacts)"
+            )
+            self.conn.commit()
+
+
+@functools.lru_cache(None)
+def default_artifact_store() -> ArtifactStore:
+    """The process-wide artifact store, persisted under ~/.tdg."""
+    return ArtifactStore(default_cache_dir() / "artifacts.sqlite")
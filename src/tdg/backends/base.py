@@ -0,0 +1,56 @@
+import abc
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+PartialValidator = Callable[[str], bool]
+"""Returns False once a partially generated response is known to be invalid."""
+
+
+class Completion(BaseModel):
+    """The choices a backend generated for one chat request."""
+
+    choices: list[dict[str, str]]
+    """{role, content} per choice."""
+    finished: bool = True
+    """False if generation was cut short, e.g. a stream aborted by validation."""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    """Token counts, if the backend reports them."""
+    attempts: int = 1
+    model: Optional[str] = None
+    """The model that answered, if not the one requested."""
+
+
+class Backend(abc.ABC):
+    """Generates chat completions for agents."""
+
+    def request_config(self, config: dict[str, Any]) -> dict[str, Any]:
+        """
+        The config a request is actually served with, which also addresses it in the completion cache.
+
+        Backends that ignore or override fields of AgentConfig (e.g. the model) should say so here,
+        so their completions don't collide with another backend's.
+        """
+        return config
+
+    @abc.abstractmethod
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        """
+        Generate the choices for a message chain.
+
+        Args:
+            messages: The message chain, user message last.
+            config: The request_config(...) of the requesting agent.
+            validate: Called with the text of a choice as lines complete, if the backend generates
+                incrementally; generation may stop once it has rejected every choice.
+
+        Returns:
+            Completion: The choices, and the tokens they used.
+        """
+        raise NotImplementedError()
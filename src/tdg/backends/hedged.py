@@ -0,0 +1,145 @@
+"""
+Hedged requests: when a completion is slower than usual, race a duplicate against it.
+"""
+
+import asyncio
+import math
+import time
+from collections import defaultdict, deque
+from typing import Any, Optional
+
+from tdg.backends.base import Backend, Completion, PartialValidator
+
+
+def percentile(values: list[float], q: float) -> float:
+    """The q-th (0 < q < 1) percentile of values, by the nearest-rank method."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, math.ceil(q * len(ordered)) - 1)]
+
+
+class HedgedBackend(Backend):
+    """
+    Wraps a backend, sending a duplicate of any request still running at a latency percentile.
+
+    Whichever copy first returns a usable completion wins and the other is cancelled, cutting the
+    tail latency that stalls a pipeline at the cost of a few extra requests. A completion is usable
+    if it finished and, when the agent validates output, at least one choice passes validation.
+
+    Args:
+        backend: Where both copies are sent.
+        percentile: Hedge once a request has run longer than this fraction of recent requests.
+        hedge_model: Send the duplicate to this model instead, e.g. a faster one.
+        min_samples: Requests to observe (per model) before trusting the percentile.
+        initial_delay: Seconds to wait before hedging until then.
+        window: Recent latencies kept per model.
+    """
+
+    def __init__(
+        self,
+        backend: Backend,
+        *,
+        percentile: float = 0.9,
+        hedge_model: Optional[str] = None,
+        min_samples: int = 10,
+        initial_delay: float = 30.0,
+        window: int = 200,
+    ):
+        self.backend = backend
+        self.percentile = percentile
+        self.hedge_model = hedge_model
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+
+        self.latencies: dict[str, deque[float]] = defaultdict(
+            lambda: deque(maxlen=window)
+        )
+        """Seconds taken by recent requests, by model; for cancelled ones, how long they'd run."""
+        self.hedges = 0
+        """Duplicates sent."""
+        self.hedge_wins = 0
+        """Duplicates that answered first."""
+
+    def request_config(self, config: dict[str, Any]) -> dict[str, Any]:
+        return self.backend.request_config(config)
+
+    def hedge_delay(self, model: str) -> float:
+        latencies = self.latencies[model]
+        if len(latencies) < self.min_samples:
+            return self.initial_delay
+        return percentile(list(latencies), self.percentile)
+
+    @staticmethod
+    def usable(completion: Completion, validate: Optional[PartialValidator]) -> bool:
+        if not completion.finished:
+            return False
+        if validate is None:
+            return True
+        return any(validate(choice["content"]) for choice in completion.choices)
+
+    async def _timed(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator],
+    ) -> Completion:
+        start = time.monotonic()
+        try:
+            completion = await self.backend.complete(messages, config, validate)
+        except asyncio.CancelledError:
+            # a lower bound on its latency; leaving the losers out would make the window too fast
+            self.latencies[config["model"]].append(time.monotonic() - start)
+            raise
+        self.latencies[config["model"]].append(time.monotonic() - start)
+        return completion
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        primary = asyncio.create_task(self._timed(messages, config, validate))
+        racing = {primary}
+        try:
+            done, _ = await asyncio.wait(
+                racing, timeout=self.hedge_delay(config["model"])
+            )
+            if done:
+                # not slow, so whatever the outcome, hedging wouldn't have helped
+                return primary.result()
+
+            hedge_config = config
+            if self.hedge_model:
+                hedge_config = {**config, "model": self.hedge_model}
+            hedge = asyncio.create_task(self._timed(messages, hedge_config, validate))
+            racing.add(hedge)
+            self.hedges += 1
+            print(f"Request slower than p{self.percentile * 100:.0f}; hedging")
+
+            fallback: Optional[Completion] = None
+            error: Optional[BaseException] = None
+            while racing:
+                done, racing = await asyncio.wait(
+                    racing, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception():
+                        error = task.exception()
+                        continue
+                    completion = task.result()
+                    if self.usable(completion, validate):
+                        if task is hedge:
+                            self.hedge_wins += 1
+                            if self.hedge_model:
+                                completion.model = self.hedge_model
+                        return completion
+                    fallback = fallback or completion
+        finally:
+            for task in racing:
+                task.cancel()
+            await asyncio.gather(*racing, return_exceptions=True)
+
+        # neither copy gave a usable answer; let the agent handle the first that answered at all
+        if fallback:
+            return fallback
+        raise error
@@ -0,0 +1,255 @@
+"""
+Local chat completions from Hugging Face transformers models.
+
+Prompts from every concurrent agent are queued and generated together as padded batches, so a
+Generator running many pipelines keeps the model busy instead of decoding one prompt at a time.
+torch and transformers are only imported once a model is loaded.
+
+This is micro-batching, an adaptation of continuous batching: prompts are admitted per batch, not
+per decoding step, so one arriving while a batch generates waits for the next. Step-level
+admission would mean managing the KV cache by hand, outside transformers' generate().
+"""
+
+import abc
+import asyncio
+import threading
+from typing import Any, Optional
+
+from pydantic import BaseModel
+
+from tdg.backends.base import Backend, Completion, PartialValidator
+
+GENERATION_FIELDS = ("max_tokens", "n", "temperature", "top_p", "seed")
+"""AgentConfig fields that change how a batch is decoded; only requests agreeing on them share one."""
+
+DEFAULT_MAX_NEW_TOKENS = 512
+
+
+class Generated(BaseModel):
+    """The decoded choices for one prompt of a batch."""
+
+    texts: list[str]
+    prompt_tokens: int
+    completion_tokens: int
+
+
+class _Pending:
+    def __init__(self, prompt: str, params: tuple, future: asyncio.Future):
+        self.prompt = prompt
+        self.params = params
+        self.future = future
+
+
+class BatchingBackend(Backend):
+    """
+    Collects pending prompts across agents and generates them in batches.
+
+    After the first prompt arrives, the batch stays open for `batch_window` seconds (or until
+    `max_batch_size` prompts are waiting) so that other agents' prompts can join it. Batches run
+    one at a time, in a worker thread, keeping the event loop free to collect the next one; a
+    prompt never joins a batch that is already generating.
+
+    Args:
+        max_batch_size: The most prompts generated together.
+        batch_window: Seconds to wait for more prompts before generating a partial batch.
+    """
+
+    def __init__(self, *, max_batch_size: int = 8, batch_window: float = 0.05):
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+
+        self._pending: list[_Pending] = []
+        self._worker: Optional[asyncio.Task] = None
+
+        self.batch_sizes: list[int] = []
+        """Size of every batch generated, for tuning the window and size."""
+
+    @abc.abstractmethod
+    def render(self, messages: list[dict[str, str]]) -> str:
+        """Turn a message chain into the model's prompt text; blocking, called from a thread."""
+        raise NotImplementedError()
+
+    @abc.abstractmethod
+    def generate_batch(
+        self, prompts: list[str], params: dict[str, Any]
+    ) -> list[Generated]:
+        """Generate for every prompt at once; blocking, called from a worker thread."""
+        raise NotImplementedError()
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        params = tuple((k, config.get(k)) for k in GENERATION_FIELDS)
+        # rendering may first load a tokenizer, which mustn't block the loop
+        prompt = await asyncio.to_thread(self.render, messages)
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append(_Pending(prompt, params, future))
+
+        # one worker per loop drains the queue; start it if the last one finished
+        if self._worker is None or self._worker.done():
+            self._worker = asyncio.create_task(self._drain())
+
+        generated: Generated = await future
+        return Completion(
+            choices=[
+                {"role": "assistant", "content": text} for text in generated.texts
+            ],
+            prompt_tokens=generated.prompt_tokens,
+            completion_tokens=generated.completion_tokens,
+        )
+
+    async def _drain(self):
+        while self._pending:
+            if len(self._pending) < self.max_batch_size:
+                await asyncio.sleep(self.batch_window)
+
+            # take the oldest request's peers, up to a full batch
+            params = self._pending[0].params
+            batch = [p for p in self._pending if p.params == params][
+                : self.max_batch_size
+            ]
+            self._pending = [p for p in self._pending if p not in batch]
+            # an agent may have been cancelled while it waited
+            batch = [p for p in batch if not p.future.done()]
+            if not batch:
+                continue
+
+            self.batch_sizes.append(len(batch))
+            try:
+                results = await asyncio.to_thread(
+                    self.generate_batch, [p.prompt for p in batch], dict(params)
+                )
+            except Exception as e:
+                for pending in batch:
+                    if not pending.future.done():
+                        pending.future.set_exception(e)
+                continue
+
+            for pending, result in zip(batch, results):
+                if not pending.future.done():
+                    pending.future.set_result(result)
+
+
+class HuggingFaceBackend(BatchingBackend):
+    """
+    Generates with a local causal LM, e.g. HuggingFaceBackend("Qwen/Qwen2.5-0.5B-Instruct").
+
+    Prompts are rendered with the tokenizer's chat template when it has one, and left-padded so
+    every prompt in a batch ends where generation starts. Runs on CPU unless given a device.
+
+    Args:
+        model_name: A hub id or local path, loaded with AutoModelForCausalLM on first use.
+        device: A torch device, e.g. "cuda"; defaults to "cpu".
+        max_new_tokens: Completion length when AgentConfig.max_tokens is unset.
+        **kwargs: Passed to BatchingBackend.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        *,
+        device: str = "cpu",
+        max_new_tokens: int = DEFAULT_MAX_NEW_TOKENS,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        self.model_name = model_name
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+
+        self._model = None
+        self._tokenizer = None
+        # prompts are rendered in worker threads, which mustn't load the tokenizer twice
+        self._loading = threading.Lock()
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.model_name})"
+
+    def request_config(self, config: dict[str, Any]) -> dict[str, Any]:
+        # completions come from the local model, whatever AgentConfig.model says
+        return {**config, "model": f"hf:{self.model_name}", "stream": False}
+
+    @property
+    def tokenizer(self):
+        with self._loading:
+            if self._tokenizer is None:
+                from transformers import AutoTokenizer
+
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+                tokenizer.padding_side = "left"
+                if tokenizer.pad_token is None:
+                    tokenizer.pad_token = tokenizer.eos_token
+                self._tokenizer = tokenizer
+        return self._tokenizer
+
+    @property
+    def model(self):
+        with self._loading:
+            if self._model is None:
+                from transformers import AutoModelForCausalLM
+
+                model = AutoModelForCausalLM.from_pretrained(self.model_name)
+                self._model = model.to(self.device).eval()
+        return self._model
+
+    def render(self, messages: list[dict[str, str]]) -> str:
+        if self.tokenizer.chat_template:
+            return self.tokenizer.apply_chat_template(
+                messages, tokenize=False, add_generation_prompt=True
+            )
+        # base models: a plain transcript, ending where the assistant speaks
+        transcript = "".join(f"{m['role']}: {m['content']}\n" for m in messages)
+        return transcript + "assistant: "
+
+    def generate_batch(
+        self, prompts: list[str], params: dict[str, Any]
+    ) -> list[Generated]:
+        import torch
+
+        n = params.get("n") or 1
+        temperature = params.get("temperature")
+        # the API defaults to sampling at temperature 1; only an explicit 0 is greedy
+        do_sample = temperature is None or temperature > 0
+        sampling = {}
+        if do_sample:
+            sampling["temperature"] = temperature or 1.0
+            if (top_p := params.get("top_p")) is not None:
+                sampling["top_p"] = top_p
+        if (seed := params.get("seed")) is not None:
+            torch.manual_seed(seed)
+
+        inputs = self.tokenizer(
+            prompts,
+            return_tensors="pt",
+            padding=True,
+            add_special_tokens=False,
+        ).to(self.device)
+        with torch.no_grad():
+            output = self.model.generate(
+                **inputs,
+                max_new_tokens=params.get("max_tokens") or self.max_new_tokens,
+                do_sample=do_sample,
+                num_return_sequences=n,
+                pad_token_id=self.tokenizer.pad_token_id,
+                **sampling,
+            )
+
+        # sequences are grouped n per prompt, all starting after the padded prompt length
+        new_tokens = output[:, inputs["input_ids"].shape[1] :]
+        texts = self.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+        prompt_lengths = inputs["attention_mask"].sum(dim=1).tolist()
+        completion_lengths = (
+            (new_tokens != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        )
+
+        return [
+            Generated(
+                texts=texts[i * n : (i + 1) * n],
+                prompt_tokens=prompt_lengths[i],
+                completion_tokens=sum(completion_lengths[i * n : (i + 1) * n]),
+            )
+            for i in range(len(prompts))
+        ]
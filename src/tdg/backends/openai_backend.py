@@ -0,0 +1,115 @@
+from collections import defaultdict
+from typing import Any, Optional
+
+import openai
+from openai import AsyncStream
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+from tdg.backends.base import Backend, Completion, PartialValidator
+from tdg.clients import ClientRegistry, default_registry
+from tdg.limits import RateLimiter, default_limiter, estimate_request_tokens
+
+
+class OpenAIBackend(Backend):
+    """Chat completions from the OpenAI API, within the shared rate limits."""
+
+    def __init__(
+        self,
+        clients: Optional[ClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+    ):
+        self.clients = clients or default_registry()
+        self.limiter = limiter
+
+    @property
+    def client(self) -> openai.AsyncClient:
+        return self.clients.client()
+
+    @property
+    def rate_limiter(self) -> RateLimiter:
+        if self.limiter is None:
+            self.limiter = default_limiter()
+        return self.limiter
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        attempts = 0
+
+        async def request() -> Completion:
+            nonlocal attempts
+            attempts += 1
+            raw = await self.client.chat.completions.with_raw_response.create(
+                messages=messages,
+                **config,
+            )
+            self.rate_limiter.update_from_headers(raw.headers)
+            if config.get("stream"):
+                return await self._consume_stream(
+                    raw.parse(), validate, n=config.get("n") or 1
+                )
+
+            result: ChatCompletion = raw.parse()
+            return Completion(
+                choices=[
+                    {"role": choice.message.role, "content": choice.message.content}
+                    for choice in result.choices
+                ],
+                prompt_tokens=result.usage.prompt_tokens if result.usage else None,
+                completion_tokens=(
+                    result.usage.completion_tokens if result.usage else None
+                ),
+            )
+
+        completion = await self.rate_limiter.call(
+            request, tokens=estimate_request_tokens(messages, config)
+        )
+        completion.attempts = attempts
+        return completion
+
+    @staticmethod
+    async def _consume_stream(
+        stream: AsyncStream[ChatCompletionChunk],
+        validate: Optional[PartialValidator],
+        n: int,
+    ) -> Completion:
+        """
+        Accumulate streamed deltas per choice, validating each choice as lines complete.
+
+        The stream is closed early, leaving the completion unfinished, once every one of the n
+        choices has been rejected.
+        """
+        contents: dict[int, str] = defaultdict(str)
+        roles: dict[int, str] = {}
+        rejected: set[int] = set()
+        finished = True
+
+        async for chunk in stream:
+            for choice in chunk.choices:
+                if choice.delta.role:
+                    roles[choice.index] = choice.delta.role
+                if not (delta := choice.delta.content):
+                    continue
+                contents[choice.index] += delta
+                if validate and "\n" in delta and not validate(contents[choice.index]):
+                    rejected.add(choice.index)
+
+            if len(rejected) >= n:
+                print("Streamed output is invalid, aborting stream")
+                await stream.close()
+                finished = False
+                break
+
+        # nothing to remember for a stream that yielded no choices
+        finished = finished and bool(contents)
+
+        return Completion(
+            choices=[
+                {"role": roles.get(idx, "assistant"), "content": contents[idx]}
+                for idx in sorted(contents)
+            ],
+            finished=finished,
+        )
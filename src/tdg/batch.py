@@ -0,0 +1,201 @@
+"""
+Offline batch submission of agent requests, in the OpenAI Batch API JSONL format.
+
+A Generator writes one stage's first requests for every pipeline to a job file, a
+BatchSubmitter turns that into a results file, and each result is handed to the agent that made
+the request so each pipeline advances through the stage without a live call.
+"""
+
+import abc
+import asyncio
+from pathlib import Path
+from typing import Any, Callable, Optional
+
+from pydantic import BaseModel
+
+from tdg.backends.base import Completion
+from tdg.clients import ClientRegistry, default_registry
+from tdg.limits import estimate_prompt_tokens, estimate_tokens
+
+CHAT_COMPLETIONS_URL = "/v1/chat/completions"
+
+
+class BatchRequest(BaseModel):
+    custom_id: str
+    method: str = "POST"
+    url: str = CHAT_COMPLETIONS_URL
+    body: dict[str, Any]
+
+
+class BatchResponse(BaseModel):
+    status_code: int
+    body: dict[str, Any]
+
+
+class BatchResult(BaseModel):
+    custom_id: str
+    response: Optional[BatchResponse] = None
+    error: Optional[dict[str, Any]] = None
+
+    def choices(self) -> Optional[list[dict[str, str]]]:
+        """The {role, content} choices of a successful result, else None."""
+        if self.error or not self.response or self.response.status_code != 200:
+            return None
+        return [
+            {
+                "role": choice["message"]["role"],
+                "content": choice["message"]["content"],
+            }
+            for choice in self.response.body["choices"]
+        ]
+
+    def completion(self) -> Optional[Completion]:
+        """The choices of a successful result and the tokens they used, else None."""
+        if (choices := self.choices()) is None:
+            return None
+        usage = self.response.body.get("usage") or {}
+        return Completion(
+            choices=choices,
+            prompt_tokens=usage.get("prompt_tokens"),
+            completion_tokens=usage.get("completion_tokens"),
+        )
+
+    def tokens(self) -> int:
+        """Prompt plus completion tokens the request used, per its usage (0 if unreported)."""
+        usage = (self.response.body.get("usage") if self.response else None) or {}
+        return usage.get("total_tokens") or (
+            usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+        )
+
+
+def write_batch_job(requests: list[BatchRequest], path: Path) -> Path:
+    path.parent.mkdir(exist_ok=True, parents=True)
+    path.write_text("".join(request.model_dump_json() + "\n" for request in requests))
+    return path
+
+
+def read_batch_requests(path: Path) -> list[BatchRequest]:
+    return [
+        BatchRequest.model_validate_json(line)
+        for line in path.read_text().splitlines()
+        if line.strip()
+    ]
+
+
+def read_batch_results(path: Path) -> dict[str, BatchResult]:
+    results = [
+        BatchResult.model_validate_json(line)
+        for line in path.read_text().splitlines()
+        if line.strip()
+    ]
+    return {result.custom_id: result for result in results}
+
+
+class BatchSubmitter(abc.ABC):
+    """Processes a batch job file, returning the path of its results file."""
+
+    @abc.abstractmethod
+    async def submit(self, job: Path) -> Path:
+        raise NotImplementedError()
+
+    @staticmethod
+    def output_path(job: Path) -> Path:
+        return job.with_name(f"{job.stem}_output.jsonl")
+
+
+class LocalBatchSubmitter(BatchSubmitter):
+    """
+    A file-based stand-in for a batch service, answering each request with a local callable.
+
+    Usage is estimated from the text, as a real service would report it.
+
+    Args:
+        respond: Maps a request body (model, messages, ...) to the assistant's reply.
+    """
+
+    def __init__(self, respond: Callable[[dict[str, Any]], str]):
+        self.respond = respond
+
+    async def submit(self, job: Path) -> Path:
+        results = []
+        for request in read_batch_requests(job):
+            content = self.respond(request.body)
+            prompt_tokens = estimate_prompt_tokens(request.body["messages"])
+            completion_tokens = estimate_tokens(content)
+            completion = {
+                "object": "chat.completion",
+                "model": request.body.get("model"),
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {"role": "assistant", "content": content},
+                    }
+                ],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": completion_tokens,
+                    "total_tokens": prompt_tokens + completion_tokens,
+                },
+            }
+            results.append(
+                BatchResult(
+                    custom_id=request.custom_id,
+                    response=BatchResponse(status_code=200, body=completion),
+                )
+            )
+
+        output = self.output_path(job)
+        output.write_text(
+            "".join(result.model_dump_json() + "\n" for result in results)
+        )
+        return output
+
+
+class OpenAIBatchSubmitter(BatchSubmitter):
+    """Submits jobs to the OpenAI Batch API and polls until they finish."""
+
+    TERMINAL = {"completed", "failed", "expired", "cancelled"}
+
+    def __init__(
+        self,
+        clients: Optional[ClientRegistry] = None,
+        *,
+        poll_interval: float = 60.0,
+        completion_window: str = "24h",
+    ):
+        self.clients = clients or default_registry()
+        self.poll_interval = poll_interval
+        self.completion_window = completion_window
+
+    async def submit(self, job: Path) -> Path:
+        client = self.clients.client()
+        with open(job, "rb") as f:
+            uploaded = await client.files.create(file=f, purpose="batch")
+
+        batch = await client.batches.create(
+            input_file_id=uploaded.id,
+            endpoint=CHAT_COMPLETIONS_URL,
+            completion_window=self.completion_window,
+        )
+        print(f"Submitted batch {batch.id} for {job}")
+
+        try:
+            while batch.status not in self.TERMINAL:
+                await asyncio.sleep(self.poll_interval)
+                batch = await client.batches.retrieve(batch.id)
+        except asyncio.CancelledError:
+            # e.g. the run's deadline passed; don't leave the batch spending tokens
+            await client.batches.cancel(batch.id)
+            raise
+
+        output = self.output_path(job)
+        lines = []
+        for file_id in [batch.output_file_id, batch.error_file_id]:
+            if file_id:
+                content = await client.files.content(file_id)
+                lines.append(content.text)
+        output.write_text("".join(lines))
+
+        print(f"Batch {batch.id} {batch.status}: {batch.request_counts}")
+        return output
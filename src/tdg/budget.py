@@ -0,0 +1,85 @@
+"""
+Wall-clock and token budgets for pipelines and whole runs.
+"""
+
+import time
+from typing import Optional
+
+
+class BudgetExceeded(BaseException):
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class Budget:
+    """
+    A deadline and a token allowance, either optional; a child budget also spends its parent's.
+
+    The clock starts at start(), e.g. when a pipeline starts generating, not at construction.
+
+    Args:
+        seconds: Wall-clock time allowed from start().
+        tokens: Prompt plus completion tokens allowed (cache hits and replays are free).
+        parent: e.g. the run's budget, for a pipeline's.
+        name: What the budget is for, in stop reasons.
+    """
+
+    def __init__(
+        self,
+        seconds: Optional[float] = None,
+        tokens: Optional[int] = None,
+        parent: Optional["Budget"] = None,
+        name: str = "budget",
+    ):
+        self.name = name
+        self.seconds = seconds
+        self.tokens = tokens
+        self.parent = parent
+
+        self.deadline: Optional[float] = None
+        self.used_tokens = 0
+
+    def __repr__(self):
+        return f"Budget({self.name}, seconds={self.seconds}, tokens={self.tokens})"
+
+    def start(self):
+        """Start the clock (and the parent's), unless it is already running."""
+        if self.parent:
+            self.parent.start()
+        if self.deadline is None and self.seconds is not None:
+            self.deadline = time.monotonic() + self.seconds
+
+    def remaining_time(self) -> Optional[float]:
+        """Seconds left before this or a parent deadline, or None if there is none."""
+        remaining = [
+            budget.deadline - time.monotonic()
+            for budget in self.lineage()
+            if budget.deadline is not None
+        ]
+        return max(0.0, min(remaining)) if remaining else None
+
+    def charge(self, tokens: int):
+        for budget in self.lineage():
+            budget.used_tokens += tokens
+
+    def exhausted(self) -> Optional[str]:
+        """Why this budget (or a parent) is spent, or None if it isn't."""
+        for budget in self.lineage():
+            if budget.deadline is not None and time.monotonic() >= budget.deadline:
+                return f"{budget.name} deadline of {budget.seconds}s passed"
+            if budget.tokens is not None and budget.used_tokens >= budget.tokens:
+                return f"{budget.name} budget of {budget.tokens} tokens spent"
+        return None
+
+    def check(self):
+        """Raise BudgetExceeded if there is nothing left to spend."""
+        if reason := self.exhausted():
+            raise BudgetExceeded(reason)
+
+    def lineage(self) -> list["Budget"]:
+        budgets, budget = [], self
+        while budget:
+            budgets.append(budget)
+            budget = budget.parent
+        return budgets
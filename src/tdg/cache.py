@@ -0,0 +1,310 @@
+"""
+Persistent, content-addressed caches shared across agents, pipelines and runs.
+"""
+
+import abc
+import asyncio
+import functools
+import hashlib
+import importlib.metadata
+import json
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Optional, TypeVar
+
+T = TypeVar("T")
+
+DEFAULT_MAX_ENTRIES = 10_000
+
+# config fields that change how a completion is delivered, but not its content
+_TRANSPORT_FIELDS = {"stream"}
+
+
+def default_cache_dir() -> Path:
+    """~/.tdg, looked up when a default store is first used rather than at import."""
+    return Path.home() / ".tdg"
+
+
+def hash_payload(payload: Any) -> str:
+    """Stable sha256 of any json-serializable payload."""
+    encoded = json.dumps(payload, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def completion_key(messages: list[dict[str, str]], config: dict[str, Any]) -> str:
+    """
+    Content address of a chat completion request.
+
+    Args:
+        messages: The full message chain sent to the LLM.
+        config: The non-null AgentConfig fields (including the model).
+
+    Returns:
+        str: A hex digest identifying the request.
+    """
+    config = {k: v for k, v in config.items() if k not in _TRANSPORT_FIELDS}
+    return hash_payload({"config": config, "messages": messages})
+
+
+@functools.lru_cache(None)
+def environment_fingerprint() -> str:
+    """The interpreter and installed distributions, which tests' outcomes may depend on."""
+    distributions = sorted(
+        f"{dist.metadata['Name']}=={dist.version}"
+        for dist in importlib.metadata.distributions()
+    )
+    return hash_payload(
+        {
+            "python": sys.version,
+            "executable": sys.executable,
+            "distributions": distributions,
+        }
+    )
+
+
+def report_key(normalized_script: str, options: dict[str, Any]) -> str:
+    """
+    Content address of a test run.
+
+    Args:
+        normalized_script: The test script's AST dump, so formatting and comments don't matter.
+        options: Whatever else decides the outcome, e.g. the limits and which tests were run.
+
+    Returns:
+        str: A hex digest identifying the run in this environment.
+    """
+    return hash_payload(
+        {
+            "script": normalized_script,
+            "options": options,
+            "environment": environment_fingerprint(),
+        }
+    )
+
+
+class SqliteStore(abc.ABC):
+    """
+    A store backed by a single SQLite file, whose connection is opened lazily, so constructing
+    one is free.
+
+    sqlite blocks, for up to its 30s busy timeout if another process holds the file, so async
+    code goes through off_loop(...), which calls the store's methods on its own thread.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.path})"
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(exist_ok=True, parents=True)
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._create_tables(self._conn)
+            self._conn.commit()
+        return self._conn
+
+    @abc.abstractmethod
+    def _create_tables(self, conn: sqlite3.Connection):
+        """Create the store's tables and indexes, if they don't exist yet."""
+
+    def _flush(self):
+        """Write whatever is held back, before the connection closes."""
+
+    async def off_loop(self, fn: Callable[..., T], *args) -> T:
+        """Call a blocking method on this store's thread, so the event loop carries on meanwhile."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(1, thread_name_prefix=repr(self))
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, functools.partial(fn, *args)
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        with self._lock:
+            if self._conn is not None:
+                self._flush()
+                self._conn.commit()
+                self._conn.close()
+                self._conn = None
+
+
+class SqliteCache(SqliteStore):
+    """
+    A size-bounded key -> json value store backed by a single SQLite file.
+
+    Entries are evicted least-recently-used first once `max_entries` is exceeded. Hits only note
+    when an entry was used; that is written with the next set(), or every TOUCH_BATCH hits.
+    """
+
+    TOUCH_BATCH = 100
+
+    def __init__(self, path: Path, max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__(path)
+        self.max_entries = max_entries
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._touched: dict[str, float] = {}
+        """When entries were last used, not yet written."""
+
+    def _create_tables(self, conn: sqlite3.Connection):
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)"
+        )
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT value FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._write_touched()
+                self.conn.commit()
+            return json.loads(row[0])
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO entries (key, value, last_used) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            # eviction goes by last_used, so it must be up to date
+            self._write_touched()
+            self._evict()
+            self.conn.commit()
+
+    async def aget(self, key: str) -> Optional[Any]:
+        return await self.off_loop(self.get, key)
+
+    async def aset(self, key: str, value: Any):
+        await self.off_loop(self.set, key, value)
+
+    def _flush(self):
+        self._write_touched()
+
+    def _write_touched(self):
+        if self._touched:
+            self.conn.executemany(
+                "UPDATE entries SET last_used = ? WHERE key = ?",
+                [(used, key) for key, used in self._touched.items()],
+            )
+            self._touched.clear()
+
+    def _evict(self):
+        (count,) = self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if (excess := count - self.max_entries) > 0:
+            self.conn.execute(
+                "DELETE FROM entries WHERE key IN "
+                "(SELECT key FROM entries ORDER BY last_used ASC LIMIT ?)",
+                (excess,),
+            )
+            self.evictions += excess
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self),
+        }
+
+    def clear(self):
+        with self._lock:
+            self.conn.execute("DELETE FROM entries")
+            self.conn.commit()
+
+
+class CompletionCache(SqliteCache):
+    """Maps completion_key(...) to the list of choices ({role, content}) the LLM returned."""
+
+    def get_choices(
+        self, messages: list[dict[str, str]], config: dict[str, Any]
+    ) -> Optional[list[dict[str, str]]]:
+        return self.get(completion_key(messages, config))
+
+    def set_choices(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        choices: list[dict[str, str]],
+    ):
+        self.set(completion_key(messages, config), choices)
+
+    async def aget_choices(
+        self, messages: list[dict[str, str]], config: dict[str, Any]
+    ) -> Optional[list[dict[str, str]]]:
+        return await self.aget(completion_key(messages, config))
+
+    async def aset_choices(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        choices: list[dict[str, str]],
+    ):
+        await self.aset(completion_key(messages, config), choices)
+
+
+class ReportCache(SqliteCache):
+    """Maps report_key(...) to a test run's {exitcode, complete, tests: [TestReport fields]}."""
+
+    def get_report(
+        self, normalized_script: str, options: dict[str, Any]
+    ) -> Optional[dict[str, Any]]:
+        return self.get(report_key(normalized_script, options))
+
+    def set_report(
+        self, normalized_script: str, options: dict[str, Any], report: dict[str, Any]
+    ):
+        self.set(report_key(normalized_script, options), report)
+
+    async def aget_report(
+        self, normalized_script: str, options: dict[str, Any]
+    ) -> Optional[dict[str, Any]]:
+        return await self.aget(report_key(normalized_script, options))
+
+    async def aset_report(
+        self, normalized_script: str, options: dict[str, Any], report: dict[str, Any]
+    ):
+        await self.aset(report_key(normalized_script, options), report)
+
+
+@functools.lru_cache(None)
+def default_completion_cache() -> CompletionCache:
+    """The process-wide completion cache, persisted under ~/.tdg."""
+    return CompletionCache(default_cache_dir() / "completions.sqlite")
+
+
+@functools.lru_cache(None)
+def default_report_cache() -> ReportCache:
+    """The process-wide test report cache, persisted under ~/.tdg."""
+    return ReportCache(default_cache_dir() / "reports.sqlite")
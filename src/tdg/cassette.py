@@ -0,0 +1,99 @@
+"""
+Record/replay of LLM interactions, so whole runs can be repeated without the network.
+
+In record mode every request an agent makes, and the choices it got back, are appended to a
+cassette: a JSONL file per pipeline, keyed by the request's content address. In replay mode those
+choices are served back instead, and a request that was never recorded is an error.
+"""
+
+import json
+import re
+from pathlib import Path
+from typing import Literal, Optional
+
+from tdg.cache import completion_key
+
+CassetteMode = Literal["record", "replay"]
+
+
+class CassetteMiss(BaseException):
+    pass
+
+
+class Cassette:
+    def __init__(self, path: Path, mode: CassetteMode):
+        self.path = path
+        self.mode = mode
+        self._entries: Optional[dict[str, list[dict[str, str]]]] = None
+
+    def __repr__(self):
+        return f"Cassette({self.path}, {self.mode})"
+
+    @property
+    def replaying(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def entries(self) -> dict[str, list[dict[str, str]]]:
+        if self._entries is None:
+            self._entries = {}
+            if self.path.is_file():
+                for line in self.path.read_text().splitlines():
+                    if line.strip():
+                        entry = json.loads(line)
+                        self._entries[entry["key"]] = entry["choices"]
+        return self._entries
+
+    def play(
+        self, messages: list[dict[str, str]], config: dict
+    ) -> list[dict[str, str]]:
+        """The recorded choices for a request, raising CassetteMiss if there are none."""
+        key = completion_key(messages, config)
+        if (choices := self.entries.get(key)) is None:
+            raise CassetteMiss(
+                f"{self} has no recording of request {key}, whose last message was:\n"
+                f"{messages[-1]['content']}"
+            )
+        return choices
+
+    def record(
+        self,
+        messages: list[dict[str, str]],
+        config: dict,
+        choices: list[dict[str, str]],
+        agent: str = "",
+        model: str = "",
+    ):
+        key = completion_key(messages, config)
+        if key in self.entries:
+            return
+        self.entries[key] = choices
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        entry = {"key": key, "agent": agent, "model": model, "choices": choices}
+        with open(self.path, "a") as f:
+            # the agent and model are only there for a human reading the cassette
+            f.write(json.dumps(entry) + "\n")
+
+
+class CassetteDeck:
+    """
+    The cassettes of a run, one per pipeline, in a single directory.
+
+    e.g. record a benchmark once, then rerun it offline:
+
+        Generator(*suites, cassettes=CassetteDeck(path, "record")).generate()
+        Generator(*suites, cassettes=CassetteDeck(path, "replay")).generate()
+    """
+
+    def __init__(self, directory: Path, mode: CassetteMode):
+        self.directory = directory
+        self.mode = mode
+        self._cassettes: dict[str, Cassette] = {}
+
+    def for_pipeline(self, pipeline_id: str) -> Cassette:
+        if pipeline_id not in self._cassettes:
+            name = re.sub(r"[^\w.-]", "_", pipeline_id)
+            self._cassettes[pipeline_id] = Cassette(
+                self.directory / f"{name}.jsonl", self.mode
+            )
+        return self._cassettes[pipeline_id]
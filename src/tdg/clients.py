@@ -0,0 +1,95 @@
+"""
+A registry of pooled LLM clients, shared by every agent in a process.
+"""
+
+import asyncio
+import functools
+from typing import Optional
+
+import httpx
+import openai
+
+from tdg.config import Settings
+
+
+class ClientRegistry:
+    """
+    Hands out a single openai.AsyncClient per event loop, backed by one pooled HTTP connection pool.
+
+    Connection pools are bound to the loop they were first used on, so a client is built lazily
+    for each running loop (e.g. each Generator.generate call) and reused by every agent on it.
+
+    The SDK's own retries are off; the RateLimiter retries 429s and transient failures instead.
+    """
+
+    def __init__(
+        self,
+        settings: Optional[Settings] = None,
+        *,
+        max_connections: Optional[int] = None,
+        max_keepalive_connections: Optional[int] = None,
+        keepalive_expiry: Optional[float] = None,
+    ):
+        self._settings = settings
+        self._max_connections = max_connections
+        self._max_keepalive_connections = max_keepalive_connections
+        self._keepalive_expiry = keepalive_expiry
+
+        self._clients: dict[Optional[asyncio.AbstractEventLoop], openai.AsyncClient]
+        self._clients = {}
+
+    @property
+    def settings(self) -> Settings:
+        if self._settings is None:
+            self._settings = Settings.shared()
+        return self._settings
+
+    @property
+    def limits(self) -> httpx.Limits:
+        def override(value, setting):
+            # 0 is a setting too, e.g. to turn keep-alive off
+            return value if value is not None else setting
+
+        return httpx.Limits(
+            max_connections=override(
+                self._max_connections, self.settings.OPENAI_MAX_CONNECTIONS
+            ),
+            max_keepalive_connections=override(
+                self._max_keepalive_connections,
+                self.settings.OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+            ),
+            keepalive_expiry=override(
+                self._keepalive_expiry, self.settings.OPENAI_KEEPALIVE_EXPIRY
+            ),
+        )
+
+    def client(self) -> openai.AsyncClient:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            loop = None
+
+        # drop clients whose loop has gone away with asyncio.run
+        for stale in [lp for lp in self._clients if lp is not None and lp.is_closed()]:
+            self._clients.pop(stale)
+
+        if loop not in self._clients:
+            self._clients[loop] = openai.AsyncClient(
+                api_key=self.settings.OPENAI_API_KEY.get_secret_value(),
+                max_retries=0,
+                http_client=httpx.AsyncClient(
+                    limits=self.limits, timeout=openai.DEFAULT_TIMEOUT
+                ),
+            )
+        return self._clients[loop]
+
+    async def aclose(self):
+        """Close the client bound to the running loop, if any."""
+        if client := self._clients.pop(asyncio.get_running_loop(), None):
+            await client.close()
+
+
+@functools.lru_cache(None)
+def default_registry() -> ClientRegistry:
+    """The process-wide client registry, configured from the environment."""
+    return ClientRegistry()
@@ -1,3 +1,4 @@
+import functools
 import os
 
 from dotenv import load_dotenv
@@ -8,7 +9,24 @@ class Settings(BaseModel):
     OPENAI_API_KEY: SecretStr
     LLM_MODEL: str = "gpt-4-turbo-preview"
 
+    OPENAI_MAX_CONNECTIONS: int = 100
+    """Upper bound on concurrent HTTP connections shared by all agents."""
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    """Idle connections kept open for reuse, avoiding repeated TLS handshakes."""
+    OPENAI_KEEPALIVE_EXPIRY: float = 30.0
+    """Seconds an idle connection is kept alive."""
+
+    OPENAI_REQUESTS_PER_MINUTE: int = 500
+    OPENAI_TOKENS_PER_MINUTE: int = 300_000
+    """Client-side budgets; corrected from the API's rate limit headers at runtime."""
+
     @classmethod
     def from_dotenv(cls):
         load_dotenv()
         return cls.model_validate(os.environ)
+
+    @classmethod
+    @functools.lru_cache(None)
+    def shared(cls):
+        """Settings loaded from the environment once per process."""
+        return cls.from_dotenv()
@@ -1,7 +1,51 @@
-import ast
 import copy
+import functools
+import types
+from typing import Any, Mapping
 
-from tdg.parsing import is_valid_python
+
+@functools.lru_cache(maxsize=4096)
+def compile_code(code: str) -> types.CodeType:
+    """Compile a snippet once; the same source run again reuses its code object."""
+    return compile(code, "<string>", "exec")
+
+
+def isolated(value: Any) -> Any:
+    """A deep copy of value; modules, which can't be copied, are shared."""
+    if isinstance(value, types.ModuleType):
+        return value
+    return copy.deepcopy(value)
+
+
+def freeze(**env) -> Mapping[str, Any]:
+    """A read-only, deep-copied environment for many Executor.over(...) runs to share."""
+    return types.MappingProxyType(
+        {name: isolated(value) for name, value in env.items()}
+    )
+
+
+class Namespace(dict):
+    """
+    exec globals layered over a base environment, copy-on-write by name.
+
+    A name is deep-copied out of the base when the code first uses it, so only what the code
+    touches is copied, and nothing it does reaches the base.
+    """
+
+    def __init__(self, base: Mapping[str, Any]):
+        super().__init__()
+        self.base = base
+
+    def __missing__(self, key: str):
+        value = isolated(self.base[key])
+        self[key] = value
+        return value
+
+    def __contains__(self, key) -> bool:
+        return super().__contains__(key) or key in self.base
+
+    def get(self, key: str, default=None):
+        return self[key] if key in self else default
 
 
 class Executor:
@@ -9,14 +53,19 @@ class Executor:
         # decouple passed in env from external world
         self.env = copy.deepcopy(env)
 
+    @classmethod
+    def over(cls, base: Mapping[str, Any]) -> "Executor":
+        """
+        An Executor whose env is layered over `base`, e.g. from freeze(...), rather than a deep copy
+        of it; for screening many snippets in the same environment.
+        """
+        executor = cls.__new__(cls)
+        executor.env = Namespace(base)
+        return executor
+
     def run(self, code: str):
-        match is_valid_python(code):
-            case True, ast.AST():  # as node (can capture):
-                exec(code, self.env)
-            case False, SyntaxError() as e:
-                raise e
-            case _:
-                raise NotImplementedError()
+        # raises SyntaxError for invalid code
+        exec(compile_code(code), self.env)
 
     def __getattr__(self, item: str):
         return self.env.get(item)
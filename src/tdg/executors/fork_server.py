@@ -0,0 +1,293 @@
+"""
+A fork server for test runs: one process imports pytest once, then forks a child per script.
+
+The server is started by ForkServer as `python -m tdg.executors.fork_server [module ...]`.
+Requests are lines on its stdin: {"id": n, "path": <script>, "limits": <Limits>, "tests": [...],
+"maxfail": ...} to run a script, or {"kill": n} to kill that run. Each child applies the limits, then runs its
+script in-process with PytestReportPlugin and sends {"id": n, "report": ...} records, then
+{"id": n, "done": {...}}, which the server relays to its stdout. A child that exits without
+finishing is reported as {"id": n, "exited": <exit code>}.
+"""
+
+import asyncio
+import gc
+import itertools
+import json
+import os
+import selectors
+import signal
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+from typing import Any, Optional, Sequence
+
+from _pytest.config import ExitCode
+
+from tdg.executors.resources import Limits
+from tdg.executors.test import (
+    Report,
+    Runner,
+    TestReport,
+    crash_report,
+    script_timeout_report,
+)
+from tdg.executors.worker import (
+    PRELOAD,
+    import_modules,
+    run_script,
+    start_process,
+    take_stdout,
+)
+
+
+class _Child:
+    def __init__(self, run_id: int, pid: int, fd: int):
+        self.run_id = run_id
+        self.pid = pid
+        self.fd = fd
+        self.buffer = b""
+        self.done = False
+
+
+def warm_up():
+    """Run a trivial script once, so pytest's lazy imports happen before forking, not after."""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "test_warm_up.py"
+        path.write_text("def test_warm_up():\n    assert True\n")
+        run_script(path, emit=lambda record: None)
+
+
+def serve():
+    protocol, devnull = take_stdout()
+    import_modules(sys.argv[1:])
+    warm_up()
+    # keep the warm heap out of the children's collections, and their pages shared
+    gc.freeze()
+
+    selector = selectors.DefaultSelector()
+    stdin = sys.stdin.fileno()
+    selector.register(stdin, selectors.EVENT_READ)
+    children: dict[int, _Child] = {}
+    requests = b""
+    accepting = True
+
+    def relay(line: bytes):
+        os.write(protocol, line + b"\n")
+
+    def fork(
+        run_id: int,
+        path: str,
+        limits: Limits,
+        tests: Optional[list[str]],
+        maxfail: Optional[int],
+    ):
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            # the child: run the script and report back on its own pipe, then exit whatever
+            # happens, rather than unwinding into the server's loop
+            status = 1
+            try:
+                os.close(read_fd)
+                os.dup2(devnull, stdin)
+                for fd in [protocol, *children]:
+                    os.close(fd)
+                results = os.fdopen(write_fd, "w")
+
+                def emit(record: dict[str, Any]):
+                    results.write(json.dumps({"id": run_id, **record}) + "\n")
+                    results.flush()
+
+                limits.apply()
+                exit_code = run_script(Path(path), emit, limits, tests, maxfail)
+                emit({"done": {"exitcode": exit_code}})
+                status = 0
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        children[read_fd] = _Child(run_id, pid, read_fd)
+        selector.register(read_fd, selectors.EVENT_READ)
+
+    def reap(child: _Child):
+        selector.unregister(child.fd)
+        os.close(child.fd)
+        del children[child.fd]
+        _, status = os.waitpid(child.pid, 0)
+        if not child.done:
+            code = os.waitstatus_to_exitcode(status)
+            relay(json.dumps({"id": child.run_id, "exited": code}).encode())
+
+    while accepting or children:
+        for key, _ in selector.select():
+            if key.fd == stdin:
+                data = os.read(stdin, 65536)
+                if not data:
+                    accepting = False
+                    selector.unregister(stdin)
+                    continue
+                *lines, requests = (requests + data).split(b"\n")
+                for line in lines:
+                    request = json.loads(line)
+                    if "kill" in request:
+                        for child in children.values():
+                            if child.run_id == request["kill"]:
+                                os.kill(child.pid, signal.SIGKILL)
+                    else:
+                        limits = Limits.model_validate(request["limits"])
+                        fork(
+                            request["id"],
+                            request["path"],
+                            limits,
+                            request["tests"],
+                            request["maxfail"],
+                        )
+            else:
+                child = children[key.fd]
+                data = os.read(child.fd, 65536)
+                if not data:
+                    reap(child)
+                    continue
+                *lines, child.buffer = (child.buffer + data).split(b"\n")
+                for line in lines:
+                    # parsed, as a test's output could contain the word
+                    child.done = child.done or "done" in json.loads(line)
+                    relay(line)
+
+
+class ForkServer(Runner):
+    """
+    Runs each script in a child forked from a server that has already imported pytest and `preload`.
+
+    Forking the warm server takes milliseconds, so unlike WorkerPool every script still gets a
+    fresh process, with its own rlimits; at most `max_concurrency` children run at once. The server
+    is started on first use and belongs to that event loop, so close() it before the loop ends.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: Optional[int] = None,
+        preload: Sequence[str] = PRELOAD,
+        limits: Optional[Limits] = None,
+    ):
+        super().__init__(limits)
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.preload = preload
+
+        self.forks = 0
+
+        self._process: Optional[asyncio.subprocess.Process] = None
+        self._reader: Optional[asyncio.Task] = None
+        self._pending: dict[int, tuple[Path, list[TestReport], asyncio.Future]] = {}
+        self._ids = itertools.count()
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._starting: Optional[asyncio.Lock] = None
+
+    def __repr__(self):
+        return f"ForkServer(max_concurrency={self.max_concurrency})"
+
+    async def start(self) -> asyncio.subprocess.Process:
+        if self._starting is None:
+            self._starting = asyncio.Lock()
+        async with self._starting:
+            if self._process is None or self._process.returncode is not None:
+                self._process = await start_process(
+                    "tdg.executors.fork_server", self.preload
+                )
+                self._reader = asyncio.create_task(self._read(self._process))
+        return self._process
+
+    async def _read(self, process: asyncio.subprocess.Process):
+        while line := await process.stdout.readline():
+            record = json.loads(line)
+            if (pending := self._pending.get(record["id"])) is None:
+                continue  # e.g. a run that was killed
+            path, reports, result = pending
+            if "report" in record:
+                reports.append(TestReport.model_validate(record["report"]))
+            elif "done" in record:
+                del self._pending[record["id"]]
+                result.set_result(Report(reports, exit_code=record["done"]["exitcode"]))
+            else:
+                del self._pending[record["id"]]
+                crash = crash_report(path, record["exited"])
+                result.set_result(
+                    Report(reports + [crash], exit_code=ExitCode.INTERNAL_ERROR)
+                )
+
+        # the server itself died; fail whatever it was running
+        code = await process.wait()
+        pending, self._pending = self._pending, {}
+        for path, reports, result in pending.values():
+            crash = crash_report(path, code)
+            result.set_result(
+                Report(reports + [crash], exit_code=ExitCode.INTERNAL_ERROR)
+            )
+
+    async def request(self, process: asyncio.subprocess.Process, **request):
+        process.stdin.write((json.dumps(request) + "\n").encode())
+        await process.stdin.drain()
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        async with self._slots:
+            process = await self.start()
+            run_id = next(self._ids)
+            result = asyncio.get_running_loop().create_future()
+            reports: list[TestReport] = []
+            self._pending[run_id] = (test_file_path, reports, result)
+            self.forks += 1
+            await self.request(
+                process,
+                id=run_id,
+                path=str(test_file_path),
+                limits=self.limits.model_dump(),
+                tests=tests,
+                maxfail=maxfail,
+            )
+            try:
+                async with asyncio.timeout(self.limits.script_timeout):
+                    return await result
+            except TimeoutError:
+                await self.kill(process, run_id)
+                timeout = script_timeout_report(
+                    test_file_path, self.limits.script_timeout
+                )
+                return Report(reports + [timeout], exit_code=ExitCode.INTERRUPTED)
+            except asyncio.CancelledError:
+                await self.kill(process, run_id)
+                raise
+
+    async def kill(self, process: asyncio.subprocess.Process, run_id: int):
+        self._pending.pop(run_id, None)
+        if process.returncode is None:
+            await self.request(process, kill=run_id)
+
+    async def close(self):
+        process, self._process = self._process, None
+        if process and process.returncode is None:
+            process.stdin.close()
+            try:
+                async with asyncio.timeout(5):
+                    await process.wait()
+            except TimeoutError:
+                process.kill()
+                await process.wait()
+        if self._reader:
+            await self._reader
+            self._reader = None
+        self._slots = None
+        self._starting = None
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,184 @@
+"""
+A pool of long-lived pytest worker processes, so test runs skip interpreter and pytest startup.
+"""
+
+import asyncio
+import json
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+from _pytest.config import ExitCode
+
+from tdg.executors.resources import Limits
+from tdg.executors.test import (
+    Report,
+    Runner,
+    TestReport,
+    crash_report,
+    script_timeout_report,
+)
+from tdg.executors.worker import PRELOAD, start_process
+
+
+class Worker:
+    """One `python -m tdg.executors.worker` process."""
+
+    def __init__(self, process: asyncio.subprocess.Process):
+        self.process = process
+        self.runs = 0
+        self.baseline_rss: Optional[int] = None
+        """Peak RSS (KiB) after the first run, which later growth is measured against."""
+        self.rss: int = 0
+
+    @classmethod
+    async def start(cls, preload: Sequence[str]) -> "Worker":
+        return cls(await start_process("tdg.executors.worker", preload))
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]],
+        maxfail: Optional[int],
+        limits: Limits,
+        reports: list[TestReport],
+    ) -> Report:
+        """
+        Run a script, collecting its tests' reports as they arrive.
+
+        A worker that dies mid-run reports the script as crashed.
+        """
+        request = {
+            "path": str(test_file_path),
+            "limits": limits.model_dump(),
+            "tests": tests,
+            "maxfail": maxfail,
+        }
+        self.process.stdin.write((json.dumps(request) + "\n").encode())
+        await self.process.stdin.drain()
+
+        while line := await self.process.stdout.readline():
+            record = json.loads(line)
+            if "report" in record:
+                reports.append(TestReport.model_validate(record["report"]))
+            else:
+                self.runs += 1
+                self.rss = record["done"]["maxrss"]
+                if self.baseline_rss is None:
+                    self.baseline_rss = self.rss
+                return Report(reports, exit_code=record["done"]["exitcode"])
+
+        code = await self.process.wait()
+        crash = crash_report(test_file_path, code)
+        return Report(reports + [crash], exit_code=ExitCode.INTERNAL_ERROR)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.returncode is None
+
+    async def kill(self):
+        if self.alive:
+            self.process.kill()
+        await self.process.wait()
+
+    async def stop(self):
+        if self.alive:
+            self.process.stdin.close()
+            try:
+                async with asyncio.timeout(5):
+                    await self.process.wait()
+            except TimeoutError:
+                self.process.kill()
+                await self.process.wait()
+
+
+class WorkerPool(Runner):
+    """
+    Runs scripts on up to `size` long-lived workers that have already imported pytest and `preload`.
+
+    Each script is imported in a clean module namespace, but library imports stay warm. Workers are
+    started on demand and replaced after `max_runs` scripts, or once their peak memory has grown by
+    `max_rss_growth` KiB since their first run; a worker that crashes is simply replaced.
+
+    Each run's CPU-time rlimit counts from its start; the memory and file-size rlimits apply to the
+    worker as a whole. A worker whose script runs past its time limit is killed and replaced.
+
+    Workers belong to the event loop they were started in, so close() the pool before it ends.
+    """
+
+    def __init__(
+        self,
+        size: Optional[int] = None,
+        max_runs: int = 100,
+        max_rss_growth: int = 512 * 1024,
+        preload: Sequence[str] = PRELOAD,
+        limits: Optional[Limits] = None,
+    ):
+        super().__init__(limits)
+        self.size = size or os.cpu_count() or 1
+        self.max_runs = max_runs
+        self.max_rss_growth = max_rss_growth
+        self.preload = preload
+
+        self.started = 0
+        self.recycled = 0
+
+        self._idle: list[Worker] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    def __repr__(self):
+        return f"WorkerPool(size={self.size})"
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.size)
+        return self._slots
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        async with self.slots:
+            worker = self._idle.pop() if self._idle else await self.spawn()
+            reports: list[TestReport] = []
+            try:
+                async with asyncio.timeout(self.limits.script_timeout):
+                    report = await worker.run(
+                        test_file_path, tests, maxfail, self.limits, reports
+                    )
+            except TimeoutError:
+                await worker.kill()
+                timeout = script_timeout_report(
+                    test_file_path, self.limits.script_timeout
+                )
+                return Report(reports + [timeout], exit_code=ExitCode.INTERRUPTED)
+            except BaseException:
+                # e.g. cancelled mid-run, leaving the worker in an unknown state
+                await worker.kill()
+                raise
+
+            if self.worn_out(worker):
+                self.recycled += 1
+                await worker.stop()
+            else:
+                self._idle.append(worker)
+            return report
+
+    async def spawn(self) -> Worker:
+        self.started += 1
+        return await Worker.start(self.preload)
+
+    def worn_out(self, worker: Worker) -> bool:
+        return (
+            not worker.alive
+            or worker.runs >= self.max_runs
+            or worker.rss - worker.baseline_rss > self.max_rss_growth
+        )
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        await asyncio.gather(*[worker.stop() for worker in idle])
+        self._slots = None
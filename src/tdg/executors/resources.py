@@ -0,0 +1,155 @@
+"""
+Time and resource limits for running generated code.
+
+Also a pytest plugin, `-p tdg.executors.resources --test-timeout=<seconds>`, enforcing per-test
+timeouts in a pytest subprocess.
+"""
+
+import math
+import resource
+import signal
+import threading
+from typing import Optional
+
+import pytest
+from pydantic import BaseModel
+
+TIMEOUT_OUTCOME = "timeout"
+"""TestReport.outcome of a test, or script, stopped for running too long."""
+
+
+class TestTimeout(BaseException):
+    """
+    Raised in a test that runs past its time limit.
+
+    A BaseException, so generated code's `except Exception` can't swallow it.
+    """
+
+    __test__ = False
+
+
+class Limits(BaseModel):
+    """
+    Limits for a test script's process; None means unlimited.
+
+    The time limits are enforced by the test process and the runner; the rest are rlimits, so
+    exceeding them fails a test (MemoryError, or OSError for files) or kills its process
+    (SIGXCPU), rather than the host.
+    """
+
+    test_timeout: Optional[float] = 10.0
+    """Wall-clock seconds per test; a test that takes longer fails with a timeout outcome."""
+    script_timeout: Optional[float] = 300.0
+    """Wall-clock seconds for the whole script, after which its process is killed."""
+    cpu_seconds: Optional[int] = 300
+    """RLIMIT_CPU for the script, counted from when it starts."""
+    memory_bytes: Optional[int] = 4 * 1024**3
+    """RLIMIT_AS: address space of the test process."""
+    file_bytes: Optional[int] = 256 * 1024**2
+    """RLIMIT_FSIZE: largest file the tests may write."""
+
+    @classmethod
+    def none(cls) -> "Limits":
+        return cls(
+            test_timeout=None,
+            script_timeout=None,
+            cpu_seconds=None,
+            memory_bytes=None,
+            file_bytes=None,
+        )
+
+    def apply(self):
+        """
+        Set the rlimits on this process, e.g. in a fresh fork or a pytest subprocess's plugin.
+
+        Not a subprocess preexec_fn: that isn't safe once the parent has threads.
+        """
+        if self.cpu_seconds is not None:
+            usage = resource.getrusage(resource.RUSAGE_SELF)
+            used = math.ceil(usage.ru_utime + usage.ru_stime)
+            set_soft_limit(resource.RLIMIT_CPU, used + self.cpu_seconds)
+        if self.memory_bytes is not None:
+            set_soft_limit(resource.RLIMIT_AS, self.memory_bytes)
+        if self.file_bytes is not None:
+            set_soft_limit(resource.RLIMIT_FSIZE, self.file_bytes)
+
+    def pytest_plugins(self) -> list["TimeoutPlugin"]:
+        """Plugins enforcing these limits within pytest.main(...)."""
+        return [TimeoutPlugin(self.test_timeout)] if self.test_timeout else []
+
+    def rlimits(self) -> "Limits":
+        """Just the rlimits of these limits."""
+        return self.model_copy(update={"test_timeout": None, "script_timeout": None})
+
+    def pytest_args(self) -> list[str]:
+        """Arguments enforcing these limits in a `python -m pytest` subprocess."""
+        args = []
+        if self.test_timeout:
+            args.append(f"--test-timeout={self.test_timeout}")
+        if self.rlimits() != Limits.none():
+            args.append(f"--rlimits={self.rlimits().model_dump_json()}")
+        return ["-p", "tdg.executors.resources", *args] if args else []
+
+
+def set_soft_limit(limit: int, value: int):
+    """Lower (or raise) a soft rlimit, never past its hard limit."""
+    _, hard = resource.getrlimit(limit)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+class TimeoutPlugin:
+    """Fails tests that run longer than `timeout` seconds, by raising TestTimeout via SIGALRM."""
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+
+    def _expire(self, signum, frame):
+        raise TestTimeout(
+            f"The test took longer than its time limit of {self.timeout}s, "
+            f"e.g. because of an infinite loop or a very slow algorithm."
+        )
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_call(self, item):
+        # signals are only delivered to the main thread
+        if threading.current_thread() is not threading.main_thread():
+            return (yield)
+        previous = signal.signal(signal.SIGALRM, self._expire)
+        signal.setitimer(signal.ITIMER_REAL, self.timeout)
+        try:
+            return (yield)
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+    @pytest.hookimpl(wrapper=True)
+    def pytest_runtest_makereport(self, item, call):
+        report = yield
+        if call.excinfo is not None and call.excinfo.errisinstance(TestTimeout):
+            # the item's properties are copied into its later (e.g. teardown) reports
+            item.user_properties.append((TIMEOUT_OUTCOME, True))
+            report.user_properties.append((TIMEOUT_OUTCOME, True))
+        return report
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--test-timeout",
+        type=float,
+        default=None,
+        help="Fail tests that take longer than this many seconds.",
+    )
+    parser.addoption(
+        "--rlimits",
+        default=None,
+        help="Limits, as JSON, whose rlimits to set on the test process.",
+    )
+
+
+def pytest_configure(config):
+    if rlimits := config.getoption("--rlimits"):
+        Limits.model_validate_json(rlimits).apply()
+    if timeout := config.getoption("--test-timeout"):
+        config.pluginmanager.register(TimeoutPlugin(timeout), "tdg-test-timeout")
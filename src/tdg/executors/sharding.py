@@ -0,0 +1,136 @@
+"""
+Sharded test runs: a script's tests split across concurrent runs of another runner.
+"""
+
+import asyncio
+import math
+import os
+from pathlib import Path
+from typing import Optional, Sequence
+
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.resources import Limits
+from tdg.executors.test import Report, Runner, collect_tests, reported_test
+
+
+def split(
+    tests: Sequence[str], n_shards: int, durations: dict[str, float]
+) -> list[list[str]]:
+    """
+    Split tests into shards of about equal total duration, longest first into the least loaded.
+
+    Tests without a recorded duration count as the average recorded one, so with no history this
+    is a split by count.
+    """
+    known = [durations[test] for test in tests if test in durations]
+    default = sum(known) / len(known) if known else 1.0
+    cost = {test: durations.get(test, default) for test in tests}
+
+    shards: list[list[str]] = [[] for _ in range(n_shards)]
+    loads = [0.0] * n_shards
+    for test in sorted(tests, key=lambda t: -cost[t]):
+        lightest = loads.index(min(loads))
+        shards[lightest].append(test)
+        loads[lightest] += cost[test]
+    # keep file order within each shard
+    order = {test: i for i, test in enumerate(tests)}
+    return [sorted(shard, key=order.get) for shard in shards if shard]
+
+
+class ShardedRunner(Runner):
+    """
+    Splits a script's tests across up to `shards` concurrent runs of `runner`, merging the reports.
+
+    Tests are balanced by the durations recorded from earlier runs (by test name, so shared across
+    pipelines and repair iterations). If a shard's process dies, or its script times out, the tests
+    it didn't report are rerun one per process, so the failure is pinned on the test that caused it
+    and the shard's other tests still report. A run's `maxfail` applies to each shard.
+
+    Args:
+        runner: Runs each shard; a ForkServer allowing `shards` concurrent runs by default.
+        shards: Most runs per script; the CPU count by default.
+        min_tests_per_shard: Smaller suites are split into fewer shards, or run whole.
+        limits: For the default runner; a given runner keeps its own.
+    """
+
+    def __init__(
+        self,
+        runner: Optional[Runner] = None,
+        shards: Optional[int] = None,
+        min_tests_per_shard: int = 4,
+        limits: Optional[Limits] = None,
+    ):
+        super().__init__(limits)
+        self.shards = shards or os.cpu_count() or 1
+        self.min_tests_per_shard = min_tests_per_shard
+        self.runner = runner or ForkServer(
+            max_concurrency=self.shards, limits=self.limits
+        )
+
+        self.durations: dict[str, float] = {}
+        self.isolated_reruns = 0
+
+    def __repr__(self):
+        return f"ShardedRunner({self.runner}, shards={self.shards})"
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        selected = tests
+        if tests is None:
+            tests = collect_tests(test_file_path.read_text())
+        n_shards = min(self.shards, math.ceil(len(tests) / self.min_tests_per_shard))
+        if n_shards <= 1:
+            return self.record(await self.runner.run(test_file_path, selected, maxfail))
+
+        shards = split(tests, n_shards, self.durations)
+        reports = await asyncio.gather(
+            *[self.run_shard(test_file_path, shard, maxfail) for shard in shards]
+        )
+        return self.record(
+            Report(
+                [
+                    test
+                    for report in reports
+                    for test in report.failures + report.successes
+                ],
+                exit_code=max(report.exit_code for report in reports),
+            )
+        )
+
+    async def run_shard(
+        self, test_file_path: Path, shard: list[str], maxfail: Optional[int] = None
+    ) -> Report:
+        report = await self.runner.run(test_file_path, shard, maxfail)
+        tests = report.failures + report.successes
+        if all(reported_test(test) for test in tests):
+            return report
+
+        # the shard died part way; isolate the tests it didn't get to report
+        reported = {reported_test(test) for test in tests}
+        unreported = [test for test in shard if test not in reported]
+        self.isolated_reruns += len(unreported)
+        reruns = await asyncio.gather(
+            *[self.runner.run(test_file_path, [test]) for test in unreported]
+        )
+        isolated = [test for test in tests if reported_test(test)]
+        for test, rerun in zip(unreported, reruns):
+            for result in rerun.failures + rerun.successes:
+                if not reported_test(result):
+                    result.nodeid = f"{test_file_path.name}::{test}"
+                isolated.append(result)
+        return Report(
+            isolated, exit_code=max([report.exit_code] + [r.exit_code for r in reruns])
+        )
+
+    def record(self, report: Report) -> Report:
+        for test in report.failures + report.successes:
+            if (name := reported_test(test)) and test.duration is not None:
+                self.durations[name] = test.duration
+        return report
+
+    async def close(self):
+        await self.runner.close()
@@ -0,0 +1,45 @@
+"""
+A pytest plugin streaming test results back to the process that started pytest.
+
+`python -m pytest <script> -p tdg.executors.stream --report-fd=<fd>` writes a {"report": <TestReport>}
+line to the inherited file descriptor as each test finishes, then a {"done": {"exitcode": ...}}
+line when the session ends.
+"""
+
+import json
+import os
+from typing import Any
+
+from tdg.executors.test import PytestReportPlugin
+
+
+class StreamPlugin:
+    def __init__(self, fd: int):
+        self.records = os.fdopen(fd, "w")
+
+    def emit(self, record: dict[str, Any]):
+        self.records.write(json.dumps(record) + "\n")
+        self.records.flush()
+
+    def pytest_sessionfinish(self, exitstatus):
+        self.emit({"done": {"exitcode": int(exitstatus)}})
+        self.records.close()
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--report-fd",
+        type=int,
+        default=None,
+        help="Stream a json line per test result to this file descriptor.",
+    )
+
+
+def pytest_configure(config):
+    if (fd := config.getoption("--report-fd")) is not None:
+        stream = StreamPlugin(fd)
+        reports = PytestReportPlugin(
+            on_report=lambda report: stream.emit({"report": report.model_dump()})
+        )
+        config.pluginmanager.register(reports, "tdg-report-stream")
+        config.pluginmanager.register(stream, "tdg-report-stream-end")
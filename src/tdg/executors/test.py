@@ -1,43 +1,90 @@
+import abc
+import ast
 import asyncio
 import json
-import random
-import string
+import os
+import signal
 import subprocess
 import sys
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Optional, Sequence
 
 import pytest
 from _pytest.config import ExitCode
 from pydantic import BaseModel
 
 from tdg import context_managers as cm
-from tdg.parsing import is_valid_python
+from tdg.cache import ReportCache
+from tdg.executors.resources import TIMEOUT_OUTCOME, Limits
+from tdg.parsing import is_valid_python, normalize_code
+
+
+STREAM_LIMIT = 2**24
+"""Longest line, i.e. test report, read back from a test process."""
+
+MAX_CAPTURE = 4096
+"""Most characters of a test's captured stdout, and of its stderr, kept in its report."""
+
+CRASH_OUTCOME = "crashed"
+"""TestReport.outcome standing in for the tests of a script whose process died."""
 
 
 class TestReport(BaseModel):
     nodeid: str
     outcome: str
     longrepr: Optional[str] = None
+    duration: Optional[float] = None
+    """Seconds the test took to run, if it ran."""
+    stdout: Optional[str] = None
+    """What the test printed, at most MAX_CAPTURE characters of it."""
+    stderr: Optional[str] = None
+
+
+def bounded(text: str, limit: int = MAX_CAPTURE) -> Optional[str]:
+    """At most `limit` characters of text, from its start and end; None if it's empty."""
+    if not text:
+        return None
+    if len(text) <= limit:
+        return text
+    half = limit // 2
+    cut = len(text) - 2 * half
+    return f"{text[:half]}\n... {cut} characters truncated ...\n{text[-half:]}"
 
 
 class PytestReportPlugin:
-    def __init__(self):
+    """
+    Collects a TestReport per test when passed to pytest.main(plugins=[...]).
+
+    Args:
+        on_report: Also called with each TestReport as soon as its test has run.
+    """
+
+    def __init__(self, on_report: Optional[Callable[[TestReport], None]] = None):
+        self.on_report = on_report
         self.failures: list[TestReport] = []
         self.successes: list[TestReport] = []
         self.exit_code: Optional[ExitCode] = None
 
     def pytest_runtest_logreport(self, report):
+        # one report per test: its call, or the setup/teardown that failed or skipped it
+        if report.when != "call" and report.passed:
+            return
+        timed_out = dict(report.user_properties).get(TIMEOUT_OUTCOME)
         report_info = {
             "nodeid": report.nodeid,
-            "outcome": report.outcome,
-            "longrepr": str(report.longrepr),
+            "outcome": TIMEOUT_OUTCOME if timed_out else report.outcome,
+            "longrepr": str(report.longrepr) if report.longrepr else None,
+            "duration": report.duration,
+            "stdout": bounded(report.capstdout),
+            "stderr": bounded(report.capstderr),
         }
         parsed = TestReport.model_validate(report_info)
         if report.failed:
             self.failures.append(parsed)
         else:
             self.successes.append(parsed)
+        if self.on_report:
+            self.on_report(parsed)
 
     def pytest_sessionfinish(self):
         # Here, you could further process the reports or print them.
@@ -50,55 +97,234 @@ class Report:
         self.successes: list[TestReport] = [r for r in reports if r.outcome == "passed"]
         self.exit_code: Optional[ExitCode] = exit_code
 
+    @property
+    def timeouts(self) -> list[TestReport]:
+        return [r for r in self.failures if r.outcome == TIMEOUT_OUTCOME]
+
+
+def strip_root(report: Report, root: Path):
+    """Makes the paths under the temporary root in report relative, as they differ every run."""
+    prefix = f"{root}{os.sep}"
+    for test in report.failures + report.successes:
+        for field in ("longrepr", "stdout", "stderr"):
+            if text := getattr(test, field):
+                setattr(test, field, text.replace(prefix, ""))
 
-async def run_pytest_with_json_report(test_file_path: Path):
-    # Define the path for the JSON report
-    json_report_path = test_file_path.parent / "test_report.json"
 
-    # Command to run pytest in subprocess
+def describe_exit(exit_code: int) -> str:
+    if exit_code >= 0:
+        return f"exited with code {exit_code}"
+    match signal.Signals(-exit_code):
+        case signal.SIGXCPU:
+            return "ran out of CPU time (SIGXCPU)"
+        case signal.SIGKILL:
+            return "was killed (SIGKILL), e.g. for running too long or out of memory"
+        case sig:
+            return f"was killed by {sig.name}"
+
+
+def crash_report(test_file_path: Path, exit_code: int) -> TestReport:
+    """Stands in for the unreported tests of a script whose test process died."""
+    return TestReport(
+        nodeid=test_file_path.name,
+        outcome=CRASH_OUTCOME,
+        longrepr=f"The test process {describe_exit(exit_code)} while running the tests.",
+    )
+
+
+def script_timeout_report(test_file_path: Path, seconds: float) -> TestReport:
+    """Stands in for the unreported tests of a script stopped for running too long."""
+    return TestReport(
+        nodeid=test_file_path.name,
+        outcome=TIMEOUT_OUTCOME,
+        longrepr=(
+            f"The tests took longer than their time limit of {seconds}s in total and were "
+            f"stopped, e.g. because of an infinite loop or a very slow algorithm."
+        ),
+    )
+
+
+def collect_tests(script: str) -> list[str]:
+    """The script's top-level test functions and classes, as pytest would collect them."""
+    return [
+        node.name
+        for node in ast.parse(script).body
+        if (
+            isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))
+            and node.name.startswith("test")
+        )
+        or (isinstance(node, ast.ClassDef) and node.name.startswith("Test"))
+    ]
+
+
+def reported_test(report: TestReport) -> Optional[str]:
+    """
+    The top-level test a report is for, e.g. test_x for script.py::test_x[1] and TestY for
+    script.py::TestY::test_z; None for reports about the whole script.
+    """
+    _, sep, name = report.nodeid.partition("::")
+    return name.split("::")[0].split("[")[0] if sep else None
+
+
+def pytest_selection(
+    test_file_path: Path, tests: Optional[Sequence[str]], maxfail: Optional[int] = None
+) -> list[str]:
+    """
+    pytest's arguments for running some (or all, if None) of a script's tests, in order, and
+    stopping after `maxfail` failures (or not, if None).
+    """
+    targets = [str(test_file_path)]
+    if tests is not None:
+        targets = [f"{test_file_path}::{test}" for test in tests]
+    return targets + ([f"--maxfail={maxfail}"] if maxfail else [])
+
+
+async def run_pytest_subprocess(
+    test_file_path: Path,
+    limits: Optional[Limits] = None,
+    tests: Optional[Sequence[str]] = None,
+    maxfail: Optional[int] = None,
+) -> Report:
+    """
+    Run a script in a fresh `python -m pytest`, reading its tests' reports from a pipe as they run.
+
+    Nothing touches the disk, so concurrent runs in one directory are safe, and a run that is
+    killed, or dies, still reports the tests it finished. pytest's own output is discarded; each
+    test's captured output is in its report.
+    """
+    limits = limits or Limits.none()
+    read_fd, write_fd = os.pipe()
     cmd = [
         sys.executable,
         "-m",
         "pytest",
-        test_file_path,
-        "--json-report",  # Enable JSON reporting
-        f"--json-report-file={json_report_path}",  # Specify the JSON report file path
+        *pytest_selection(test_file_path, tests, maxfail),
+        "-p",
+        "tdg.executors.stream",
+        f"--report-fd={write_fd}",
+        *limits.pytest_args(),
     ]
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            pass_fds=[write_fd],
+        )
+    finally:
+        os.close(write_fd)
 
-    # Start the subprocess
-    process = await asyncio.create_subprocess_exec(
-        *cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    loop = asyncio.get_running_loop()
+    records = asyncio.StreamReader(limit=STREAM_LIMIT)
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(records), os.fdopen(read_fd, "rb")
     )
+    reports: list[TestReport] = []
+    try:
+        async with asyncio.timeout(limits.script_timeout):
+            while line := await records.readline():
+                record = json.loads(line)
+                if "report" in record:
+                    reports.append(TestReport.model_validate(record["report"]))
+                else:
+                    await process.wait()
+                    return Report(reports, exit_code=record["done"]["exitcode"])
+            code = await process.wait()
+    except TimeoutError:
+        process.kill()
+        await process.wait()
+        timeout = script_timeout_report(test_file_path, limits.script_timeout)
+        return Report(reports + [timeout], exit_code=ExitCode.INTERRUPTED)
+    except asyncio.CancelledError:
+        # e.g. the pipeline is out of time; don't leave pytest running
+        process.kill()
+        await process.wait()
+        raise
+    finally:
+        transport.close()
 
-    # Wait for the subprocess to finish
-    await process.wait()
-
-    # Read the JSON report
-    if json_report_path.exists():
-        with open(json_report_path, "r") as file:
-            report_data = json.load(file)
-            # Extract data from the report
-            return Report(
-                [TestReport.model_validate(test) for test in report_data["tests"]],
-                exit_code=report_data["exitcode"],
-            )
-    else:
-        raise FileNotFoundError(
-            f"JSON report not found, expected at {json_report_path}"
-        )
+    # e.g. killed for exceeding an rlimit, or unable to start the session
+    crash = crash_report(test_file_path, code)
+    return Report(reports + [crash], exit_code=ExitCode.INTERNAL_ERROR)
+
+
+class Runner(abc.ABC):
+    """
+    Runs a test script with pytest, for TestExecutor.
+
+    Args:
+        limits: Time and resource limits for the tests; Limits() by default.
+    """
+
+    def __init__(self, limits: Optional[Limits] = None):
+        self.limits = limits or Limits()
+
+    @abc.abstractmethod
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        """
+        Args:
+            test_file_path: The script.
+            tests: Names of the script's tests to run, in order, e.g. test_x or TestY; all if None.
+            maxfail: Stop after this many failures, leaving the remaining tests unreported.
+        """
+        raise NotImplementedError()
+
+    async def close(self):
+        """Stop any processes kept between runs; the runner may still be used afterwards."""
+
+
+class SubprocessRunner(Runner):
+    """A fresh `python -m pytest` per script, streaming its reports back over a pipe."""
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        return await run_pytest_subprocess(test_file_path, self.limits, tests, maxfail)
 
 
 class TestExecutor:
     """
     A class for executing test cases and tracking results.
+
+    Args:
+        first: Tests to run before the rest, e.g. those that failed last time. If any of them fail
+            the rest aren't run, so the report is incomplete; once they all pass, a confirm pass
+            runs the whole suite.
+        maxfail: Stop each run after this many failures, e.g. when only ranking candidates.
+        cache: Reports of earlier runs of AST-identical scripts, reused instead of running the
+            tests again. Runs with a timeout or crash aren't cached, as load may have caused them.
     """
 
-    def __init__(self, script: str, path: Optional[Path] = None):
+    def __init__(
+        self,
+        script: str,
+        path: Optional[Path] = None,
+        runner: Optional[Runner] = None,
+        first: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+        cache: Optional[ReportCache] = None,
+    ):
         if not is_valid_python(script):
             raise ValueError(f"Script was not valid python code:\n\n{script}")
         self.script = script
         self.path = path
+        self.runner = runner or SubprocessRunner()
+        self.first = first
+        self.maxfail = maxfail
+        self.cache = cache
+        self.cached = False
+        """Whether the report came from the cache, rather than running the tests."""
         self.tracker = None
+        self.complete = False
+        """Whether every test ran, so the tracker has all the failures."""
 
         self.exit_code: int | ExitCode = -1
 
@@ -106,17 +332,96 @@ class TestExecutor:
         """Invoke the provided test script"""
 
         with cm.TempDir() as tmpdir:
-            if not self.path:
-                uuid = "".join(random.choices(string.ascii_letters, k=12))
-                tmp_test_file = tmpdir.root / f"test_cases_{uuid}.py"
+            written = not self.path
+            if written:
+                # a fixed name, so the same script gets the same report, e.g. for cassettes
+                tmp_test_file = tmpdir.root / "test_cases.py"
                 tmp_test_file.write_text(self.script)
                 self.path = tmp_test_file
 
-            self.tracker = await run_pytest_with_json_report(self.path)
+            cached = await self.cached_report() if self.cache is not None else None
+            if cached is not None:
+                self.tracker = cached
+            else:
+                self.tracker = await self.run()
+                if written:
+                    strip_root(self.tracker, tmpdir.root)
+                if self.cache is not None:
+                    await self.cache_report()
 
             self.exit_code = self.tracker.exit_code
         return self
 
+    async def run(self) -> Report:
+        tests = collect_tests(self.script)
+        # tests that no longer exist would make pytest fail to collect any
+        first = [test for test in dict.fromkeys(self.first or []) if test in tests]
+        if first:
+            report = await self.runner.run(self.path, first, self.maxfail)
+            if report.failures:
+                return report
+            if len(first) == len(tests):
+                self.complete = True
+                return report
+
+        report = await self.runner.run(self.path, maxfail=self.maxfail)
+        self.complete = not self.maxfail or len(report.failures) < self.maxfail
+        return report
+
+    def cache_options(self, complete: bool) -> dict:
+        """What besides the script decides a run's report; a complete one answers any selection."""
+        options = {"limits": self.runner.limits.model_dump()}
+        if not complete:
+            options["first"] = list(dict.fromkeys(self.first or []))
+            options["maxfail"] = self.maxfail
+        return options
+
+    async def cached_report(self) -> Optional[Report]:
+        normalized = normalize_code(self.script)
+        for complete in (True, False):
+            if entry := await self.cache.aget_report(
+                normalized, self.cache_options(complete)
+            ):
+                break
+        else:
+            return None
+
+        self.cached = True
+        self.complete = entry["complete"]
+        reports = [TestReport.model_validate(test) for test in entry["tests"]]
+        for report in reports:
+            # the cached run's script had another name
+            _, sep, test = report.nodeid.partition("::")
+            report.nodeid = f"{self.path.name}{sep}{test}"
+        return Report(reports, exit_code=entry["exitcode"])
+
+    async def cache_report(self):
+        if any(
+            fail.outcome in (TIMEOUT_OUTCOME, CRASH_OUTCOME)
+            for fail in self.tracker.failures
+        ):
+            return
+        await self.cache.aset_report(
+            normalize_code(self.script),
+            self.cache_options(self.complete),
+            {
+                "exitcode": int(self.tracker.exit_code),
+                "complete": self.complete,
+                "tests": [
+                    test.model_dump()
+                    for test in self.tracker.failures + self.tracker.successes
+                ],
+            },
+        )
+
+    def failed_tests(self) -> list[str]:
+        """Names of the failing tests, e.g. to run first next time."""
+        return list(
+            dict.fromkeys(
+                name for fail in self.tracker.failures if (name := reported_test(fail))
+            )
+        )
+
     def passed(self) -> bool:
         return self.exit_code == ExitCode.OK
 
@@ -0,0 +1,131 @@
+"""
+A long-lived pytest process, started by WorkerPool as `python -m tdg.executors.worker [module ...]`.
+
+The named modules are imported up front. Each line read on stdin is a request,
+{"path": <script>, "limits": <Limits>, "tests": <names, or null for all>, "maxfail": <n or null>},
+answered on stdout with a {"report": <TestReport>} line per test as it runs, then a
+{"done": {"exitcode": ..., "maxrss": <KiB>}} line. Anything else written to stdout, e.g. by the tests themselves, is discarded.
+"""
+
+import asyncio
+import importlib
+import json
+import os
+import resource
+import subprocess
+import sys
+from pathlib import Path
+from typing import Any, Callable, Optional, Sequence
+
+import pytest
+
+from tdg.executors.resources import Limits
+from tdg.executors.test import STREAM_LIMIT, PytestReportPlugin, pytest_selection
+
+PRELOAD = ("collections", "functools", "itertools", "math", "re", "string", "typing")
+"""Modules generated code commonly imports, worth importing once per worker."""
+
+PYTEST_ARGS = (
+    "-q",
+    "-p",
+    "no:cacheprovider",
+    # its teardown runs several full garbage collections, the bulk of an in-process run
+    "-p",
+    "no:unraisableexception",
+    "--import-mode=importlib",
+)
+"""importlib mode imports each script under a unique name and leaves sys.path alone."""
+
+
+async def start_process(
+    module: str, preload: Sequence[str]
+) -> asyncio.subprocess.Process:
+    """Start `python -m <module> [preload ...]`, to talk to over its stdin and stdout."""
+    return await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-m",
+        module,
+        *preload,
+        stdin=subprocess.PIPE,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        limit=STREAM_LIMIT,
+        # plugin discovery is most of pytest's startup, and generated tests need none
+        env={**os.environ, "PYTEST_DISABLE_PLUGIN_AUTOLOAD": "1"},
+    )
+
+
+def take_stdout() -> tuple[int, int]:
+    """
+    Keep stdout for the protocol, sending whatever pytest or the tests print to /dev/null.
+
+    Returns a descriptor for the original stdout, and the one open on /dev/null.
+    """
+    protocol = os.dup(sys.stdout.fileno())
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, sys.stdout.fileno())
+    return protocol, devnull
+
+
+def import_modules(names: Sequence[str]):
+    """Import the modules that exist of `names`, so scripts find them already loaded."""
+    for name in names:
+        try:
+            importlib.import_module(name)
+        except ImportError:
+            pass
+
+
+def run_script(
+    path: Path,
+    emit: Callable[[dict[str, Any]], None],
+    limits: Optional[Limits] = None,
+    tests: Optional[Sequence[str]] = None,
+    maxfail: Optional[int] = None,
+) -> int:
+    """
+    Run a test script with pytest in this process, emitting a record per test.
+
+    Modules imported from the script's directory are forgotten afterwards, so the next script
+    starts from a clean namespace; library imports stay warm. The limits' rlimits should already
+    be applied; their per-test timeout is enforced here.
+    """
+    before = set(sys.modules)
+    plugin = PytestReportPlugin(
+        on_report=lambda report: emit({"report": report.model_dump()})
+    )
+    plugins = [plugin, *(limits.pytest_plugins() if limits else [])]
+    try:
+        args = [*pytest_selection(path, tests, maxfail), *PYTEST_ARGS]
+        return int(pytest.main(args, plugins=plugins))
+    finally:
+        root = str(path.parent)
+        for name in set(sys.modules) - before:
+            file = getattr(sys.modules[name], "__file__", None)
+            if file is None or file.startswith(root):
+                del sys.modules[name]
+
+
+def main():
+    fd, _ = take_stdout()
+    protocol = os.fdopen(fd, "w")
+
+    def emit(record: dict[str, Any]):
+        protocol.write(json.dumps(record) + "\n")
+        protocol.flush()
+
+    import_modules(sys.argv[1:])
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        limits = Limits.model_validate(request["limits"])
+        limits.apply()
+        exit_code = run_script(
+            Path(request["path"]), emit, limits, request["tests"], request["maxfail"]
+        )
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        emit({"done": {"exitcode": exit_code, "maxrss": maxrss}})
+
+
+if __name__ == "__main__":
+    main()
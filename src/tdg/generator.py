@@ -3,19 +3,64 @@ A synchronous generator that wraps many asynchronous pipelines.
 """
 
 import asyncio
+import json
 import uuid
 from pathlib import Path
-from typing import Callable, Union
+from typing import Any, Awaitable, Callable, Optional, Union
 
+from tdg.artifacts import ArtifactStore
+from tdg.batch import (
+    BatchRequest,
+    BatchResult,
+    BatchSubmitter,
+    read_batch_results,
+    write_batch_job,
+)
+from tdg.backends.base import Backend
+from tdg.budget import Budget
+from tdg.cache import CompletionCache, ReportCache, default_cache_dir
+from tdg.cassette import CassetteDeck
+from tdg.clients import ClientRegistry, default_registry
+from tdg.executors.test import Runner
+from tdg.limits import RateLimiter
+from tdg.metrics import usage_report
 from tdg.parse_humaneval import HEPSuite
 from tdg.pipeline import Pipeline
 
 
 class Generator:
-    def __init__(self, *tests: Union[Callable, HEPSuite], from_id: str = ""):
+    def __init__(
+        self,
+        *tests: Union[Callable, HEPSuite],
+        from_id: str = "",
+        cache: Optional[CompletionCache] = None,
+        clients: Optional[ClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+        n_candidates: int = 1,
+        context_budget: Optional[int] = None,
+        backend: Optional[Backend] = None,
+        speculative: bool = False,
+        cassettes: Optional[CassetteDeck] = None,
+        deadline: Optional[float] = None,
+        token_budget: Optional[int] = None,
+        pipeline_deadline: Optional[float] = None,
+        pipeline_token_budget: Optional[int] = None,
+        artifacts: Optional[ArtifactStore] = None,
+        runner: Optional[Runner] = None,
+        failing_first: bool = True,
+        rank_maxfail: Optional[int] = None,
+        report_cache: Optional[ReportCache] = None,
+    ):
         self.tests = tests
+        self.clients = clients or default_registry()
+        self.limiter = limiter
+        self.runner = runner
+        """Shared by every pipeline to run tests, e.g. a WorkerPool; closed when generation ends."""
         self._id: str = str(uuid.uuid4())
 
+        self.budget = Budget(deadline, token_budget, name="run")
+        """Seconds and tokens for the whole run, shared by every pipeline."""
+
         self.pipelines: list[Pipeline] = []
 
         for test in tests:
@@ -23,23 +68,196 @@ class Generator:
                 case HEPSuite():
                     pipe_id = test.fn_name
                 case _:
-                    pipe_id = str(test)
+                    # stable across runs, so state and cassettes can be found again
+                    pipe_id = f"{test.__module__}.{test.__qualname__}"
 
-            pipe = Pipeline(test, from_id=pipe_id)
+            pipe = Pipeline(
+                test,
+                from_id=pipe_id,
+                cache=cache,
+                clients=self.clients,
+                limiter=limiter,
+                n_candidates=n_candidates,
+                context_budget=context_budget,
+                backend=backend,
+                speculative=speculative,
+                cassettes=cassettes,
+                budget=Budget(
+                    pipeline_deadline,
+                    pipeline_token_budget,
+                    parent=self.budget,
+                    name="pipeline",
+                ),
+                artifacts=artifacts,
+                runner=runner,
+                failing_first=failing_first,
+                rank_maxfail=rank_maxfail,
+                report_cache=report_cache,
+            )
             self.pipelines.append(pipe)
 
         self.results: list[tuple[str, str]] = []
+        self.errors: dict[str, BaseException] = {}
+        """Pipelines that raised, by pipeline id."""
 
-    async def _generate_all_pipelines(self):
-        self.results.extend(
-            await asyncio.gather(
-                *[pipe.gen() for pipe in self.pipelines], return_exceptions=True
-            )
+    async def _gather_live(
+        self,
+        pipelines: list[Pipeline],
+        step: Callable[[Pipeline], Awaitable[Any]],
+    ) -> list[tuple[Pipeline, Any]]:
+        """Run a step on every pipeline concurrently, retiring those that raise."""
+        outcomes = await asyncio.gather(
+            *[step(pipe) for pipe in pipelines], return_exceptions=True
         )
+        live = []
+        for pipe, outcome in zip(pipelines, outcomes):
+            if isinstance(outcome, BaseException):
+                # don't let one pipeline's failure hide in the results
+                print(f"{pipe} failed: {outcome!r}")
+                self.errors[pipe._id] = outcome
+            else:
+                live.append((pipe, outcome))
+        return live
+
+    async def _generate_all_pipelines(self):
+        try:
+            generated = await self._gather_live(self.pipelines, lambda pipe: pipe.gen())
+            self.results.extend(result for _, result in generated)
+        finally:
+            await self.close_runner()
+
+    async def close_runner(self):
+        if self.runner:
+            await self.runner.close()
 
     def generate(self):
         asyncio.run(self._generate_all_pipelines())
 
+    async def _generate_all_pipelines_batched(
+        self, submitter: BatchSubmitter, job_dir: Path
+    ):
+        pipelines = list(self.pipelines)
+        for stage in Pipeline.STAGES:
+            started = self._retire_stopped(
+                await self._gather_live(
+                    pipelines,
+                    lambda pipe: pipe.budgeted(lambda: pipe.start_stage(stage)),
+                )
+            )
+
+            pending = {}
+            for pipe, agent in started:
+                messages = agent.pending_messages()
+                config = agent.request_config()
+                # skip what a previous run already answered
+                if await agent.cache.aget_choices(messages, config) is None:
+                    pending[f"{pipe._id}:{stage}"] = (pipe, agent, messages, config)
+
+            if pending:
+                job = write_batch_job(
+                    [
+                        BatchRequest(
+                            custom_id=custom_id,
+                            body={
+                                "messages": messages,
+                                **{k: v for k, v in config.items() if k != "stream"},
+                            },
+                        )
+                        for custom_id, (_, _, messages, config) in pending.items()
+                    ],
+                    job_dir / f"{self._id}_{stage}.jsonl",
+                )
+                results = await self._submit_within_budget(
+                    submitter, job, [pipe for pipe, *_ in pending.values()]
+                )
+                for custom_id, (pipe, agent, messages, config) in pending.items():
+                    # failed requests fall back to an interactive call in finish_stage
+                    if (result := results.get(custom_id)) and (
+                        completion := result.completion()
+                    ):
+                        # spent whether or not the pipeline gets to use the answer
+                        pipe.budget.charge(result.tokens())
+                        agent.answer_from_batch(messages, config, completion)
+
+            finished = self._retire_stopped(
+                await self._gather_live(
+                    [pipe for pipe, _ in started],
+                    lambda pipe: pipe.budgeted(lambda: pipe.finish_stage(stage)),
+                )
+            )
+            pipelines = [pipe for pipe, _ in finished]
+
+        try:
+            refined = self._retire_stopped(
+                await self._gather_live(
+                    pipelines, lambda pipe: pipe.budgeted(pipe.refine)
+                )
+            )
+        finally:
+            await self.close_runner()
+        self.results.extend(result for _, result in refined)
+        for pipe in self.pipelines:
+            await pipe.archive_histories()
+
+    async def _submit_within_budget(
+        self, submitter: BatchSubmitter, job: Path, pipelines: list[Pipeline]
+    ) -> dict[str, BatchResult]:
+        """
+        The results of a batch job, or none if every pipeline waiting on it runs out of time first.
+
+        The pipelines then stop at the start of finish_stage, with their deadline as stop_reason.
+        """
+        remaining = [pipe.budget.remaining_time() for pipe in pipelines]
+        try:
+            async with asyncio.timeout(None if None in remaining else max(remaining)):
+                return read_batch_results(await submitter.submit(job))
+        except TimeoutError:
+            print(f"Deadline passed waiting for batch {job}")
+            return {}
+
+    def _retire_stopped(
+        self, outcomes: list[tuple[Pipeline, Any]]
+    ) -> list[tuple[Pipeline, Any]]:
+        """Keep the pipelines still within budget; those out of it finish with their best solution."""
+        live = []
+        for pipe, outcome in outcomes:
+            if outcome is None:
+                self.results.append((pipe._id, pipe.best_solution))
+            else:
+                live.append((pipe, outcome))
+        return live
+
+    def generate_batched(
+        self, submitter: BatchSubmitter, job_dir: Optional[Path] = None
+    ):
+        """
+        Generate by advancing every pipeline one agent stage at a time, submitting each
+        stage's initial requests as a single batch job.
+
+        Follow-up requests (e.g. validation retries and test repair rounds) are made interactively.
+
+        Args:
+            submitter: Processes the batch job files.
+            job_dir: Where job and result files are written; defaults to ~/.tdg/batches.
+        """
+        job_dir = job_dir or default_cache_dir() / "batches"
+        asyncio.run(self._generate_all_pipelines_batched(submitter, job_dir))
+
+    @property
+    def stop_reasons(self) -> dict[str, str]:
+        """Why pipelines that ran out of budget stopped, by pipeline id."""
+        return {
+            pipe._id: pipe.stop_reason for pipe in self.pipelines if pipe.stop_reason
+        }
+
+    def usage(self) -> dict:
+        """Latency, token and cost totals for the run, by agent and by pipeline."""
+        return usage_report([call for pipe in self.pipelines for call in pipe.calls])
+
+    def save_usage(self, path: Path):
+        path.parent.mkdir(exist_ok=True, parents=True)
+        path.write_text(json.dumps(self.usage(), indent=2))
+
     def save(self, path: Path):
         path.mkdir(exist_ok=True, parents=True)
         for id_, result in self.results:
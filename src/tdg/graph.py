@@ -0,0 +1,82 @@
+"""
+A dependency graph of async tasks, run with as much concurrency as the dependencies allow.
+"""
+
+import asyncio
+from graphlib import TopologicalSorter
+from typing import Any, Awaitable, Callable, Iterable
+
+
+class TaskNode:
+    def __init__(
+        self, name: str, run: Callable[[], Awaitable[Any]], after: Iterable[str] = ()
+    ):
+        self.name = name
+        self.run = run
+        self.after = tuple(after)
+
+    def __repr__(self):
+        return f"TaskNode({self.name}, after={self.after})"
+
+
+class TaskGraph:
+    """
+    Named async tasks, each started as soon as every task it depends on has finished.
+
+    e.g. with b and c both after a, b and c run concurrently once a is done:
+
+        graph = TaskGraph()
+        graph.add("a", fetch)
+        graph.add("b", lambda: parse(graph.results["a"]), after=["a"])
+        graph.add("c", lambda: log(graph.results["a"]), after=["a"])
+        await graph.run()
+    """
+
+    def __init__(self):
+        self.nodes: dict[str, TaskNode] = {}
+        self.results: dict[str, Any] = {}
+        """Each finished task's return value, by name."""
+
+    def add(
+        self, name: str, run: Callable[[], Awaitable[Any]], after: Iterable[str] = ()
+    ) -> TaskNode:
+        if name in self.nodes:
+            raise ValueError(f"Task {name} is already in the graph")
+        node = TaskNode(name, run, after)
+        if unknown := [dep for dep in node.after if dep not in self.nodes]:
+            # requiring dependencies first also rules out cycles
+            raise ValueError(f"Task {name} depends on unknown tasks {unknown}")
+        self.nodes[name] = node
+        return node
+
+    async def run(self) -> dict[str, Any]:
+        """
+        Run every task, returning their results by name.
+
+        If a task raises, the tasks still running are cancelled and the exception propagates.
+        """
+        sorter = TopologicalSorter(
+            {name: node.after for name, node in self.nodes.items()}
+        )
+        sorter.prepare()
+
+        running: dict[asyncio.Task, str] = {}
+        try:
+            while sorter.is_active():
+                for name in sorter.get_ready():
+                    running[asyncio.create_task(self.nodes[name].run())] = name
+
+                done, _ = await asyncio.wait(
+                    running, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    name = running.pop(task)
+                    self.results[name] = task.result()
+                    sorter.done(name)
+        finally:
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        return self.results
@@ -0,0 +1,162 @@
+"""
+Append-only persistence for agent conversation state.
+
+Instead of rewriting an agent's whole history after every message, each save appends only what
+changed since the last one to a JSONL journal, which load_state replays. The journal is
+periodically compacted into a single snapshot line, written to a temporary file and renamed over
+the journal so that a crash never leaves it half written.
+"""
+
+import json
+import os
+from pathlib import Path
+from typing import Any, Optional
+
+import aiofiles
+
+DEFAULT_COMPACT_EVERY = 64
+"""Entries appended between compactions."""
+
+
+class HistoryJournal:
+    """
+    The journal of one agent's GenerationHistory.
+
+    Entries are one of:
+        {"op": "snapshot", "messages": [...], "memory": {...}}: the whole history, after compaction
+        {"op": "message", "role": ..., "content": ...}: a message was appended
+        {"op": "truncate", "length": n}: messages after the first n were dropped or changed
+        {"op": "remember", "key": ..., "index": i}: memory[key] is messages[i]
+        {"op": "remember", "key": ..., "role": ..., "content": ...}: memory[key] is this message
+    """
+
+    def __init__(self, path: Path, compact_every: int = DEFAULT_COMPACT_EVERY):
+        self.path = path
+        self.compact_every = compact_every
+
+        # what the journal already holds, to diff new saves against
+        self._messages: list[tuple[str, str]] = []
+        self._memory: dict[str, tuple[str, str]] = {}
+        self._since_compaction = 0
+        self._synced = False
+        """Whether the diff state matches the file, i.e. it has been replayed or written here."""
+
+    def __repr__(self):
+        return f"HistoryJournal({self.path})"
+
+    def entries(self, history) -> list[dict[str, Any]]:
+        """The entries that bring the journal up to date with a GenerationHistory."""
+        messages = [(m.role, m.content) for m in history.messages]
+        entries: list[dict[str, Any]] = []
+
+        common = 0
+        while (
+            common < min(len(messages), len(self._messages))
+            and messages[common] == self._messages[common]
+        ):
+            common += 1
+        if common < len(self._messages):
+            entries.append({"op": "truncate", "length": common})
+        for role, content in messages[common:]:
+            entries.append({"op": "message", "role": role, "content": content})
+
+        for key, message in history.memory.items():
+            if self._memory.get(key) == (message.role, message.content):
+                continue
+            index = next(
+                (i for i, m in enumerate(history.messages) if m is message), None
+            )
+            if index is not None:
+                entries.append({"op": "remember", "key": key, "index": index})
+            else:
+                entries.append(
+                    {
+                        "op": "remember",
+                        "key": key,
+                        "role": message.role,
+                        "content": message.content,
+                    }
+                )
+
+        self._messages = messages
+        self._memory = {
+            key: (message.role, message.content)
+            for key, message in history.memory.items()
+        }
+        return entries
+
+    async def append(self, history):
+        """Journal what changed in the history, compacting if enough has accumulated."""
+        if (
+            not self._synced
+            or self._since_compaction >= self.compact_every
+            or not self.path.is_file()
+        ):
+            await self.compact(history)
+            return
+
+        if not (entries := self.entries(history)):
+            return
+        async with aiofiles.open(self.path, "a") as f:
+            await f.write("".join(json.dumps(entry) + "\n" for entry in entries))
+        self._since_compaction += len(entries)
+
+    async def compact(self, history):
+        """Replace the journal with a snapshot of the history."""
+        self.path.parent.mkdir(exist_ok=True, parents=True)
+        self.entries(history)
+        snapshot = {"op": "snapshot", **history.model_dump()}
+
+        tmp = self.path.with_name(f"{self.path.name}.tmp")
+        async with aiofiles.open(tmp, "w") as f:
+            await f.write(json.dumps(snapshot) + "\n")
+        os.replace(tmp, self.path)
+        self._since_compaction = 0
+        self._synced = True
+
+    async def replay(self) -> Optional[dict[str, Any]]:
+        """
+        The journaled history, as GenerationHistory fields, or None if there is no journal.
+
+        A torn final line, from a crash while appending, is ignored (and dropped at the next save).
+        """
+        if not self.path.is_file():
+            return None
+        async with aiofiles.open(self.path, "r") as f:
+            lines = (await f.read()).splitlines()
+
+        messages: list[dict[str, str]] = []
+        memory: dict[str, dict[str, str]] = {}
+        torn = False
+        for n, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                if n == len(lines) - 1:
+                    torn = True
+                    break
+                raise
+            match entry["op"]:
+                case "snapshot":
+                    messages = entry["messages"]
+                    memory = entry["memory"]
+                case "message":
+                    messages.append(
+                        {"role": entry["role"], "content": entry["content"]}
+                    )
+                case "truncate":
+                    del messages[entry["length"] :]
+                case "remember" if "index" in entry:
+                    memory[entry["key"]] = messages[entry["index"]]
+                case "remember":
+                    memory[entry["key"]] = {
+                        "role": entry["role"],
+                        "content": entry["content"],
+                    }
+
+        self._messages = [(m["role"], m["content"]) for m in messages]
+        self._memory = {key: (m["role"], m["content"]) for key, m in memory.items()}
+        self._since_compaction = len(lines) - 1
+        # appending after a torn line would corrupt the next entry, so compact first instead
+        self._synced = not torn
+        return {"messages": messages, "memory": memory}
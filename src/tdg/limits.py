@@ -0,0 +1,255 @@
+"""
+Client-side rate limiting for LLM requests, shared by every agent in a process.
+"""
+
+import asyncio
+import functools
+import math
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Mapping, Optional, TypeVar
+
+import openai
+
+from tdg.config import Settings
+
+T = TypeVar("T")
+
+CHARS_PER_TOKEN = 4
+"""Rough chars/token ratio for english text and code; good enough for budgeting."""
+MESSAGE_OVERHEAD_TOKENS = 4
+DEFAULT_COMPLETION_TOKENS = 1024
+"""Assumed completion length when AgentConfig.max_tokens is unset."""
+
+TRANSIENT_ERRORS = (openai.InternalServerError, openai.APIConnectionError)
+"""Failures worth retrying as they are; APITimeoutError is an APIConnectionError."""
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def estimate_prompt_tokens(messages: list[dict[str, str]]) -> int:
+    return sum(
+        estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+        for message in messages
+    )
+
+
+def estimate_request_tokens(
+    messages: list[dict[str, str]], config: Mapping[str, Any]
+) -> int:
+    """Estimate the tokens a chat completion request will count against a TPM limit."""
+    prompt = estimate_prompt_tokens(messages)
+    completion = (config.get("max_tokens") or DEFAULT_COMPLETION_TOKENS) * (
+        config.get("n") or 1
+    )
+    return prompt + completion
+
+
+_duration_pattern = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_duration_units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600}
+
+
+def parse_duration(value: str) -> float:
+    """Parse OpenAI rate limit reset durations, e.g. '20ms', '1s', '6m0s', into seconds."""
+    return sum(
+        float(amount) * _duration_units[unit]
+        for amount, unit in _duration_pattern.findall(value)
+    )
+
+
+def retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds the server asked us to wait before retrying, if it said."""
+    if ms := headers.get("retry-after-ms"):
+        return float(ms) / 1000
+    if seconds := headers.get("retry-after"):
+        try:
+            return float(seconds)
+        except ValueError:
+            return None
+    return None
+
+
+class TokenBucket:
+    """A bucket holding up to `per_minute` units, refilled continuously."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.available = per_minute
+        self._updated = time.monotonic()
+
+    @property
+    def rate(self) -> float:
+        """Refill rate, in units per second."""
+        return self.capacity / 60
+
+    def refill(self, scale: float = 1.0):
+        now = time.monotonic()
+        self.available = min(
+            self.capacity, self.available + (now - self._updated) * self.rate * scale
+        )
+        self._updated = now
+
+    def wait_time(self, amount: float, scale: float = 1.0) -> float:
+        """Seconds until `amount` units are available (0 if they are now)."""
+        self.refill(scale)
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / (self.rate * scale)
+
+    def consume(self, amount: float):
+        self.available -= min(amount, self.capacity)
+
+    def sync(self, limit: Optional[float], remaining: Optional[float]):
+        """Adopt the server's view of this bucket, which is authoritative."""
+        self.refill()
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.available = min(self.available, remaining)
+
+
+class RateLimiter:
+    """
+    Budgets requests-per-minute and estimated tokens-per-minute across all concurrent agents.
+
+    Limits are corrected from the x-ratelimit-* response headers as they arrive. On a 429, every
+    caller pauses for the server's retry-after (or an exponential backoff with jitter), the refill
+    rate is halved, and then recovers additively with each success.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        *,
+        max_retries: int = 6,
+        base_delay: float = 1.0,
+        max_delay: float = 60.0,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self.scale: float = 1.0
+        """Adaptive multiplier on the refill rate, in (0, 1]."""
+        self.paused_until: float = 0.0
+
+        self.throttled: int = 0
+        """Number of 429 responses seen."""
+
+    @classmethod
+    def from_settings(cls, settings: Settings) -> "RateLimiter":
+        return cls(
+            requests_per_minute=settings.OPENAI_REQUESTS_PER_MINUTE,
+            tokens_per_minute=settings.OPENAI_TOKENS_PER_MINUTE,
+        )
+
+    async def acquire(self, tokens: int):
+        """Wait until both one request and `tokens` tokens fit in the budget, then spend them."""
+        while True:
+            wait = max(
+                self.paused_until - time.monotonic(),
+                self.requests.wait_time(1, self.scale),
+                self.tokens.wait_time(tokens, self.scale),
+            )
+            if wait <= 0:
+                # no await between checking and consuming, so this is atomic on the loop
+                self.requests.consume(1)
+                self.tokens.consume(tokens)
+                return
+            await asyncio.sleep(wait)
+
+    def update_from_headers(self, headers: Mapping[str, str]):
+        def number(key: str) -> Optional[float]:
+            value = headers.get(key)
+            return float(value) if value is not None else None
+
+        self.requests.sync(
+            number("x-ratelimit-limit-requests"),
+            number("x-ratelimit-remaining-requests"),
+        )
+        self.tokens.sync(
+            number("x-ratelimit-limit-tokens"),
+            number("x-ratelimit-remaining-tokens"),
+        )
+
+        # if a budget is spent, nobody should send anything until it resets
+        for kind in ["requests", "tokens"]:
+            if number(f"x-ratelimit-remaining-{kind}") == 0 and (
+                reset := headers.get(f"x-ratelimit-reset-{kind}")
+            ):
+                self.paused_until = max(
+                    self.paused_until, time.monotonic() + parse_duration(reset)
+                )
+
+    def retry_delay(self, attempt: int, requested: Optional[float] = None) -> float:
+        """Exponential backoff with jitter, but at least what the server asked for."""
+        delay = min(self.max_delay, self.base_delay * 2**attempt)
+        # jitter so that pipelines throttled together don't retry together
+        delay = random.uniform(delay / 2, delay)
+        if requested is not None:
+            delay = max(delay, requested)
+        return delay
+
+    def backoff(self, attempt: int, requested: Optional[float] = None) -> float:
+        """Pause all callers after a 429, returning the delay applied."""
+        self.throttled += 1
+        self.scale = max(0.1, self.scale / 2)
+
+        delay = self.retry_delay(attempt, requested)
+        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+        return delay
+
+    def succeeded(self):
+        self.scale = min(1.0, self.scale + 0.1)
+
+    async def call(self, fn: Callable[[], Awaitable[T]], tokens: int) -> T:
+        """
+        Invoke `fn` within the rate budget, retrying on 429s and transient failures.
+
+        A 429 slows every caller down; a 5xx, dropped connection or timeout is only this
+        request's problem, so just it waits before retrying.
+
+        Args:
+            fn: Zero-argument coroutine function that performs the request.
+            tokens: Estimated tokens the request will consume.
+
+        Returns:
+            The result of `fn`.
+        """
+        attempt = 0
+        while True:
+            await self.acquire(tokens)
+            try:
+                result = await fn()
+            except openai.RateLimitError as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.backoff(attempt, retry_after(e.response.headers))
+                attempt += 1
+                print(f"Rate limited; retry {attempt} in {delay:.1f}s")
+                continue
+            except TRANSIENT_ERRORS as e:
+                if attempt >= self.max_retries:
+                    raise
+                delay = self.retry_delay(attempt)
+                attempt += 1
+                print(f"{e.__class__.__name__}; retry {attempt} in {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            self.succeeded()
+            return result
+
+
+@functools.lru_cache(None)
+def default_limiter() -> RateLimiter:
+    """The process-wide rate limiter, configured from the environment."""
+    return RateLimiter.from_settings(Settings.shared())
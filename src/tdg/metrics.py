@@ -0,0 +1,109 @@
+"""
+Latency, token usage and cost records for LLM calls, aggregated per agent, pipeline and run.
+"""
+
+from collections import defaultdict
+from typing import Callable, Iterable
+
+from pydantic import BaseModel
+
+MODEL_PRICES: dict[str, tuple[float, float]] = {
+    "gpt-4-turbo-preview": (10.0, 30.0),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-4o": (5.0, 15.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+}
+"""USD per million (prompt, completion) tokens, by model."""
+BATCH_DISCOUNT = 0.5
+"""Fraction of the price the Batch API charges."""
+
+
+class CallRecord(BaseModel):
+    """One agent request, whether answered by the LLM or the completion cache."""
+
+    agent: str
+    pipeline_id: str
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    """Wall-clock seconds, including rate limiting and retries."""
+    cache_hit: bool = False
+    replayed: bool = False
+    """Served from a cassette, see tdg.cassette."""
+    batched: bool = False
+    """Answered by a batch job, see tdg.batch, which is billed at half price."""
+    retries: int = 0
+    local_repairs: int = 0
+    """Retries avoided by repairing the response locally instead of asking the LLM again."""
+    estimated: bool = False
+    """Token counts were estimated, e.g. for streamed responses that do not report usage."""
+
+    @property
+    def cost(self) -> float:
+        """Spend in USD; 0 for cache hits, replays and unknown models."""
+        if self.cache_hit or self.replayed or self.model not in MODEL_PRICES:
+            return 0.0
+        prompt_price, completion_price = MODEL_PRICES[self.model]
+        cost = (
+            self.prompt_tokens * prompt_price
+            + self.completion_tokens * completion_price
+        ) / 1_000_000
+        return cost * BATCH_DISCOUNT if self.batched else cost
+
+
+class UsageSummary(BaseModel):
+    calls: int = 0
+    cache_hits: int = 0
+    replays: int = 0
+    batched: int = 0
+    retries: int = 0
+    local_repairs: int = 0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    latency: float = 0.0
+    """Summed seconds across calls; concurrent calls overlap, so this exceeds wall-clock."""
+    max_latency: float = 0.0
+    cost: float = 0.0
+
+    @classmethod
+    def of(cls, records: Iterable[CallRecord]) -> "UsageSummary":
+        summary = cls()
+        for record in records:
+            summary.calls += 1
+            summary.cache_hits += record.cache_hit
+            summary.replays += record.replayed
+            summary.batched += record.batched
+            summary.retries += record.retries
+            summary.local_repairs += record.local_repairs
+            summary.prompt_tokens += record.prompt_tokens
+            summary.completion_tokens += record.completion_tokens
+            summary.latency += record.latency
+            summary.max_latency = max(summary.max_latency, record.latency)
+            summary.cost += record.cost
+        return summary
+
+
+def summarize_by(
+    records: Iterable[CallRecord], key: Callable[[CallRecord], str]
+) -> dict[str, UsageSummary]:
+    groups: dict[str, list[CallRecord]] = defaultdict(list)
+    for record in records:
+        groups[key(record)].append(record)
+    return {name: UsageSummary.of(group) for name, group in sorted(groups.items())}
+
+
+def usage_report(records: list[CallRecord]) -> dict:
+    """JSON-ready totals, broken down by agent and by pipeline."""
+    return {
+        "total": UsageSummary.of(records).model_dump(),
+        "by_agent": {
+            name: summary.model_dump()
+            for name, summary in summarize_by(records, lambda r: r.agent).items()
+        },
+        "by_pipeline": {
+            name: summary.model_dump()
+            for name, summary in summarize_by(records, lambda r: r.pipeline_id).items()
+        },
+    }
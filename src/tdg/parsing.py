@@ -3,10 +3,12 @@ import ast
 import functools
 import importlib
 import importlib.util
+import io
 import re
 import textwrap
+import tokenize
 from pathlib import Path
-from typing import Union, Any, Type, Unpack
+from typing import Union, Any, Type, Unpack, Optional
 
 import black
 import yaml
@@ -25,12 +27,25 @@ def dump_ast(node: ast.AST) -> str:
     return ast.dump(node, indent=4)
 
 
+def normalize_code(code: str) -> str:
+    """Normalize a code string to its AST dump, erasing formatting and comments."""
+    return dump_ast(parse_code(code))
+
+
 def code_eq(a: str, b: str) -> bool:
     """Compare two code strings for functional equivalence by parsing their abstract syntax trees."""
-    a_parsed = dump_ast(parse_code(a))
-    b_parsed = dump_ast(parse_code(b))
+    return normalize_code(a) == normalize_code(b)
+
 
-    return a_parsed == b_parsed
+def dedupe_code(*codes: str) -> list[str]:
+    """Drop code strings that are AST-identical to an earlier one, preserving order."""
+    seen: set[str] = set()
+    unique = []
+    for code in codes:
+        if (normalized := normalize_code(code)) not in seen:
+            seen.add(normalized)
+            unique.append(code)
+    return unique
 
 
 def is_valid_python(code: str) -> tuple[bool, Union[ast.AST, SyntaxError]]:
@@ -83,6 +98,14 @@ def extract_imports(code: str, **kwargs: Unpack[FinderConfig]) -> list[str]:
     )
 
 
+def bound_names(node: ast.Import | ast.ImportFrom) -> list[str]:
+    return [
+        alias.asname or alias.name.split(".")[0]
+        for alias in node.names
+        if alias.name != "*"
+    ]
+
+
 def extract_and_filter_imports(
     code: str, invert: bool = False
 ) -> tuple[list[str], list[str]]:
@@ -270,5 +293,131 @@ def clean_openai_code_or_error(code: str) -> str:
         ) from ast_or_error
 
 
+def split_streamed_code(text: str) -> tuple[list[str], Optional[str]]:
+    """
+    Split a partially streamed generation into its closed ```python blocks and the block
+    still being written, if any.
+
+    Args:
+        text: The generation so far.
+
+    Returns:
+        list[str], Optional[str]: The closed code blocks, and the contents of the open block.
+    """
+    closed, end = [], 0
+    for match in python_pattern.finditer(text):
+        closed.append(match.group(1))
+        end = match.end()
+
+    open_at = text.find("```python", end)
+    if open_at == -1:
+        return closed, None
+    return closed, text[open_at + len("```python") :]
+
+
+@functools.lru_cache(None)
+def _closed_blocks_repairable(blocks: tuple[str, ...]) -> bool:
+    """Whether repair.repair_code can make valid code from closed blocks, without the LLM."""
+    # repair builds on this module
+    from tdg import repair
+
+    fenced = nl_join(*[f"```python{block}```" for block in blocks])
+    repaired = repair.repair_code(fenced)
+    return repaired.code is not None and not repaired.bad_imports
+
+
+# lines at the margin that carry on the statement before them
+_continuations = (")", "]", "}", "#", "else", "elif", "except", "finally")
+# what a parse error says when the code is cut short, rather than wrong
+_cut_short = ("never closed", "unterminated", "unexpected EOF")
+
+
+def complete_statements(code: str) -> str:
+    """
+    The top-level statements of partially written code that are known to be complete: those
+    followed by a line at the margin that starts another.
+    """
+    lines = code[: code.rfind("\n") + 1].splitlines(keepends=True)
+    end, previous = 0, ""
+    for idx, line in enumerate(lines):
+        if not line[:1].strip() or line.startswith(_continuations):
+            continue
+        # a decorator's statement goes on past the next line
+        if idx and not previous.startswith("@"):
+            end = idx
+        previous = line
+    return "".join(lines[:end])
+
+
+def complete_import_lines(code: str) -> list[str]:
+    """The fully written, single-line import statements in partially written code."""
+    return [
+        line.strip()
+        for line in code.splitlines(keepends=True)
+        if line.endswith("\n")
+        and line.lstrip().startswith(("import ", "from "))
+        and line.count("(") == line.count(")")
+        and not line.rstrip().endswith("\\")
+    ]
+
+
+def uses_unavailable_import(code: str) -> bool:
+    """Whether a completed line of partially written code uses a name an unavailable import binds."""
+    _, bad_imports = filter_imports(*complete_import_lines(code))
+    unavailable = {
+        name
+        for statement in bad_imports
+        for node in extract_imports(statement, as_node=True)
+        for name in bound_names(node)
+    }
+    if not unavailable:
+        return False
+
+    rest = "".join(
+        line
+        for line in code[: code.rfind("\n") + 1].splitlines(keepends=True)
+        if line.strip() not in bad_imports
+    )
+    used, previous = set(), None
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(rest).readline):
+            # not an attribute, e.g. the numpy in x.numpy
+            if token.type == tokenize.NAME and previous != ".":
+                used.add(token.string)
+            previous = token.string
+    except (tokenize.TokenError, SyntaxError):
+        # the code is cut short; what was read so far still counts
+        pass
+    return bool(unavailable & used)
+
+
+def streamed_code_is_valid(text: str) -> bool:
+    """
+    Check a partially streamed generation for problems that neither finishing it nor
+    repair.repair_code can fix, so the stream can stop as soon as one shows up.
+
+    Closed ```python blocks must be repairable into valid python using only available modules.
+    In the block still being written, every completed top-level statement must be repairable
+    too, and no completed line may use a name bound by an unavailable import; an unused one
+    may yet be dropped.
+
+    Args:
+        text: The generation so far.
+
+    Returns:
+        bool: False if the generation is already known to be invalid.
+    """
+    closed, open_block = split_streamed_code(text)
+    blocks = tuple(closed)
+    if open_block:
+        if uses_unavailable_import(open_block):
+            return False
+        if (complete := complete_statements(open_block)).strip():
+            valid, error = is_valid_python(complete)
+            if valid or not any(cut in error.msg for cut in _cut_short):
+                blocks += (complete,)
+    return not blocks or _closed_blocks_repairable(blocks)
+
+
 def nl_join(*args: str) -> str:
     return "\n".join(args)
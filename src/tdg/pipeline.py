@@ -1,14 +1,25 @@
+import asyncio
+import json
 import uuid
-from pathlib import Path
-from typing import Callable, Any, Optional, Type
-
-import aiofiles
+from typing import Awaitable, Callable, Any, Optional, Type, TypeVar
 
 from tdg import parsing
-from tdg.agents import NavAgent, TestAgent, DevAgent
-from tdg.agents.base import CodeContext, Agent
+from tdg.agents import NavAgent, TestAgent, DevAgent, DraftDevAgent
+from tdg.agents.base import CodeContext, Agent, AgentConfig, Message
+from tdg.artifacts import ArtifactStore, default_artifact_store
+from tdg.backends.base import Backend
+from tdg.budget import Budget, BudgetExceeded
+from tdg.cache import CompletionCache, ReportCache, default_report_cache
+from tdg.cassette import CassetteDeck, CassetteMiss
+from tdg.clients import ClientRegistry
+from tdg.limits import RateLimiter
+from tdg.metrics import CallRecord, usage_report
 from tdg.parsing import nl_join
-from tdg.executors.test import TestExecutor
+from tdg.executors.resources import TIMEOUT_OUTCOME
+from tdg.executors.test import Runner, TestExecutor, TestReport
+from tdg.graph import TaskGraph
+
+T = TypeVar("T")
 
 
 class GenerationError(BaseException):
@@ -18,18 +29,72 @@ class GenerationError(BaseException):
 # TODO: adapt for multiple tests (*tests)
 class Pipeline:
     def __init__(
-        self, test_fn: Callable[[Any], Any], from_id: str = "", max_iter: int = 5
+        self,
+        test_fn: Callable[[Any], Any],
+        from_id: str = "",
+        max_iter: int = 5,
+        cache: Optional[CompletionCache] = None,
+        clients: Optional[ClientRegistry] = None,
+        limiter: Optional[RateLimiter] = None,
+        n_candidates: int = 1,
+        context_budget: Optional[int] = None,
+        backend: Optional[Backend] = None,
+        speculative: bool = False,
+        cassettes: Optional[CassetteDeck] = None,
+        budget: Optional[Budget] = None,
+        artifacts: Optional[ArtifactStore] = None,
+        runner: Optional[Runner] = None,
+        failing_first: bool = True,
+        rank_maxfail: Optional[int] = None,
+        report_cache: Optional[ReportCache] = None,
     ):
         self.code_context = CodeContext(test_fn)
+        self.cache = cache
+        self.clients = clients
+        self.limiter = limiter
+        self.backend = backend
+        self.cassettes = cassettes
+        self.budget = budget or Budget(name="pipeline")
+        """Time and tokens this pipeline may spend; see gen for what happens when they run out."""
+        self.stop_reason: Optional[str] = None
+        """Why generation stopped before the tests passed or max_iter was reached, if it did."""
+        self.artifacts = (
+            artifacts if artifacts is not None else default_artifact_store()
+        )
+        """Where the scripts tested, their reports and the final agent histories are kept."""
+        self.runner = runner
+        """Runs test scripts; a fresh pytest process per script if None."""
+        self.failing_first = failing_first
+        """
+        Run the tests the last solution failed first, and the rest only once those pass, so a
+        repair round that didn't fix them costs a fraction of the suite.
+        """
+        self.rank_maxfail = rank_maxfail
+        """When testing several candidates, stop each one's tests after this many failures."""
+        self.failing: list[str] = []
+        """Names of the tests the kept solution failed."""
+        self.report_cache = (
+            report_cache if report_cache is not None else default_report_cache()
+        )
+        """Reports of scripts already tested, by this or any other pipeline or run."""
+        self.failed_solutions: set[str] = set()
+        """Normalized solutions this pipeline kept and saw fail, to notice it going in circles."""
         self._id = from_id if from_id else str(uuid.uuid4())
-        self._log_path = Path.home() / ".tdg" / self._id
-        self._log_path.mkdir(exist_ok=True, parents=True)
 
         self.max_iter = max_iter
+        self.n_candidates = n_candidates
+        """Implementations the Developer samples per request; all distinct ones are tested."""
+        self.context_budget = context_budget
+        """Estimated token budget per agent request, windowing long repair conversations."""
+        self.speculative = speculative
+        """Draft the implementation while the tests are being written, see stage_graph."""
 
         self.nav: Optional[NavAgent] = None
         self.test: Optional[TestAgent] = None
         self.dev: Optional[DevAgent] = None
+        self.draft: Optional[DraftDevAgent] = None
+        self.responses: dict[str, Message] = {}
+        """Each finished stage's validated response."""
 
         self.best_solution_failures: int = 9999999
         self.best_solution: str = ""
@@ -37,59 +102,261 @@ class Pipeline:
     def __repr__(self):
         return f"Pipeline({self._id})"
 
+    @property
+    def calls(self) -> list[CallRecord]:
+        """Every LLM request made by this pipeline's agents."""
+        agents = [self.nav, self.test, self.draft, self.dev]
+        return [call for agent in agents if agent for call in agent.calls]
+
+    def usage(self) -> dict:
+        return usage_report(self.calls)
+
     async def create_agent(self, cls: Type[Agent], **kwargs) -> Agent:
-        agent = cls(**kwargs)
+        agent = cls(
+            cache=self.cache,
+            clients=self.clients,
+            limiter=self.limiter,
+            context_budget=self.context_budget,
+            backend=self.backend,
+            cassette=self.cassettes.for_pipeline(self._id) if self.cassettes else None,
+            budget=self.budget,
+            **kwargs,
+        )
         agent.pipeline_id = self._id
         await agent.load_state()
         return agent
 
+    STAGES = ("nav", "test", "dev")
+    """Agent stages, in order; each names the attribute its agent is stored on."""
+
+    async def start_stage(self, stage: str) -> Agent:
+        """Create the agent for a stage from the responses of the stages before it."""
+        match stage:
+            case "nav":
+                self.nav = await self.create_agent(
+                    NavAgent, code_context=self.code_context
+                )
+            case "test":
+                self.test = await self.create_agent(
+                    TestAgent,
+                    nav_response=self.responses["nav"],
+                    code_context=self.code_context,
+                )
+            case "dev":
+                self.dev = await self.create_agent(
+                    DevAgent,
+                    test_response=self.responses["test"],
+                    code_context=self.code_context,
+                    config=self.dev_config(),
+                )
+            case "draft":
+                self.draft = await self.create_agent(
+                    DraftDevAgent,
+                    nav_response=self.responses["nav"],
+                    code_context=self.code_context,
+                    config=self.dev_config(),
+                )
+            case _:
+                raise ValueError(f"Unknown pipeline stage: {stage}")
+        return getattr(self, stage)
+
+    async def finish_stage(self, stage: str) -> Message:
+        """Generate the stage agent's response to its initial prompt."""
+        agent = getattr(self, stage)
+        self.responses[stage] = await agent.generate(agent.user_prompt())
+        return self.responses[stage]
+
+    def dev_config(self) -> AgentConfig:
+        return AgentConfig(n=self.n_candidates if self.n_candidates > 1 else None)
+
+    async def run_stage(self, stage: str) -> Message:
+        await self.start_stage(stage)
+        return await self.finish_stage(stage)
+
+    def stage_graph(self) -> TaskGraph:
+        """
+        The stages as a dependency graph, each started as soon as the responses it needs exist.
+
+        When speculative, the Developer drafts from the user's tests and the Navigator's reasoning
+        while the Test Designer writes; the draft then stands in for the Developer's first response,
+        saving a round trip whenever it already passes the generated tests (and being repaired as
+        usual when it doesn't).
+        """
+        graph = TaskGraph()
+        graph.add("nav", lambda: self.run_stage("nav"))
+        graph.add("test", lambda: self.run_stage("test"), after=["nav"])
+        if self.speculative:
+            graph.add("draft", lambda: self.run_stage("draft"), after=["nav"])
+            graph.add("dev", self.adopt_draft, after=["test", "draft"])
+        else:
+            graph.add("dev", lambda: self.run_stage("dev"), after=["test"])
+        return graph
+
+    async def adopt_draft(self) -> Message:
+        """Start the Developer from the draft, rather than asking it for a first response."""
+        dev = await self.start_stage("dev")
+        prompt = dev.user_prompt()
+        # unless a previous run already has the Developer's own answer
+        if prompt not in dev.history.memory:
+            draft = self.responses["draft"]
+            dev.history.messages.extend([Message.user(prompt), draft])
+            dev.history.memory[prompt] = draft
+            await dev.save_state()
+
+        response = await self.finish_stage("dev")
+        dev.candidates = parsing.dedupe_code(*dev.candidates, *self.draft.candidates)
+        return response
+
     async def gen(self, no_test: bool = False) -> tuple[str, Optional[str]]:
-        print(f"Starting pipeline for context {self.code_context.signatures}")
-        self.nav = await self.create_agent(NavAgent, code_context=self.code_context)
-        nav_response = await self.nav.generate(self.nav.user_prompt())
+        """
+        Run every stage, then test and repair the implementation.
 
-        self.test = await self.create_agent(
-            TestAgent, nav_response=nav_response, code_context=self.code_context
-        )
-        test_response = await self.test.generate(self.test.user_prompt())
+        Once the budget's deadline passes, in-flight requests and test runs are cancelled; once its
+        tokens are spent, no further requests are made. Either way the best solution so far is
+        returned, and the reason kept in stop_reason.
+        """
+        print(f"Starting pipeline for context {self.code_context.signatures}")
+        try:
+            result = await self.budgeted(lambda: self._gen(no_test))
+        finally:
+            await self.archive_histories()
+        return result or (self._id, self.best_solution)
 
-        self.dev = await self.create_agent(
-            DevAgent, test_response=test_response, code_context=self.code_context
-        )
-        dev_response = await self.dev.generate(self.dev.user_prompt())
+    async def _gen(self, no_test: bool) -> tuple[str, Optional[str]]:
+        await self.stage_graph().run()
 
         if no_test:
             return self._id, None
 
+        return await self.refine()
+
+    async def budgeted(self, step: Callable[[], Awaitable[T]]) -> Optional[T]:
+        """
+        Run a step of generation within the budget, starting its clock if it isn't running.
+
+        Returns None if the budget runs out first, with the reason kept in stop_reason; the step
+        is cancelled, and best_solution is what the pipeline has to show for it.
+        """
+        self.budget.start()
+        try:
+            self.budget.check()
+            async with asyncio.timeout(self.budget.remaining_time()):
+                return await step()
+        except TimeoutError:
+            self.stop_reason = self.budget.exhausted() or "deadline passed"
+        except BudgetExceeded as e:
+            self.stop_reason = e.reason
+
+        print(f"{self}: stopped early, {self.stop_reason}")
+        return None
+
+    async def refine(self) -> tuple[str, Optional[str]]:
+        """Test the Developer's response, repairing it until the suite passes."""
         return self._id, await self.test_until_passing(
-            solution=dev_response.content,
+            solution=self.responses["dev"].content,
             depth=0,
+            candidates=self.dev.candidates,
+        )
+
+    async def run_tests(
+        self, solution: str, depth: int, maxfail: Optional[int] = None
+    ) -> TestExecutor:
+        tests = self.test.tests + self.code_context.test_sources
+        imports = self.test.imports
+
+        script = parsing.compile_tests(
+            tests=tests,
+            imports=imports,
+            implementations=[solution],
+        )
+
+        uuid_small = str(uuid.uuid4()).replace("-", "")[:8]
+        name = f"iter_{depth}_{uuid_small}"
+        await self.artifacts.aput(self._id, "script", name, script)
+
+        # pytest runs the script from a temporary directory, removed once it's done
+        tester = await TestExecutor(
+            script=script,
+            runner=self.runner,
+            first=self.failing if self.failing_first else None,
+            maxfail=maxfail,
+            cache=self.report_cache,
+        ).test()
+        report = {
+            "exitcode": tester.exit_code,
+            "complete": tester.complete,
+            "tests": [
+                test.model_dump()
+                for test in tester.tracker.failures + tester.tracker.successes
+            ],
+        }
+        await self.artifacts.aput(self._id, "report", name, json.dumps(report))
+        return tester
+
+    async def archive_histories(self):
+        """Keep each agent's final message chain in the artifact store."""
+        for stage in ("nav", "test", "draft", "dev"):
+            if agent := getattr(self, stage):
+                await self.artifacts.aput(
+                    self._id,
+                    "history",
+                    agent.cache_key,
+                    agent.history.model_dump_json(),
+                )
+
+    async def rank_candidates(
+        self, candidates: list[str], depth: int
+    ) -> tuple[str, TestExecutor]:
+        """
+        Test all candidates concurrently, returning the one with the fewest failures.
+
+        Failure counts of incomplete runs are lower bounds, so on a tie a complete run wins.
+        """
+        maxfail = self.rank_maxfail if len(candidates) > 1 else None
+        outcomes = await asyncio.gather(
+            *[self.run_tests(candidate, depth, maxfail) for candidate in candidates],
+            return_exceptions=True,
+        )
+        ranked = [
+            (candidate, tester)
+            for candidate, tester in zip(candidates, outcomes)
+            if isinstance(tester, TestExecutor)
+        ]
+        if not ranked:
+            raise outcomes[0]
+        return min(
+            ranked,
+            key=lambda ranking: (ranking[1].n_failures(), not ranking[1].complete),
         )
 
-    async def test_until_passing(self, *, solution: str, depth: int) -> Optional[str]:
+    @staticmethod
+    def describe_failure(fail: TestReport) -> str:
+        """A failure as fed back to the Developer; timeouts are called out as such."""
+        if fail.outcome == TIMEOUT_OUTCOME:
+            return nl_join(f"{fail.nodeid} TIMED OUT:", fail.longrepr or "")
+        return fail.longrepr or f"{fail.nodeid} {fail.outcome}"
+
+    async def test_until_passing(
+        self, *, solution: str, depth: int, candidates: Optional[list[str]] = None
+    ) -> Optional[str]:
         print(f"TEST ITER: {depth + 1}")
         if depth > self.max_iter:
             # give up, and return the best solution that we have.
             return self.best_solution
         try:
-            tests = self.test.tests + self.code_context.test_sources
-            imports = self.test.imports
-
-            script = parsing.compile_tests(
-                tests=tests,
-                imports=imports,
-                implementations=[solution],
-            )
-
-            uuid_small = str(uuid.uuid4()).replace("-", "")[:8]
-
-            script_log_file = self._log_path / f"script_iter_{depth}_{uuid_small}.py"
-            async with aiofiles.open(script_log_file, "w") as f:
-                await f.write(script)
+            candidates = parsing.dedupe_code(solution, *(candidates or []))
+            solution, tester = await self.rank_candidates(candidates, depth)
+            if len(candidates) > 1:
+                print(f"{self}: picked 1 of {len(candidates)} candidates")
+                # continue the conversation from the candidate we're keeping
+                self.dev.history.replace_last_response(solution)
 
-            tester = TestExecutor(script=script, path=script_log_file)
-            await tester.test()
-            if (n_fail := tester.n_failures()) < self.best_solution_failures:
+            self.failing = tester.failed_tests()
+            n_fail = tester.n_failures()
+            # an incomplete run's count is only a lower bound, not worth replacing a known best
+            if n_fail < self.best_solution_failures and (
+                tester.complete or not self.best_solution
+            ):
                 self.best_solution = solution
                 self.best_solution_failures = n_fail
                 print(
@@ -98,20 +365,36 @@ class Pipeline:
 
             if n_fail == 0:
                 return solution
-            else:
-                # tests failed
-                sep = "-----"
-                fail_message = nl_join(
-                    "Your implementation failed the test suite with the following errors:",
-                    *[nl_join(fail.longrepr, sep) for fail in tester.tracker.failures],
-                    sep,
-                    "Please fix your implementation.",
-                )
 
-                refined = await self.dev.generate(fail_message)
-                return await self.test_until_passing(
-                    solution=refined.content, depth=depth + 1
-                )
+            normalized = parsing.normalize_code(solution)
+            if normalized in self.failed_solutions:
+                # the Developer is going in circles, and would keep on doing so
+                self.stop_reason = "the Developer repeated an earlier failing solution"
+                print(f"{self}: stopped early, {self.stop_reason}")
+                return self.best_solution
+            self.failed_solutions.add(normalized)
+
+            # tests failed
+            sep = "-----"
+            fail_message = nl_join(
+                "Your implementation failed the test suite with the following errors:",
+                *[
+                    nl_join(self.describe_failure(fail), sep)
+                    for fail in tester.tracker.failures
+                ],
+                sep,
+                "Please fix your implementation.",
+            )
+
+            refined = await self.dev.generate(fail_message)
+            return await self.test_until_passing(
+                solution=refined.content,
+                depth=depth + 1,
+                candidates=self.dev.candidates,
+            )
+        except (BudgetExceeded, CassetteMiss, asyncio.CancelledError):
+            # out of time or tokens, or a replay went off script; gen decides what to return
+            raise
         except BaseException:
             # something is broken, don't ruin the other pipelines
             return self.best_solution
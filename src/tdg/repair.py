@@ -0,0 +1,226 @@
+"""
+Deterministic fixes for common flaws in generated code, tried before asking the LLM to retry.
+
+Every repair here only removes what the code doesn't need: lines of prose, when dropping them
+makes the code parse; stray indentation; and imports whose names are never used. Each step's
+result is parsed again, so a repaired generation is valid python that means what the LLM meant;
+anything else, e.g. a real syntax error, is left for the LLM to fix.
+"""
+
+import ast
+import keyword
+import re
+import textwrap
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from tdg import parsing
+from tdg.extract import get_node_source
+
+MAX_PROSE_LINES = 20
+"""Give up on prose stripping after this many lines; the generation is probably not code."""
+
+_bare_fence_pattern = re.compile(r"```\n(.*?)```", re.DOTALL)
+_prose_pattern = re.compile(
+    r"^(```.*"  # a stray fence
+    r"|[-*+] .*"  # a markdown bullet
+    r"|\d+[.)] .*"  # a numbered step
+    r"|\*\*.*"  # bold text
+    r"|[A-Za-z][^\s=]*(\s+[^\s=]+){2,})$"  # a sentence of three or more words
+)
+
+
+class Repair(BaseModel):
+    code: Optional[str] = None
+    """The repaired code, or None if it still isn't valid python."""
+    fixes: list[str] = Field(default_factory=list)
+    """What was changed, for logging."""
+    bad_imports: list[str] = Field(default_factory=list)
+    """Unavailable imports that are still needed, which only the LLM can replace."""
+
+
+def extract_code(text: str) -> str:
+    """
+    The fenced code in a generation (```python blocks, else untagged ones), or all of it.
+
+    Blocks fenced as another language, e.g. ```bash, are never python.
+    """
+    if matches := parsing.python_pattern.findall(text):
+        return parsing.nl_join(*matches)
+    if matches := _bare_fence_pattern.findall(text):
+        return parsing.nl_join(*matches)
+    return text
+
+
+def is_valid_code(code: str) -> bool:
+    """Whether code is valid python that does something, i.e. isn't empty."""
+    return bool(code.strip()) and parsing.is_valid_python(code)[0]
+
+
+def is_prose(line: str) -> bool:
+    """Whether a line that broke parsing reads as text rather than as (broken) code."""
+    stripped = line.strip()
+    if not stripped or stripped.startswith("#"):
+        return False
+    if keyword.iskeyword(stripped.split()[0].rstrip(":")):
+        return False
+    # e.g. print(a, b, c), or a line continuing onto the next
+    if parsing.is_valid_python(stripped)[0] or stripped.endswith(
+        (",", "(", "[", "{", "\\")
+    ):
+        return False
+    return bool(_prose_pattern.match(stripped))
+
+
+def strip_prose(code: str) -> tuple[str, int]:
+    """
+    Drop lines of prose that stop the code from parsing, one syntax error at a time.
+
+    Prose is often flush left of indented code, so the code is checked as if dedented. Lines are
+    only dropped if the code then parses; otherwise it is returned as it was.
+
+    Returns:
+        str, int: The code, and the number of lines dropped.
+    """
+    lines = code.splitlines()
+    dropped = 0
+    while dropped < MAX_PROSE_LINES:
+        try:
+            ast.parse(textwrap.dedent("\n".join(lines)))
+            break
+        except SyntaxError as e:
+            # the culprit is the reported line, or for an unclosed statement the one before it
+            candidates = [e.lineno, e.lineno - 1] if e.lineno else []
+            if isinstance(e, IndentationError):
+                # or flush left prose, which stops the code below it from being dedented
+                candidates += [
+                    idx + 1
+                    for idx, line in enumerate(lines)
+                    if line and not line[0].isspace()
+                ]
+            culprit = next(
+                (
+                    lineno
+                    for lineno in candidates
+                    if 0 < lineno <= len(lines) and is_prose(lines[lineno - 1])
+                ),
+                None,
+            )
+            if culprit is None:
+                return code, 0
+            del lines[culprit - 1]
+            dropped += 1
+    stripped = "\n".join(lines) + "\n"
+    if dropped and not is_valid_code(textwrap.dedent(stripped)):
+        return code, 0
+    return stripped, dropped
+
+
+def drop_unused_imports(code: str, bad_imports: list[str]) -> tuple[str, list[str]]:
+    """
+    Remove the given imports wherever none of the names they bind are used.
+
+    An import that was the only statement of its block, e.g. in a try, is replaced with `pass`;
+    one sharing its line with another statement is left alone.
+
+    Returns:
+        str, list[str]: The code, and the imports that are used (so could not be removed).
+    """
+    tree = ast.parse(code)
+    bad = set(bad_imports)
+    used = {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)} | {
+        # names referenced in string annotations, __all__ and the like
+        word
+        for node in ast.walk(tree)
+        if isinstance(node, ast.Constant) and isinstance(node.value, str)
+        for word in re.findall(r"\w+", node.value)
+    }
+
+    statements = [node for node in ast.walk(tree) if isinstance(node, ast.stmt)]
+    # every statement list, including the bodies of except clauses
+    blocks = [
+        block
+        for node in ast.walk(tree)
+        for field in ("body", "orelse", "finalbody")
+        if isinstance(block := getattr(node, field, None), list)
+    ]
+
+    lines = code.splitlines()
+    removed: list[ast.stmt] = []
+    still_bad = []
+    for node in statements:
+        if not isinstance(node, (ast.Import, ast.ImportFrom)):
+            continue
+        source = get_node_source(code, node)
+        if source not in bad:
+            continue
+        names = parsing.bound_names(node)
+        # e.g. `import x; y = 1` or `try: import x`, where dropping the line drops more
+        shares_a_line = any(
+            other is not node
+            and other.lineno <= node.end_lineno
+            and node.lineno <= other.end_lineno
+            and (other.lineno == node.lineno or node not in ast.walk(other))
+            for other in statements
+        )
+        # a star import binds names we can't see, so assume it is needed
+        if len(names) < len(node.names) or used.intersection(names) or shares_a_line:
+            still_bad.append(source)
+        else:
+            removed.append(node)
+
+    replace: dict[int, Optional[str]] = {}
+    for node in removed:
+        for idx in range(node.lineno - 1, node.end_lineno):
+            replace[idx] = None
+    for block in blocks:
+        if block and all(stmt in removed for stmt in block):
+            # keep the block's statement count above zero
+            first = block[0]
+            replace[first.lineno - 1] = " " * first.col_offset + "pass"
+
+    kept = [
+        replace.get(idx, line)
+        for idx, line in enumerate(lines)
+        if replace.get(idx, line) is not None
+    ]
+    return "\n".join(kept) + "\n", sorted(still_bad)
+
+
+def repair_code(text: str) -> Repair:
+    """
+    Turn a generation into valid python with only available imports, if that needs no judgement.
+
+    Args:
+        text: The LLM's response.
+
+    Returns:
+        Repair: The code and the fixes applied; or, if the LLM must be asked again, what is wrong.
+    """
+    repair = Repair()
+    code = extract_code(text)
+
+    if not is_valid_code(code):
+        code, dropped = strip_prose(code)
+        if dropped:
+            repair.fixes.append(f"stripped {dropped} prose lines")
+        if (dedented := textwrap.dedent(code)) != code:
+            repair.fixes.append("dedented")
+            code = dedented
+        if not is_valid_code(code):
+            return repair
+
+    _, bad_imports = parsing.extract_and_filter_imports(code)
+    if bad_imports:
+        without, still_bad = drop_unused_imports(code, bad_imports)
+        if is_valid_code(without):
+            code, repair.bad_imports = without, still_bad
+            if dropped_imports := sorted(set(bad_imports) - set(still_bad)):
+                repair.fixes.append(f"dropped unused imports {dropped_imports}")
+        else:
+            # not expected, but a broken repair must not stand in for the generation
+            repair.bad_imports = bad_imports
+
+    repair.code = code
+    return repair
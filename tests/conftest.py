@@ -0,0 +1,23 @@
+import pytest
+
+from tdg.artifacts import default_artifact_store
+from tdg.cache import default_completion_cache, default_report_cache
+
+DEFAULT_STORES = [
+    default_completion_cache,
+    default_report_cache,
+    default_artifact_store,
+]
+
+
+@pytest.fixture(autouse=True)
+def default_stores(tmp_path, monkeypatch):
+    """Keep the process-wide stores out of the real ~/.tdg, and apart between tests."""
+    monkeypatch.setenv("HOME", str(tmp_path / "home"))
+    for store in DEFAULT_STORES:
+        store.cache_clear()
+    yield
+    for store in DEFAULT_STORES:
+        if store.cache_info().currsize:
+            store().close()
+        store.cache_clear()
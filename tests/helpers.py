@@ -0,0 +1,38 @@
+from typing import Optional
+
+from openai.types.chat import ChatCompletion
+
+
+def factorial_test():
+    """
+    /gen
+    factorial:
+        - doc: An efficient implementation of the factorial function, e.g. X!.
+        - args:
+            - input: int
+        - returns: int
+    /end_gen
+    """
+    assert factorial(1) == 1
+    assert factorial(2) == 2 * 1
+    assert factorial(3) == 3 * 2 * 1
+
+
+def chat_completion(*contents: str, usage: Optional[dict] = None) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "usage": usage,
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4-turbo-preview",
+            "choices": [
+                {
+                    "index": idx,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+                for idx, content in enumerate(contents)
+            ],
+        }
+    )
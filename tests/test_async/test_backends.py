@@ -0,0 +1,115 @@
+import asyncio
+import importlib.util
+from typing import Any
+from unittest import mock
+
+import pytest
+
+from tdg.agents import NavAgent
+from tdg.agents.base import CodeContext
+from tdg.backends.hf_backend import BatchingBackend, Generated, HuggingFaceBackend
+from tdg.cache import CompletionCache
+from tests.helpers import factorial_test
+
+
+class EchoBackend(BatchingBackend):
+    """Answers each prompt with its length, recording the batches it was asked for."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.batches: list[list[str]] = []
+
+    def request_config(self, config: dict[str, Any]) -> dict[str, Any]:
+        return {**config, "model": "echo"}
+
+    def render(self, messages: list[dict[str, str]]) -> str:
+        return "\n".join(m["content"] for m in messages)
+
+    def generate_batch(
+        self, prompts: list[str], params: dict[str, Any]
+    ) -> list[Generated]:
+        self.batches.append(prompts)
+        n = params["n"] or 1
+        return [
+            Generated(
+                texts=[f"{len(prompt)}"] * n,
+                prompt_tokens=len(prompt),
+                completion_tokens=n,
+            )
+            for prompt in prompts
+        ]
+
+
+def nav_agent(backend, cache, pipeline_id: str) -> NavAgent:
+    context = CodeContext(factorial_test)
+    context.signatures = [f"def factorial_{pipeline_id}(x: int) -> int:"]
+    agent = NavAgent(context, pipeline_id=pipeline_id, cache=cache, backend=backend)
+    agent.save_state = mock.AsyncMock()
+    return agent
+
+
+async def test_concurrent_agents_share_a_batch(tmp_path):
+    backend = EchoBackend(max_batch_size=8, batch_window=0.05)
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    agents = [nav_agent(backend, cache, str(i)) for i in range(3)]
+
+    responses = await asyncio.gather(*[agent.generate() for agent in agents])
+
+    assert backend.batch_sizes == [3]
+    assert len(set(r.content for r in responses)) == 1
+    for agent in agents:
+        (call,) = agent.calls
+        assert call.model == "echo"
+        assert not call.estimated
+        assert call.completion_tokens == 1
+
+
+async def test_batches_are_capped_and_split_by_generation_params(tmp_path):
+    backend = EchoBackend(max_batch_size=2, batch_window=0.05)
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    agents = [nav_agent(backend, cache, str(i)) for i in range(4)]
+    agents[-1].config.n = 2
+
+    await asyncio.gather(*[agent.generate() for agent in agents])
+
+    assert sorted(backend.batch_sizes) == [1, 1, 2]
+    assert len(agents[-1].choices) == 2
+
+
+async def test_backend_failure_reaches_every_waiting_agent(tmp_path):
+    backend = EchoBackend(batch_window=0.01)
+    backend.generate_batch = mock.Mock(side_effect=RuntimeError("out of memory"))
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    agents = [nav_agent(backend, cache, str(i)) for i in range(2)]
+
+    outcomes = await asyncio.gather(
+        *[agent.generate() for agent in agents], return_exceptions=True
+    )
+
+    assert all(isinstance(outcome, RuntimeError) for outcome in outcomes)
+    assert len(cache) == 0
+
+
+def test_local_completions_are_cached_apart_from_the_api():
+    backend = HuggingFaceBackend("sshleifer/tiny-gpt2")
+    config = backend.request_config({"model": "gpt-4-turbo-preview", "stream": True})
+    assert config == {"model": "hf:sshleifer/tiny-gpt2", "stream": False}
+
+
+@pytest.mark.skipif(
+    not all(importlib.util.find_spec(name) for name in ["torch", "transformers"]),
+    reason="needs torch and transformers",
+)
+async def test_hugging_face_backend_generates_on_cpu():
+    backend = HuggingFaceBackend("sshleifer/tiny-gpt2", max_new_tokens=8)
+    messages = [[{"role": "user", "content": "def add(a, b):" * k}] for k in (1, 3)]
+
+    completions = await asyncio.gather(
+        *[backend.complete(m, backend.request_config({"n": 2})) for m in messages]
+    )
+
+    assert backend.batch_sizes == [2]
+    for completion in completions:
+        assert len(completion.choices) == 2
+        assert 0 < completion.completion_tokens <= 16
+    assert completions[0].prompt_tokens < completions[1].prompt_tokens
@@ -0,0 +1,133 @@
+import asyncio
+import time
+from typing import Any, Optional
+
+import pytest
+
+from tdg.backends.base import Backend, Completion, PartialValidator
+from tdg.budget import Budget, BudgetExceeded
+from tdg.cache import CompletionCache
+from tdg.executors.test import TestExecutor
+from tdg.generator import Generator
+from tdg.pipeline import Pipeline
+from tests.helpers import factorial_test
+
+
+class MeteredBackend(Backend):
+    """Answers after a delay, reporting a fixed token usage per request."""
+
+    def __init__(self, delay: float = 0.0, tokens: int = 100):
+        self.delay = delay
+        self.tokens = tokens
+        self.requests = 0
+        self.cancelled = 0
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        self.requests += 1
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return Completion(
+            choices=[{"role": "assistant", "content": "Use math.factorial."}],
+            prompt_tokens=self.tokens,
+            completion_tokens=0,
+        )
+
+
+def test_budget_reports_what_ran_out():
+    run = Budget(tokens=150, name="run")
+    pipeline = Budget(seconds=60, parent=run, name="pipeline")
+    pipeline.start()
+
+    assert pipeline.exhausted() is None
+    assert 59 < pipeline.remaining_time() <= 60
+    assert run.remaining_time() is None
+
+    pipeline.charge(100)
+    pipeline.check()
+    pipeline.charge(100)
+    assert run.used_tokens == 200
+    with pytest.raises(BudgetExceeded) as e:
+        pipeline.check()
+    assert e.value.reason == "run budget of 150 tokens spent"
+
+    late = Budget(seconds=0, name="pipeline")
+    late.start()
+    assert late.exhausted() == "pipeline deadline of 0s passed"
+
+
+async def test_deadline_cancels_in_flight_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    backend = MeteredBackend(delay=30)
+    pipeline = Pipeline(
+        factorial_test,
+        from_id="deadline",
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        backend=backend,
+        budget=Budget(seconds=0.2, name="pipeline"),
+    )
+
+    start = time.monotonic()
+    pipe_id, solution = await pipeline.gen()
+
+    assert time.monotonic() - start < 5
+    assert (pipe_id, solution) == ("deadline", "")
+    assert pipeline.stop_reason == "pipeline deadline of 0.2s passed"
+    assert backend.cancelled == 1
+
+
+async def test_spent_tokens_stop_further_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    backend = MeteredBackend(tokens=100)
+    pipeline = Pipeline(
+        factorial_test,
+        from_id="tokens",
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        backend=backend,
+        budget=Budget(tokens=50, name="pipeline"),
+    )
+
+    await pipeline.gen()
+
+    assert backend.requests == 1
+    assert pipeline.stop_reason == "pipeline budget of 50 tokens spent"
+
+
+async def test_cancelled_test_run_kills_pytest(tmp_path):
+    marker = tmp_path / "still_running"
+    script = (
+        "import time\n\n\n"
+        "def test_slow():\n"
+        "    time.sleep(1.5)\n"
+        f"    open({str(marker)!r}, 'w').close()\n"
+    )
+    tester = TestExecutor(script=script, path=tmp_path / "test_slow.py")
+    (tmp_path / "test_slow.py").write_text(script)
+
+    with pytest.raises(TimeoutError):
+        async with asyncio.timeout(0.5):
+            await tester.test()
+
+    await asyncio.sleep(2)
+    assert not marker.exists()
+
+
+async def test_generator_records_why_pipelines_stopped(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    gen = Generator(
+        factorial_test,
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        backend=MeteredBackend(tokens=100),
+        token_budget=50,
+    )
+
+    await gen._generate_all_pipelines()
+
+    assert list(gen.stop_reasons.values()) == ["run budget of 50 tokens spent"]
@@ -0,0 +1,65 @@
+from unittest import mock
+from unittest.mock import patch
+
+from tdg.agents import DevAgent
+from tdg.agents.base import AgentConfig, CodeContext, GenerationHistory, Message
+from tdg.cache import CompletionCache
+from tdg.limits import RateLimiter
+from tdg.pipeline import Pipeline
+from tests.helpers import chat_completion, factorial_test
+
+
+WRONG = "def factorial(input: int) -> int:\n    return input\n"
+RIGHT = "import math\n\n\ndef factorial(input: int) -> int:\n    return math.factorial(input)\n"
+RIGHT_REFORMATTED = "import math\ndef factorial( input: int ) -> int:\n    return (math.factorial(input))\n"
+INVALID = "def factorial(input: int) -> int\n    return input\n"
+UNAVAILABLE = "import bad_doesnt_exist\n\n\ndef factorial(input):\n    return bad_doesnt_exist.factorial(input)\n"
+
+
+async def test_dev_agent_keeps_distinct_valid_candidates(tmp_path):
+    dev = DevAgent(
+        Message.assistant("def test_factorial():\n    assert factorial(1) == 1\n"),
+        code_context=CodeContext(factorial_test),
+        config=AgentConfig(n=5),
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        limiter=RateLimiter(500, 300_000),
+    )
+    dev.save_state = mock.AsyncMock()
+    completion = chat_completion(WRONG, RIGHT, RIGHT_REFORMATTED, INVALID, UNAVAILABLE)
+    create = mock.AsyncMock(
+        return_value=mock.Mock(headers={}, parse=lambda: completion)
+    )
+
+    with patch.object(
+        dev.client.chat.completions, "with_raw_response", new=mock.Mock(create=create)
+    ):
+        response = await dev.generate()
+
+    assert create.await_args.kwargs["n"] == 5
+    assert len(dev.candidates) == 2
+    assert dev.candidates[0] == response.content
+    assert "math.factorial" in dev.candidates[1]
+
+
+async def test_pipeline_keeps_candidate_with_fewest_failures(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    pipeline = Pipeline(factorial_test, from_id="candidates", n_candidates=2)
+    pipeline.test = mock.Mock(
+        tests=["def test_factorial():\n    assert factorial(3) == 6\n"],
+        imports=["import pytest"],
+    )
+    pipeline.dev = mock.Mock(
+        history=GenerationHistory(
+            messages=[Message.system(""), Message.user(""), Message.assistant(WRONG)]
+        )
+    )
+
+    solution = await pipeline.test_until_passing(
+        solution=WRONG, depth=0, candidates=[WRONG, RIGHT]
+    )
+
+    assert solution == RIGHT
+    assert pipeline.best_solution_failures == 0
+    # the conversation continues from the winning candidate
+    assert pipeline.dev.history.messages[-1].content == RIGHT
+    pipeline.dev.generate.assert_not_called()
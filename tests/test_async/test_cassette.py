@@ -0,0 +1,140 @@
+from typing import Any, Optional
+
+import pytest
+
+from tdg.backends.base import Backend, Completion, PartialValidator
+from tdg.cache import CompletionCache, ReportCache
+from tdg.cassette import CassetteDeck, CassetteMiss
+from tdg.pipeline import Pipeline
+from tests.helpers import factorial_test
+
+
+REPLIES = {
+    "Navigator": "Use math.factorial.",
+    "Test Designer": "```python\ndef test_factorial_of_four():\n    assert factorial(4) == 24\n```",
+    "Developer": "```python\nimport math\n\ndef factorial(input: int) -> int:\n    return math.factorial(input)\n```",
+}
+
+
+class RoleBackend(Backend):
+    def __init__(self, replies: Optional[dict[str, list[str]]] = None):
+        self.requests = 0
+        self.replies = replies or {role: [reply] for role, reply in REPLIES.items()}
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        self.requests += 1
+        role = next(r for r in REPLIES if f"role is '{r}." in messages[0]["content"])
+        replies = self.replies[role]
+        reply = replies.pop(0) if len(replies) > 1 else replies[0]
+        return Completion(choices=[{"role": "assistant", "content": reply}])
+
+
+class OfflineBackend(Backend):
+    async def complete(self, *args, **kwargs) -> Completion:
+        raise AssertionError("replay must not reach the backend")
+
+
+def pipeline(tmp_path, monkeypatch, run: str, **kwargs) -> Pipeline:
+    monkeypatch.setenv("HOME", str(tmp_path / run))
+    return Pipeline(
+        factorial_test,
+        from_id="cassette",
+        cache=CompletionCache(tmp_path / run / "completions.sqlite"),
+        report_cache=ReportCache(tmp_path / run / "reports.sqlite"),
+        **kwargs,
+    )
+
+
+async def test_replay_reproduces_a_recorded_run_offline(tmp_path, monkeypatch):
+    directory = tmp_path / "cassettes"
+    backend = RoleBackend()
+    recorded = pipeline(
+        tmp_path,
+        monkeypatch,
+        "record",
+        backend=backend,
+        cassettes=CassetteDeck(directory, "record"),
+    )
+    _, recorded_solution = await recorded.gen()
+
+    assert backend.requests == 3
+    assert len((directory / "cassette.jsonl").read_text().splitlines()) == 3
+
+    replayed = pipeline(
+        tmp_path,
+        monkeypatch,
+        "replay",
+        backend=OfflineBackend(),
+        cassettes=CassetteDeck(directory, "replay"),
+    )
+    _, replayed_solution = await replayed.gen()
+
+    assert replayed_solution == recorded_solution
+    assert replayed.usage()["total"]["replays"] == 3
+    assert replayed.usage()["total"]["cost"] == 0
+
+
+async def test_replay_reproduces_a_repair_round(tmp_path, monkeypatch):
+    directory = tmp_path / "cassettes"
+    wrong = "```python\ndef factorial(input: int) -> int:\n    return input\n```"
+    backend = RoleBackend(
+        {
+            "Navigator": [REPLIES["Navigator"]],
+            "Test Designer": [REPLIES["Test Designer"]],
+            "Developer": [wrong, REPLIES["Developer"]],
+        }
+    )
+    recorded = pipeline(
+        tmp_path,
+        monkeypatch,
+        "record",
+        backend=backend,
+        cassettes=CassetteDeck(directory, "record"),
+    )
+    _, recorded_solution = await recorded.gen()
+
+    # the repair request quotes the failing tests' report
+    assert backend.requests == 4
+    assert "math.factorial" in recorded_solution
+
+    replayed = pipeline(
+        tmp_path,
+        monkeypatch,
+        "replay",
+        backend=OfflineBackend(),
+        cassettes=CassetteDeck(directory, "replay"),
+    )
+    _, replayed_solution = await replayed.gen()
+
+    assert replayed_solution == recorded_solution
+    assert replayed.usage()["total"]["replays"] == 4
+
+    # a repair round off the recorded script fails the replay, not just the round
+    cassette = directory / "cassette.jsonl"
+    cassette.write_text("\n".join(cassette.read_text().splitlines()[:3]) + "\n")
+    truncated = pipeline(
+        tmp_path,
+        monkeypatch,
+        "truncated",
+        backend=OfflineBackend(),
+        cassettes=CassetteDeck(directory, "replay"),
+    )
+    with pytest.raises(CassetteMiss):
+        await truncated.gen()
+
+
+async def test_replay_miss_is_an_error(tmp_path, monkeypatch):
+    replayed = pipeline(
+        tmp_path,
+        monkeypatch,
+        "replay",
+        backend=OfflineBackend(),
+        cassettes=CassetteDeck(tmp_path / "empty", "replay"),
+    )
+    with pytest.raises(CassetteMiss):
+        await replayed.gen(no_test=True)
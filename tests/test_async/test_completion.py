@@ -1,15 +1,21 @@
 import ast
+from typing import Optional
 from unittest import mock
 from unittest.mock import patch
 
+import httpx
+import openai
 import pytest
+from openai.types.chat import ChatCompletion
 
 from tdg import parsing
 from tdg.agents import NavAgent, TestAgent
 from tdg.agents.base import CodeContext, Message
 from tdg.agents.dev import DevAgent
+from tdg.cache import CompletionCache
 from tdg.executors.test import TestExecutor
 from tdg.extract import TestFinder
+from tdg.limits import RateLimiter
 from tdg.parsing import is_valid_python, nl_join
 from tdg.pipeline import Pipeline
 from tests import completions
@@ -138,3 +144,130 @@ async def test_test_execution(tdd_agent, dev_agent):
     await ex.test()
     assert ex.passed()
     assert ex.n_failures() == 0
+
+
+def chat_completion(*contents: str, usage: Optional[dict] = None) -> ChatCompletion:
+    return ChatCompletion.model_validate(
+        {
+            "usage": usage,
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4-turbo-preview",
+            "choices": [
+                {
+                    "index": idx,
+                    "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }
+                for idx, content in enumerate(contents)
+            ],
+        }
+    )
+
+
+def raw_completion(*contents: str, **kwargs) -> mock.Mock:
+    return mock.Mock(headers={}, parse=lambda: chat_completion(*contents, **kwargs))
+
+
+async def test_agents_share_completion_cache(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    create = mock.AsyncMock(return_value=raw_completion(completions.NAV_COMPLETION))
+
+    responses = []
+    for pipeline_id in ["first", "second"]:
+        nav_agent = NavAgent(
+            CodeContext(factorial_test),
+            pipeline_id=pipeline_id,
+            cache=cache,
+            limiter=RateLimiter(500, 300_000),
+        )
+        nav_agent.save_state = mock.AsyncMock()
+        with patch.object(
+            nav_agent.client.chat.completions,
+            "with_raw_response",
+            new=mock.Mock(create=create),
+        ):
+            responses.append(await nav_agent.generate())
+
+    assert responses[0] == responses[1]
+    assert create.await_count == 1
+    assert cache.hits == 1
+
+
+async def test_agent_records_call_usage(tmp_path):
+    nav_agent = NavAgent(
+        CodeContext(factorial_test),
+        pipeline_id="usage",
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        limiter=RateLimiter(500, 300_000, base_delay=0.001),
+    )
+    nav_agent.save_state = mock.AsyncMock()
+    response = httpx.Response(429, request=httpx.Request("POST", "https://x"))
+    create = mock.AsyncMock(
+        side_effect=[
+            openai.RateLimitError("slow down", response=response, body=None),
+            raw_completion(
+                completions.NAV_COMPLETION,
+                usage={
+                    "prompt_tokens": 120,
+                    "completion_tokens": 30,
+                    "total_tokens": 150,
+                },
+            ),
+        ]
+    )
+
+    with patch.object(
+        nav_agent.client.chat.completions,
+        "with_raw_response",
+        new=mock.Mock(create=create),
+    ):
+        await nav_agent.generate()
+        # identical request, answered from the cache
+        nav_agent.history.messages = nav_agent.history.messages[:1]
+        nav_agent.history.memory.clear()
+        await nav_agent.generate()
+
+    live, cached = nav_agent.calls
+    assert live.agent == "NavAgent"
+    assert live.pipeline_id == "usage"
+    assert (live.prompt_tokens, live.completion_tokens) == (120, 30)
+    assert live.retries == 1
+    assert not live.estimated
+    assert live.latency > 0
+    assert cached.cache_hit
+    assert nav_agent.usage().calls == 2
+
+
+async def test_code_agent_repairs_output_without_asking_again(tmp_path):
+    dev_agent = DevAgent(
+        Message.assistant("def test_factorial():\n    assert factorial(3) == 6\n"),
+        code_context=CodeContext(factorial_test),
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        limiter=RateLimiter(500, 300_000),
+    )
+    dev_agent.save_state = mock.AsyncMock()
+    create = mock.AsyncMock(
+        return_value=raw_completion(
+            nl_join(
+                "Here is an efficient implementation:",
+                "import bad_doesnt_exist",
+                "import math",
+                "def factorial(input: int) -> int:",
+                "    return math.factorial(input)",
+            )
+        )
+    )
+
+    with patch.object(
+        dev_agent.client.chat.completions,
+        "with_raw_response",
+        new=mock.Mock(create=create),
+    ):
+        response = await dev_agent.generate()
+
+    assert create.await_count == 1
+    assert "bad_doesnt_exist" not in response.content
+    assert is_valid_python(response.content)[0]
+    assert dev_agent.usage().local_repairs == 1
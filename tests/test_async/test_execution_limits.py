@@ -0,0 +1,80 @@
+import time
+
+import pytest
+
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.pool import WorkerPool
+from tdg.executors.resources import Limits
+from tdg.executors.test import SubprocessRunner, TestExecutor
+from tdg.pipeline import Pipeline
+
+RUNNERS = [SubprocessRunner, WorkerPool, ForkServer]
+
+LOOPING = (
+    "def test_loops():\n"
+    "    while True:\n"
+    "        pass\n\n\n"
+    "def test_passes():\n"
+    "    pass\n"
+)
+
+
+async def run(runner_cls, script: str, **limits) -> TestExecutor:
+    runner = runner_cls(limits=Limits.none().model_copy(update=limits))
+    try:
+        return await TestExecutor(script, runner=runner).test()
+    finally:
+        await runner.close()
+
+
+@pytest.mark.parametrize("runner_cls", RUNNERS)
+async def test_test_timeout_fails_only_the_slow_test(runner_cls):
+    tester = await run(runner_cls, LOOPING, test_timeout=0.5)
+
+    (timeout,) = tester.tracker.failures
+    assert tester.tracker.timeouts == [timeout]
+    assert timeout.nodeid.endswith("::test_loops")
+    assert "time limit of 0.5s" in timeout.longrepr
+    assert [r.nodeid.split("::")[-1] for r in tester.tracker.successes] == [
+        "test_passes"
+    ]
+
+
+@pytest.mark.parametrize("runner_cls", RUNNERS)
+async def test_script_timeout_stops_the_run(runner_cls):
+    sleeping = "import time\n\n\ndef test_sleeps():\n    time.sleep(30)\n"
+    start = time.monotonic()
+    tester = await run(runner_cls, sleeping, script_timeout=1.0)
+
+    assert time.monotonic() - start < 10
+    (timeout,) = tester.tracker.timeouts
+    assert "time limit of 1.0s in total" in timeout.longrepr
+
+
+@pytest.mark.parametrize("runner_cls", RUNNERS)
+async def test_memory_limit_fails_the_test(runner_cls):
+    hungry = "def test_allocates():\n    bytearray(8 * 1024**3)\n"
+    tester = await run(runner_cls, hungry, memory_bytes=2 * 1024**3)
+
+    (failure,) = tester.tracker.failures
+    assert failure.outcome == "failed"
+    assert "MemoryError" in failure.longrepr
+
+
+@pytest.mark.parametrize("runner_cls", RUNNERS)
+async def test_cpu_limit_kills_the_run(runner_cls):
+    spinning = "def test_spins():\n    while True:\n        pass\n"
+    tester = await run(runner_cls, spinning, cpu_seconds=1)
+
+    (crash,) = tester.tracker.failures
+    assert crash.outcome == "crashed"
+    assert "CPU time" in crash.longrepr
+
+
+async def test_timeouts_are_called_out_to_the_developer():
+    tester = await run(SubprocessRunner, LOOPING, test_timeout=0.5)
+
+    (timeout,) = tester.tracker.failures
+    feedback = Pipeline.describe_failure(timeout)
+    assert feedback.startswith(f"{timeout.nodeid} TIMED OUT:")
+    assert "infinite loop" in feedback
@@ -0,0 +1,113 @@
+from pathlib import Path
+from typing import Optional, Sequence
+from unittest import mock
+
+import pytest
+
+from tdg.agents.base import GenerationHistory, Message
+from tdg.cache import ReportCache
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.pool import WorkerPool
+from tdg.executors.test import SubprocessRunner, Report, TestExecutor
+from tdg.pipeline import Pipeline
+from tests.helpers import factorial_test
+
+SCRIPT = """
+def test_a():
+    assert True
+
+def test_b():
+    assert False
+
+def test_c():
+    assert False
+
+def test_d():
+    assert True
+"""
+
+
+class RecordingRunner(SubprocessRunner):
+    def __init__(self):
+        super().__init__()
+        self.calls: list[Optional[list[str]]] = []
+
+    async def run(
+        self,
+        test_file_path: Path,
+        tests: Optional[Sequence[str]] = None,
+        maxfail: Optional[int] = None,
+    ) -> Report:
+        self.calls.append(list(tests) if tests is not None else None)
+        return await super().run(test_file_path, tests, maxfail)
+
+
+async def test_failing_tests_run_first_and_alone_while_they_fail():
+    runner = RecordingRunner()
+    tester = await TestExecutor(SCRIPT, runner=runner, first=["test_c"]).test()
+
+    assert runner.calls == [["test_c"]]
+    assert tester.failed_tests() == ["test_c"]
+    assert not tester.complete
+
+
+async def test_confirm_pass_runs_whole_suite_once_failures_are_fixed():
+    runner = RecordingRunner()
+    # test_gone was renamed away since it failed, and is skipped rather than breaking collection
+    first = ["test_a", "test_gone"]
+    tester = await TestExecutor(SCRIPT, runner=runner, first=first).test()
+
+    assert runner.calls == [["test_a"], None]
+    assert tester.failed_tests() == ["test_b", "test_c"]
+    assert len(tester.tracker.successes) == 2
+    assert tester.complete
+
+
+@pytest.mark.parametrize("runner_cls", [SubprocessRunner, WorkerPool, ForkServer])
+async def test_maxfail_stops_early(runner_cls):
+    runner = runner_cls()
+    try:
+        tester = await TestExecutor(SCRIPT, runner=runner, maxfail=1).test()
+    finally:
+        await runner.close()
+
+    assert tester.failed_tests() == ["test_b"]
+    assert [t.nodeid.split("::")[-1] for t in tester.tracker.successes] == ["test_a"]
+    assert not tester.complete
+
+
+WRONG = "def factorial(input: int) -> int:\n    return input\n"
+RIGHT = "import math\n\n\ndef factorial(input: int) -> int:\n    return math.factorial(input)\n"
+
+
+async def test_repair_rounds_run_previous_failures_first(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    runner = RecordingRunner()
+    pipeline = Pipeline(
+        factorial_test,
+        from_id="failing_first",
+        runner=runner,
+        report_cache=ReportCache(tmp_path / "reports.sqlite"),
+    )
+    pipeline.test = mock.Mock(
+        tests=[
+            "def test_one():\n    assert factorial(1) == 1\n",
+            "def test_three():\n    assert factorial(3) == 6\n",
+        ],
+        imports=["import pytest"],
+    )
+    pipeline.dev = mock.Mock(
+        history=GenerationHistory(
+            messages=[Message.system(""), Message.user(""), Message.assistant(WRONG)]
+        ),
+        candidates=[],
+        generate=mock.AsyncMock(return_value=Message.assistant(RIGHT)),
+    )
+
+    solution = await pipeline.test_until_passing(solution=WRONG, depth=0)
+
+    assert solution == RIGHT
+    # the whole suite, then the failure on its own, then the whole suite to confirm the fix
+    assert runner.calls == [None, ["test_three"], None]
+    assert pipeline.failing == []
+    assert pipeline.best_solution_failures == 0
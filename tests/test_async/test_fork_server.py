@@ -0,0 +1,115 @@
+import asyncio
+import time
+
+import pytest
+
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.resources import Limits
+from tdg.executors.test import TestExecutor
+
+PASSING = "def test_passes():\n    assert sum([1, 2]) == 3\n"
+FAILING = "def test_fails():\n    assert 1 == 2\n\n\ndef test_passes():\n    pass\n"
+
+
+async def test_forked_runs_report_each_test_concurrently():
+    server = ForkServer(max_concurrency=4)
+    try:
+        testers = await asyncio.gather(
+            *[
+                TestExecutor(script, runner=server).test()
+                for script in [FAILING, PASSING] * 3
+            ]
+        )
+    finally:
+        await server.close()
+
+    assert server.forks == 6
+    assert [tester.n_failures() for tester in testers] == [1, 0] * 3
+    (failure,) = testers[0].tracker.failures
+    assert failure.nodeid.endswith("::test_fails")
+    assert "assert 1 == 2" in failure.longrepr
+
+
+async def test_children_dont_share_state(tmp_path):
+    leaky = "import math\n\nmath.LEAKED = True\n\n\ndef test_leak():\n    pass\n"
+    clean = (
+        "import math\n\n\ndef test_clean():\n    assert not hasattr(math, 'LEAKED')\n"
+    )
+    server = ForkServer()
+    try:
+        await TestExecutor(leaky, runner=server).test()
+        tester = await TestExecutor(clean, runner=server).test()
+    finally:
+        await server.close()
+
+    assert tester.passed()
+
+
+async def test_crashed_child_is_reported():
+    crashing = "import os\n\n\ndef test_exits():\n    os._exit(3)\n"
+    server = ForkServer()
+    try:
+        crashed = await TestExecutor(crashing, runner=server).test()
+        after = await TestExecutor(PASSING, runner=server).test()
+    finally:
+        await server.close()
+
+    (failure,) = crashed.tracker.failures
+    assert failure.outcome == "crashed"
+    assert "exited with code 3" in failure.longrepr
+    assert after.passed()
+
+
+async def test_crash_after_a_test_prints_done_is_reported():
+    script = (
+        "import os\n\n\n"
+        "def test_prints():\n"
+        "    print('done', end='')\n\n\n"
+        "def test_exits():\n"
+        "    os._exit(3)\n"
+    )
+    server = ForkServer(limits=Limits(script_timeout=30))
+    try:
+        async with asyncio.timeout(10):
+            tester = await TestExecutor(script, runner=server).test()
+    finally:
+        await server.close()
+
+    (failure,) = tester.tracker.failures
+    assert failure.outcome == "crashed"
+
+
+async def test_child_that_raises_exits_instead_of_serving():
+    # RLIMIT_FSIZE can't hold this, so applying the limits raises in the child
+    server = ForkServer(limits=Limits(file_bytes=10**30))
+    try:
+        async with asyncio.timeout(30):
+            broken = await TestExecutor(PASSING, runner=server).test()
+            server.limits = Limits()
+            after = await TestExecutor(PASSING, runner=server).test()
+    finally:
+        await server.close()
+
+    (failure,) = broken.tracker.failures
+    assert failure.outcome == "crashed"
+    assert "exited with code 1" in failure.longrepr
+    assert after.passed()
+
+
+async def test_cancelled_run_kills_its_child(tmp_path):
+    marker = tmp_path / "still_running"
+    slow = (
+        "import time\n\n\n"
+        "def test_slow():\n"
+        "    time.sleep(1.5)\n"
+        f"    open({str(marker)!r}, 'w').close()\n"
+    )
+    server = ForkServer()
+    try:
+        with pytest.raises(TimeoutError):
+            async with asyncio.timeout(0.5):
+                await TestExecutor(slow, runner=server).test()
+        await asyncio.sleep(2)
+        assert not marker.exists()
+    finally:
+        await server.close()
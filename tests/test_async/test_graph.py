@@ -0,0 +1,142 @@
+import asyncio
+import json
+from typing import Any, Optional
+
+import pytest
+
+from tdg.artifacts import ArtifactStore
+from tdg.backends.base import Backend, Completion, PartialValidator
+from tdg.cache import CompletionCache
+from tdg.graph import TaskGraph
+from tdg.pipeline import Pipeline
+from tests.helpers import factorial_test
+
+
+async def test_graph_runs_independent_tasks_concurrently():
+    events = []
+
+    def task(name: str):
+        async def run():
+            events.append(f"start {name}")
+            await asyncio.sleep(0.01)
+            events.append(f"end {name}")
+            return name.upper()
+
+        return run
+
+    graph = TaskGraph()
+    graph.add("a", task("a"))
+    graph.add("b", task("b"), after=["a"])
+    graph.add("c", task("c"), after=["a"])
+    graph.add("d", task("d"), after=["b", "c"])
+
+    assert await graph.run() == {"a": "A", "b": "B", "c": "C", "d": "D"}
+    assert events[:3] == ["start a", "end a", "start b"]
+    # c starts before b ends, and d waits for both
+    assert events.index("start c") < events.index("end b")
+    assert events[-2:] == ["start d", "end d"]
+
+
+async def test_graph_cancels_running_tasks_on_failure():
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def broken():
+        raise RuntimeError("nope")
+
+    graph = TaskGraph()
+    graph.add("slow", slow)
+    graph.add("broken", broken)
+    graph.add("never", broken, after=["slow"])
+
+    with pytest.raises(RuntimeError):
+        await graph.run()
+    assert cancelled.is_set()
+    assert graph.results == {}
+
+
+def test_graph_rejects_unknown_dependencies():
+    graph = TaskGraph()
+    with pytest.raises(ValueError):
+        graph.add("b", asyncio.sleep, after=["a"])
+
+
+RIGHT = "import math\n\n\ndef factorial(input: int) -> int:\n    return math.factorial(input)\n"
+TESTS = "```python\ndef test_factorial_of_four():\n    assert factorial(4) == 24\n```"
+
+
+class ScriptedBackend(Backend):
+    """Answers by agent role, after a delay, noting which roles were generating at once."""
+
+    def __init__(self, replies: dict[str, str], delay: float = 0.05):
+        self.replies = replies
+        self.delay = delay
+        self.requests: list[str] = []
+        self.active: set[str] = set()
+        self.overlaps: list[set[str]] = []
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        role = next(
+            r for r in self.replies if f"role is '{r}." in messages[0]["content"]
+        )
+        self.requests.append(role)
+        self.active.add(role)
+        self.overlaps.append(set(self.active))
+        await asyncio.sleep(self.delay)
+        self.active.discard(role)
+        return Completion(
+            choices=[{"role": "assistant", "content": self.replies[role]}]
+        )
+
+
+async def test_speculative_pipeline_drafts_while_tests_are_written(
+    tmp_path, monkeypatch
+):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    backend = ScriptedBackend(
+        {
+            "Navigator": "Use math.factorial.",
+            "Test Designer": TESTS,
+            "Developer": f"```python\n{RIGHT}```",
+        }
+    )
+    pipeline = Pipeline(
+        factorial_test,
+        from_id="speculative",
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        backend=backend,
+        speculative=True,
+        artifacts=ArtifactStore(tmp_path / "artifacts.sqlite"),
+    )
+
+    _, solution = await pipeline.gen()
+
+    assert "math.factorial" in solution
+    assert pipeline.best_solution_failures == 0
+    # the draft was the Developer's only request, made alongside the Test Designer's
+    assert backend.requests.count("Developer") == 1
+    assert {"Test Designer", "Developer"} in backend.overlaps
+    assert pipeline.dev.history.messages[-1].content == pipeline.draft.candidates[0]
+    assert [c.agent for c in pipeline.calls] == [
+        "NavAgent",
+        "TestAgent",
+        "DraftDevAgent",
+    ]
+    # the tested script, its report and the histories are stored, rather than left as files
+    artifacts = pipeline.artifacts.artifacts("speculative")
+    assert [a.kind for a in artifacts].count("history") == 4
+    (script,) = pipeline.artifacts.artifacts("speculative", kind="script")
+    report = pipeline.artifacts.get("speculative", "report", script.name)
+    assert json.loads(report)["exitcode"] == 0
+    assert not list((tmp_path / ".tdg").rglob("*.py"))
@@ -0,0 +1,129 @@
+import asyncio
+from typing import Any, Optional
+from unittest import mock
+
+from tdg.agents import NavAgent
+from tdg.agents.base import CodeContext
+from tdg.backends.base import Backend, Completion, PartialValidator
+from tdg.backends.hedged import HedgedBackend, percentile
+from tdg.cache import CompletionCache
+from tests.helpers import factorial_test
+
+
+class SlowBackend(Backend):
+    """Answers after a per-model delay, noting cancelled requests."""
+
+    def __init__(self, delays: dict[str, float], replies: Optional[dict] = None):
+        self.delays = delays
+        self.replies = replies or {}
+        self.requested: list[str] = []
+        self.cancelled: list[str] = []
+
+    async def complete(
+        self,
+        messages: list[dict[str, str]],
+        config: dict[str, Any],
+        validate: Optional[PartialValidator] = None,
+    ) -> Completion:
+        model = config["model"]
+        self.requested.append(model)
+        try:
+            await asyncio.sleep(self.delays[model])
+        except asyncio.CancelledError:
+            self.cancelled.append(model)
+            raise
+        content = self.replies.get(model, f"answer from {model}")
+        return Completion(choices=[{"role": "assistant", "content": content}])
+
+
+MESSAGES = [{"role": "user", "content": "Reason about factorial."}]
+
+
+def test_percentile():
+    assert percentile([5, 1, 4, 2, 3], 0.5) == 3
+    assert percentile([5, 1, 4, 2, 3], 0.9) == 5
+    assert percentile([1.0], 0.99) == 1.0
+
+
+async def test_fast_requests_are_not_hedged():
+    slow = SlowBackend({"main": 0.0})
+    hedged = HedgedBackend(slow, initial_delay=1.0)
+
+    completion = await hedged.complete(MESSAGES, {"model": "main"})
+
+    assert completion.choices[0]["content"] == "answer from main"
+    assert slow.requested == ["main"]
+    assert hedged.hedges == 0
+    assert len(hedged.latencies["main"]) == 1
+
+
+async def test_slow_request_is_raced_and_loser_cancelled():
+    slow = SlowBackend({"main": 10.0, "fast": 0.01})
+    hedged = HedgedBackend(slow, initial_delay=0.01, hedge_model="fast")
+
+    completion = await hedged.complete(MESSAGES, {"model": "main"})
+
+    assert completion.choices[0]["content"] == "answer from fast"
+    assert completion.model == "fast"
+    assert slow.cancelled == ["main"]
+    assert (hedged.hedges, hedged.hedge_wins) == (1, 1)
+
+
+async def test_unusable_answer_does_not_win_the_race():
+    slow = SlowBackend(
+        {"main": 0.2, "fast": 0.01}, replies={"fast": "def broken(:", "main": "x = 1"}
+    )
+    hedged = HedgedBackend(slow, initial_delay=0.01, hedge_model="fast")
+
+    completion = await hedged.complete(
+        MESSAGES, {"model": "main"}, validate=lambda content: "broken" not in content
+    )
+
+    assert completion.choices[0]["content"] == "x = 1"
+    assert hedged.hedge_wins == 0
+
+
+async def test_hedge_delay_follows_observed_latency():
+    hedged = HedgedBackend(SlowBackend({}), min_samples=3, initial_delay=30.0)
+    hedged.latencies["main"].extend([1.0, 2.0])
+    assert hedged.hedge_delay("main") == 30.0
+    hedged.latencies["main"].append(3.0)
+    assert hedged.hedge_delay("main") == 3.0
+
+
+async def test_agent_records_the_model_that_answered(tmp_path):
+    backend = HedgedBackend(
+        SlowBackend({"gpt-4-turbo-preview": 10.0, "gpt-3.5-turbo": 0.01}),
+        initial_delay=0.01,
+        hedge_model="gpt-3.5-turbo",
+    )
+    nav_agent = NavAgent(
+        CodeContext(factorial_test),
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        backend=backend,
+    )
+    nav_agent.save_state = mock.AsyncMock()
+
+    response = await nav_agent.generate()
+
+    assert response.content == "answer from gpt-3.5-turbo"
+    (call,) = nav_agent.calls
+    assert call.model == "gpt-3.5-turbo"
+    assert call.latency < 1
+
+    # cached as the hedge model's answer, so the primary model is asked again next time
+    messages = nav_agent.history.messages_dict()[:-1]
+    config = nav_agent.request_config()
+    assert nav_agent.cache.get_choices(messages, config) is None
+    assert nav_agent.cache.get_choices(messages, {**config, "model": "gpt-3.5-turbo"})
+
+
+async def test_cancelled_requests_count_towards_latency():
+    slow = SlowBackend({"main": 10.0, "fast": 0.01})
+    hedged = HedgedBackend(slow, initial_delay=0.05, hedge_model="fast")
+
+    await hedged.complete(MESSAGES, {"model": "main"})
+
+    # the loser ran at least until the hedge answered
+    (lower_bound,) = hedged.latencies["main"]
+    assert lower_bound >= 0.05
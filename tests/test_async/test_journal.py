@@ -0,0 +1,91 @@
+import json
+
+from tdg.agents import NavAgent
+from tdg.agents.base import CodeContext, GenerationHistory, Message
+from tdg.cache import CompletionCache
+from tdg.journal import HistoryJournal
+from tests.helpers import factorial_test
+
+
+def exchange(history: GenerationHistory, i: int):
+    request, response = Message.user(f"request {i}"), Message.assistant(f"answer {i}")
+    history.messages += [request, response]
+    history.memory[request.content] = response
+
+
+async def test_saves_append_only_what_changed(tmp_path):
+    path = tmp_path / "dev_history.jsonl"
+    journal = HistoryJournal(path)
+    history = GenerationHistory(messages=[Message.system("You are a Developer.")])
+
+    await journal.append(history)
+    exchange(history, 0)
+    await journal.append(history)
+    await journal.append(history)
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [line["op"] for line in lines] == [
+        "snapshot",
+        "message",
+        "message",
+        "remember",
+    ]
+    assert lines[-1] == {"op": "remember", "key": "request 0", "index": 2}
+
+
+async def test_replay_matches_history_through_edits_and_compaction(tmp_path):
+    path = tmp_path / "dev_history.jsonl"
+    journal = HistoryJournal(path, compact_every=5)
+    history = GenerationHistory(messages=[Message.system("You are a Developer.")])
+
+    for i in range(6):
+        exchange(history, i)
+        if i == 3:
+            history.messages[-1].content = "a preferred alternative"
+        await journal.append(history)
+    history.alter_initial("start over")
+    await journal.append(history)
+
+    replayed = await HistoryJournal(path).replay()
+    assert GenerationHistory.model_validate(replayed) == history
+    # compacted along the way, so the journal never grows far past a snapshot
+    assert len(path.read_text().splitlines()) <= 5 + 3
+
+
+async def test_torn_last_line_is_ignored_and_dropped(tmp_path):
+    path = tmp_path / "dev_history.jsonl"
+    history = GenerationHistory(messages=[Message.system("You are a Developer.")])
+    await HistoryJournal(path).append(history)
+    with path.open("a") as f:
+        f.write('{"op": "message", "role": "us')
+
+    journal = HistoryJournal(path)
+    replayed = await journal.replay()
+    assert GenerationHistory.model_validate(replayed) == history
+
+    exchange(history, 0)
+    await journal.append(history)
+    assert (
+        GenerationHistory.model_validate(await HistoryJournal(path).replay()) == history
+    )
+
+
+async def test_agent_resumes_from_journal_or_legacy_json(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+
+    legacy = NavAgent(CodeContext(factorial_test), pipeline_id="resume", cache=cache)
+    exchange(legacy.history, 0)
+    legacy.legacy_cache_file.parent.mkdir(parents=True)
+    legacy.legacy_cache_file.write_text(legacy.history.model_dump_json())
+
+    agent = NavAgent(CodeContext(factorial_test), pipeline_id="resume", cache=cache)
+    await agent.load_state()
+    assert agent.history == legacy.history
+    assert agent.cache_file.is_file()
+
+    exchange(agent.history, 1)
+    await agent.save_state()
+    resumed = NavAgent(CodeContext(factorial_test), pipeline_id="resume", cache=cache)
+    await resumed.load_state()
+    assert resumed.history == agent.history
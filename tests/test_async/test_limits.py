@@ -0,0 +1,90 @@
+import time
+from unittest import mock
+
+import httpx
+import openai
+import pytest
+
+from tdg.limits import RateLimiter, TokenBucket, parse_duration
+
+
+def rate_limit_error(**headers: str) -> openai.RateLimitError:
+    response = httpx.Response(
+        429,
+        headers=headers,
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+    )
+    return openai.RateLimitError("Rate limit reached", response=response, body=None)
+
+
+def server_error(status: int) -> openai.InternalServerError:
+    response = httpx.Response(
+        status,
+        request=httpx.Request("POST", "https://api.openai.com/v1/chat/completions"),
+    )
+    return openai.InternalServerError("Bad gateway", response=response, body=None)
+
+
+def test_parse_duration():
+    assert parse_duration("20ms") == pytest.approx(0.02)
+    assert parse_duration("1s") == 1
+    assert parse_duration("6m0s") == 360
+    assert parse_duration("1h2m3.5s") == pytest.approx(3723.5)
+
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(per_minute=60)
+    assert bucket.wait_time(1) == 0
+    bucket.consume(60)
+    assert bucket.wait_time(1) == pytest.approx(1, abs=0.05)
+    # oversized requests are clamped to the capacity rather than waiting forever
+    assert bucket.wait_time(10_000) == pytest.approx(60, abs=0.1)
+
+
+def test_headers_correct_limits_and_pause_when_spent():
+    limiter = RateLimiter(500, 300_000)
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-limit-requests": "100",
+            "x-ratelimit-remaining-requests": "0",
+            "x-ratelimit-reset-requests": "600ms",
+            "x-ratelimit-limit-tokens": "1000",
+            "x-ratelimit-remaining-tokens": "10",
+        }
+    )
+    assert limiter.requests.capacity == 100
+    assert limiter.tokens.available <= 11
+    assert limiter.paused_until - time.monotonic() == pytest.approx(0.6, abs=0.05)
+
+
+async def test_retries_after_429_then_succeeds():
+    limiter = RateLimiter(500, 300_000, base_delay=0.001)
+    request = mock.AsyncMock(
+        side_effect=[rate_limit_error(**{"retry-after-ms": "10"}), "ok"]
+    )
+
+    assert await limiter.call(request, tokens=10) == "ok"
+    assert request.await_count == 2
+    assert limiter.throttled == 1
+    # the refill rate backed off, then began recovering
+    assert limiter.scale == pytest.approx(0.6)
+
+
+async def test_gives_up_after_max_retries():
+    limiter = RateLimiter(500, 300_000, base_delay=0.001, max_retries=2)
+    request = mock.AsyncMock(side_effect=rate_limit_error())
+
+    with pytest.raises(openai.RateLimitError):
+        await limiter.call(request, tokens=10)
+    assert request.await_count == 3
+
+
+async def test_retries_a_bad_gateway_without_slowing_down():
+    limiter = RateLimiter(500, 300_000, base_delay=0.001)
+    request = mock.AsyncMock(side_effect=[server_error(502), "ok"])
+
+    assert await limiter.call(request, tokens=10) == "ok"
+    assert request.await_count == 2
+    # not a rate limit, so nobody else is paused or slowed
+    assert limiter.throttled == 0
+    assert limiter.scale == 1.0
@@ -0,0 +1,73 @@
+import asyncio
+
+from tdg.executors.pool import WorkerPool
+from tdg.executors.test import TestExecutor
+
+PASSING = "def test_passes():\n    assert sum([1, 2]) == 3\n"
+FAILING = "def test_fails():\n    assert 1 == 2\n\n\ndef test_passes():\n    pass\n"
+
+
+async def test_workers_are_reused_and_report_each_test():
+    pool = WorkerPool(size=1)
+    try:
+        first = await TestExecutor(FAILING, runner=pool).test()
+        second = await TestExecutor(PASSING, runner=pool).test()
+    finally:
+        await pool.close()
+
+    assert pool.started == 1
+    assert first.n_failures() == 1
+    (failure,) = first.tracker.failures
+    assert failure.nodeid.endswith("::test_fails")
+    assert "assert 1 == 2" in failure.longrepr
+    assert [r.outcome for r in first.tracker.successes] == ["passed"]
+    assert second.passed()
+
+
+async def test_each_script_gets_a_clean_namespace(tmp_path):
+    pool = WorkerPool(size=1)
+    scripts = []
+    for i in range(2):
+        (tmp_path / str(i)).mkdir()
+        # same module name, different contents
+        path = tmp_path / str(i) / "helper_test.py"
+        path.write_text(
+            f"VALUE = {i}\n\n\ndef test_value():\n    assert VALUE == {i}\n"
+        )
+        scripts.append(path)
+    try:
+        reports = [await pool.run(path) for path in scripts]
+    finally:
+        await pool.close()
+
+    assert [len(report.failures) for report in reports] == [0, 0]
+
+
+async def test_workers_are_recycled_after_max_runs():
+    pool = WorkerPool(size=1, max_runs=2)
+    try:
+        testers = await asyncio.gather(
+            *[TestExecutor(PASSING, runner=pool).test() for _ in range(5)]
+        )
+    finally:
+        await pool.close()
+
+    assert all(tester.passed() for tester in testers)
+    assert pool.recycled == 2
+    assert pool.started == 3
+
+
+async def test_crashed_worker_is_reported_and_replaced():
+    pool = WorkerPool(size=1)
+    crashing = "import os\n\n\ndef test_exits():\n    os._exit(3)\n"
+    try:
+        crashed = await TestExecutor(crashing, runner=pool).test()
+        after = await TestExecutor(PASSING, runner=pool).test()
+    finally:
+        await pool.close()
+
+    (failure,) = crashed.tracker.failures
+    assert failure.outcome == "crashed"
+    assert "exited with code 3" in failure.longrepr
+    assert after.passed()
+    assert pool.started == 2
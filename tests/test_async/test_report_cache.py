@@ -0,0 +1,106 @@
+from unittest import mock
+
+from tdg.agents.base import GenerationHistory, Message
+from tdg.cache import ReportCache
+from tdg.executors.test import TestExecutor
+from tdg.pipeline import Pipeline
+
+from tests.helpers import factorial_test
+from tests.test_async.test_failing_first import RecordingRunner
+
+SCRIPT = """
+def test_a():
+    assert 1 + 1 == 2
+
+def test_b():
+    assert 1 + 1 == 3
+"""
+
+REFORMATTED = """
+# the same tests, formatted differently
+def test_a():
+    assert (1+1) == 2
+def test_b():
+    assert (1+1) == 3
+"""
+
+
+async def test_ast_identical_scripts_are_tested_once(tmp_path):
+    cache = ReportCache(tmp_path / "reports.sqlite")
+    runner = RecordingRunner()
+
+    first = await TestExecutor(SCRIPT, runner=runner, cache=cache).test()
+    second = await TestExecutor(REFORMATTED, runner=runner, cache=cache).test()
+
+    assert runner.calls == [None]
+    assert not first.cached and second.cached
+    assert second.exit_code == first.exit_code
+    assert second.failed_tests() == ["test_b"]
+    assert second.tracker.failures[0].longrepr == first.tracker.failures[0].longrepr
+    assert second.tracker.failures[0].nodeid == f"{second.path.name}::test_b"
+
+
+async def test_complete_report_answers_failing_first_runs(tmp_path):
+    cache = ReportCache(tmp_path / "reports.sqlite")
+    runner = RecordingRunner()
+
+    await TestExecutor(SCRIPT, runner=runner, cache=cache).test()
+    tester = await TestExecutor(
+        SCRIPT, runner=runner, cache=cache, first=["test_b"]
+    ).test()
+
+    assert runner.calls == [None]
+    assert tester.complete
+
+
+async def test_cache_is_keyed_by_limits(tmp_path):
+    cache = ReportCache(tmp_path / "reports.sqlite")
+    runner = RecordingRunner()
+    await TestExecutor(SCRIPT, runner=runner, cache=cache).test()
+
+    runner.limits = runner.limits.model_copy(update={"test_timeout": 1.0})
+    tester = await TestExecutor(SCRIPT, runner=runner, cache=cache).test()
+
+    assert runner.calls == [None, None]
+    assert not tester.cached
+
+
+WRONG = "def factorial(input: int) -> int:\n    return input\n"
+ALSO_WRONG = "def factorial(input: int) -> int:\n    return input * 2 - 1\n"
+WRONG_REFORMATTED = "def factorial(input:int)->int:\n    return (input)\n"
+
+
+async def test_pipeline_stops_when_repair_goes_in_circles(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    runner = RecordingRunner()
+    pipeline = Pipeline(
+        factorial_test,
+        from_id="cycling",
+        runner=runner,
+        max_iter=10,
+        report_cache=ReportCache(tmp_path / "reports.sqlite"),
+    )
+    pipeline.test = mock.Mock(
+        tests=["def test_three():\n    assert factorial(3) == 6\n"],
+        imports=["import pytest"],
+    )
+    pipeline.dev = mock.Mock(
+        history=GenerationHistory(
+            messages=[Message.system(""), Message.user(""), Message.assistant(WRONG)]
+        ),
+        candidates=[],
+        generate=mock.AsyncMock(
+            side_effect=[
+                Message.assistant(ALSO_WRONG),
+                Message.assistant(WRONG_REFORMATTED),
+            ]
+        ),
+    )
+
+    solution = await pipeline.test_until_passing(solution=WRONG, depth=0)
+
+    assert solution == WRONG
+    assert pipeline.stop_reason == "the Developer repeated an earlier failing solution"
+    assert pipeline.dev.generate.await_count == 2
+    # the repeated solution's report came from the cache
+    assert len(runner.calls) == 2
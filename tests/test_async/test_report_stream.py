@@ -0,0 +1,65 @@
+import asyncio
+
+from tdg.executors.resources import TIMEOUT_OUTCOME, Limits
+from tdg.executors.test import MAX_CAPTURE, run_pytest_subprocess
+
+VERBOSE = """
+import sys
+
+def test_loud():
+    print("x" * 1_000_000)
+    sys.stderr.write("y" * 1_000_000)
+    assert False
+
+def test_quiet():
+    print("hello")
+"""
+
+
+async def test_verbose_tests_report_bounded_output(tmp_path):
+    path = tmp_path / "test_verbose.py"
+    path.write_text(VERBOSE)
+
+    # a megabyte of failure output would fill an undrained pipe and hang the run
+    report = await asyncio.wait_for(run_pytest_subprocess(path), timeout=60)
+
+    (loud,) = report.failures
+    assert len(loud.stdout) < MAX_CAPTURE + 100
+    assert "characters truncated" in loud.stdout
+    assert loud.stderr.startswith("y")
+    (quiet,) = report.successes
+    assert quiet.stdout == "hello\n"
+
+
+async def test_concurrent_runs_in_one_directory(tmp_path):
+    paths = []
+    for i in range(4):
+        path = tmp_path / f"test_{i}.py"
+        path.write_text(f"def test_{i}():\n    assert {i} % 2 == 0\n")
+        paths.append(path)
+
+    reports = await asyncio.gather(*[run_pytest_subprocess(path) for path in paths * 2])
+
+    for path, report in zip(paths * 2, reports):
+        (test,) = report.failures + report.successes
+        assert test.nodeid.startswith(path.name)
+    assert [len(report.failures) for report in reports] == [0, 1, 0, 1] * 2
+    # nothing was written next to the scripts
+    assert {p for p in tmp_path.iterdir() if p.is_file()} == set(paths)
+
+
+async def test_killed_run_keeps_finished_tests(tmp_path):
+    path = tmp_path / "test_hangs.py"
+    path.write_text(
+        "import time\n\n"
+        "def test_fast():\n    pass\n\n"
+        "def test_hangs():\n    time.sleep(60)\n"
+    )
+    limits = Limits.none().model_copy(update={"script_timeout": 3.0})
+
+    report = await run_pytest_subprocess(path, limits)
+
+    (fast,) = report.successes
+    assert fast.nodeid.endswith("test_fast")
+    (timeout,) = report.failures
+    assert timeout.outcome == TIMEOUT_OUTCOME
@@ -0,0 +1,71 @@
+from tdg.executors.fork_server import ForkServer
+from tdg.executors.resources import Limits
+from tdg.executors.sharding import ShardedRunner, collect_tests, split
+from tdg.executors.test import TestExecutor
+
+
+def suite(n: int, crash_at: int = -1) -> str:
+    tests = []
+    for i in range(n):
+        body = "import os\n    os._exit(1)" if i == crash_at else f"assert {i} == {i}"
+        tests.append(f"def test_case_{i}():\n    {body}\n")
+    return "\n\n".join(tests)
+
+
+def test_collect_tests():
+    script = (
+        "import math\n\n\ndef helper():\n    pass\n\n\n"
+        "def test_a():\n    pass\n\n\nclass TestB:\n    def test_c(self):\n        pass\n"
+    )
+    assert collect_tests(script) == ["test_a", "TestB"]
+
+
+def test_split_balances_recorded_durations():
+    tests = ["a", "b", "c", "d"]
+    assert split(tests, 2, {}) == [["a", "c"], ["b", "d"]]
+    assert split(tests, 2, {"a": 9.0, "b": 1.0, "c": 1.0, "d": 1.0}) == [
+        ["a"],
+        ["b", "c", "d"],
+    ]
+    assert split(tests[:1], 3, {}) == [["a"]]
+
+
+async def test_shards_are_run_concurrently_and_merged():
+    server = ForkServer(limits=Limits.none())
+    runner = ShardedRunner(server, shards=4, min_tests_per_shard=2)
+    try:
+        tester = await TestExecutor(suite(12), runner=runner).test()
+    finally:
+        await runner.close()
+
+    assert tester.passed()
+    assert len(tester.tracker.successes) == 12
+    assert server.forks == 4
+    assert set(runner.durations) == {f"test_case_{i}" for i in range(12)}
+
+
+async def test_crashing_test_is_isolated():
+    server = ForkServer(limits=Limits.none())
+    runner = ShardedRunner(server, shards=2, min_tests_per_shard=2)
+    try:
+        tester = await TestExecutor(suite(8, crash_at=2), runner=runner).test()
+    finally:
+        await runner.close()
+
+    (crash,) = tester.tracker.failures
+    assert crash.nodeid.endswith("::test_case_2")
+    assert crash.outcome == "crashed"
+    assert len(tester.tracker.successes) == 7
+    assert runner.isolated_reruns == 3
+
+
+async def test_small_suites_run_whole():
+    server = ForkServer(limits=Limits.none())
+    runner = ShardedRunner(server, shards=4)
+    try:
+        tester = await TestExecutor(suite(3), runner=runner).test()
+    finally:
+        await runner.close()
+
+    assert tester.passed()
+    assert server.forks == 1
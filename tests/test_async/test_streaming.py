@@ -0,0 +1,101 @@
+from unittest import mock
+from unittest.mock import patch
+
+from openai.types.chat import ChatCompletionChunk
+
+from tdg.agents import NavAgent, TestAgent
+from tdg.agents.base import CodeContext, Message, AgentConfig
+from tdg.cache import CompletionCache
+from tdg.limits import RateLimiter
+from tests.helpers import factorial_test
+
+
+def chunk(content: str) -> ChatCompletionChunk:
+    return ChatCompletionChunk.model_validate(
+        {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4-turbo-preview",
+            "choices": [{"index": 0, "delta": {"content": content}}],
+        }
+    )
+
+
+class FakeStream:
+    def __init__(self, *deltas: str):
+        self.deltas = deltas
+        self.consumed = 0
+        self.close = mock.AsyncMock()
+
+    async def __aiter__(self):
+        for delta in self.deltas:
+            self.consumed += 1
+            yield chunk(delta)
+
+
+def streaming_agent(cls, tmp_path, stream: FakeStream, **kwargs):
+    agent = cls(
+        code_context=CodeContext(factorial_test),
+        config=AgentConfig(stream=True),
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        limiter=RateLimiter(500, 300_000),
+        **kwargs,
+    )
+    create = mock.AsyncMock(return_value=mock.Mock(headers={}, parse=lambda: stream))
+    return agent, patch.object(
+        agent.client.chat.completions,
+        "with_raw_response",
+        new=mock.Mock(create=create),
+    )
+
+
+async def test_stream_accumulates_deltas(tmp_path):
+    stream = FakeStream("Think ", "about\n", "zero.")
+    agent, patched = streaming_agent(NavAgent, tmp_path, stream)
+
+    with patched:
+        choices = await agent._complete(agent.history.messages_dict())
+
+    assert choices == [Message.assistant("Think about\nzero.")]
+    assert stream.consumed == 3
+    stream.close.assert_not_awaited()
+    assert len(agent.cache) == 1
+
+
+async def test_stream_aborts_on_unavailable_import(tmp_path):
+    stream = FakeStream(
+        "```python\n",
+        "import bad_doesnt_exist\n",
+        "def test_factorial():\n",
+        "    assert bad_doesnt_exist.factorial(1) == 1\n",
+        "```",
+        "\nThat's all.",
+        "\nNever read.",
+    )
+    agent, patched = streaming_agent(
+        TestAgent, tmp_path, stream, nav_response=Message.assistant("")
+    )
+
+    with patched:
+        choices = await agent._complete(agent.history.messages_dict())
+
+    # stopped at the first line to use the import, before the block is closed
+    assert choices[0].content.endswith("bad_doesnt_exist.factorial(1) == 1\n")
+    assert stream.consumed == 4
+    stream.close.assert_awaited_once()
+    # partial generations are not cached
+    assert len(agent.cache) == 0
+
+
+async def test_stream_without_choices_is_asked_again(tmp_path):
+    agent, patched = streaming_agent(NavAgent, tmp_path, FakeStream())
+    agent.save_state = mock.AsyncMock()
+    agent.ensure_output_valid = mock.AsyncMock(side_effect=lambda message: message)
+
+    with patched:
+        response = await agent.generate()
+
+    assert response == Message.assistant("")
+    # an empty stream isn't an answer to remember
+    assert len(agent.cache) == 0
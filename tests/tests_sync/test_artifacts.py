@@ -0,0 +1,83 @@
+import asyncio
+import random
+import string
+import threading
+from pathlib import Path
+
+from tdg.artifacts import ArtifactStore, default_artifact_store
+
+
+def noise(n: int, seed: int) -> str:
+    """Text that compresses to roughly the same size for any seed."""
+    rng = random.Random(seed)
+    return "".join(rng.choices(string.ascii_letters, k=n))
+
+
+def test_identical_content_is_stored_once(tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts.sqlite")
+    script = "def test_it():\n    assert True\n"
+
+    first = store.put("pipe_a", "script", "iter_0_a", script)
+    second = store.put("pipe_b", "script", "iter_0_b", script)
+
+    assert first.digest == second.digest
+    assert store.stats()["blobs"] == 1
+    assert store.stats()["artifacts"] == 2
+    assert store.get("pipe_b", "script", "iter_0_b") == script
+    assert store.content(first.digest) == script
+
+
+def test_async_access_runs_off_the_event_loop(tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts.sqlite")
+    threads = []
+    put = store.put
+    store.put = lambda *args: threads.append(threading.get_ident()) or put(*args)
+
+    async def use():
+        await store.aput("pipe", "script", "iter_0", "x = 1")
+        return await store.aget("pipe", "script", "iter_0")
+
+    assert asyncio.run(use()) == "x = 1"
+    assert threads and threading.get_ident() not in threads
+    store.close()
+
+
+def test_query_by_pipeline_and_kind(tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts.sqlite")
+    store.put("pipe", "script", "iter_0_a", "x = 1")
+    store.put("pipe", "report", "iter_0_a", '{"exitcode": 0, "tests": []}')
+    store.put("other", "script", "iter_0_b", "x = 2")
+
+    assert [a.kind for a in store.artifacts("pipe")] == ["script", "report"]
+    assert [a.name for a in store.artifacts("pipe", kind="script")] == ["iter_0_a"]
+    assert store.pipelines() == ["other", "pipe"]
+    assert store.get("pipe", "history", "dev_history") is None
+
+    store.delete_pipeline("other")
+    assert store.pipelines() == ["pipe"]
+    assert store.stats()["blobs"] == 2
+
+
+def test_least_recently_used_content_is_evicted_over_the_cap(tmp_path):
+    store = ArtifactStore(tmp_path / "artifacts.sqlite")
+    old = store.put("pipe", "script", "old", noise(1000, 0))
+    used = store.put("pipe", "script", "used", noise(1000, 1))
+    store.max_bytes = store.stored_bytes() + 100
+    store.content(old.digest)  # now more recently used than "used"
+
+    store.put("pipe", "script", "new", noise(1000, 2))
+
+    assert store.stored_bytes() <= store.max_bytes
+    assert store.content(used.digest) is None
+    assert [a.name for a in store.artifacts("pipe")] == ["old", "new"]
+    assert store.stats()["evictions"] == 1
+
+
+def test_default_store_lives_under_home_at_first_use(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "elsewhere"))
+
+    store = default_artifact_store()
+    store.put("pipe", "script", "iter_0", "def test_it():\n    assert True\n")
+
+    assert store.path == Path.home() / ".tdg" / "artifacts.sqlite"
+    assert store.path.is_file()
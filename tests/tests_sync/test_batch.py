@@ -0,0 +1,137 @@
+import asyncio
+import time
+from pathlib import Path
+from unittest import mock
+
+from tdg.batch import LocalBatchSubmitter, read_batch_requests, read_batch_results
+from tdg.cache import CompletionCache
+from tdg.generator import Generator
+from tests import completions
+from tests.helpers import factorial_test
+
+
+def respond(body: dict) -> str:
+    system = body["messages"][0]["content"]
+    if "'Navigator.'" in system:
+        return completions.NAV_COMPLETION
+    if "'Test Designer.'" in system:
+        return completions.TEST_DESIGNER_COMPLETION
+    return completions.DEVELOPER_COMPLETION
+
+
+def test_generate_batched_advances_pipelines_without_live_calls(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    # any interactive request would go through the limiter
+    no_live_calls = mock.Mock(call=mock.AsyncMock(side_effect=AssertionError))
+
+    gen = Generator(factorial_test, cache=cache, limiter=no_live_calls)
+    gen.generate_batched(LocalBatchSubmitter(respond), job_dir=tmp_path / "jobs")
+
+    assert not gen.errors
+    [(_, solution)] = gen.results
+    assert "def factorial" in solution
+    no_live_calls.call.assert_not_awaited()
+    # every stage was answered by its batch, whose usage is accounted for
+    total = gen.usage()["total"]
+    assert total["calls"] == 3
+    assert total["batched"] == 3
+    assert total["cache_hits"] == 0
+    assert total["prompt_tokens"] > 0 and total["completion_tokens"] > 0
+    assert total["cost"] > 0
+
+    jobs = sorted((tmp_path / "jobs").glob(f"{gen._id}_*.jsonl"))
+    assert len(jobs) == 6  # one job and one results file per stage
+    for stage in ["nav", "test", "dev"]:
+        job = tmp_path / "jobs" / f"{gen._id}_{stage}.jsonl"
+        [request] = read_batch_requests(job)
+        assert request.custom_id.endswith(f":{stage}")
+        assert request.url == "/v1/chat/completions"
+        assert request.custom_id in read_batch_results(
+            job.with_name(f"{job.stem}_output.jsonl")
+        )
+
+
+def test_generate_batched_skips_cached_requests(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    submitter = LocalBatchSubmitter(respond)
+
+    Generator(factorial_test, cache=cache).generate_batched(
+        submitter, job_dir=tmp_path / "first"
+    )
+
+    # a re-run with the same (fresh-state) prompts is answered from the cache alone
+    for path in (tmp_path / ".tdg").rglob("*_history.json*"):
+        path.unlink()
+    spy = mock.Mock(wraps=submitter.submit)
+    submitter.submit = spy
+    gen = Generator(factorial_test, cache=cache)
+    gen.generate_batched(submitter, job_dir=tmp_path / "second")
+
+    assert gen.results
+    spy.assert_not_called()
+
+
+class SlowBatchSubmitter(LocalBatchSubmitter):
+    """Takes `delay` seconds over the jobs of the given stage."""
+
+    def __init__(self, stage: str, delay: float):
+        super().__init__(respond)
+        self.stage = stage
+        self.delay = delay
+
+    async def submit(self, job: Path) -> Path:
+        if job.stem.endswith(f"_{self.stage}"):
+            await asyncio.sleep(self.delay)
+        return await super().submit(job)
+
+
+def test_generate_batched_stops_pipelines_out_of_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    gen = Generator(
+        factorial_test,
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        pipeline_deadline=0.5,
+    )
+
+    gen.generate_batched(SlowBatchSubmitter("test", 1.0), job_dir=tmp_path / "jobs")
+
+    # the deadline isn't an error: the pipeline finishes with what it has
+    assert not gen.errors
+    assert gen.results == [(gen.pipelines[0]._id, "")]
+    assert list(gen.stop_reasons.values()) == ["pipeline deadline of 0.5s passed"]
+    # no later stage was started
+    assert not list((tmp_path / "jobs").glob(f"{gen._id}_dev*.jsonl"))
+
+
+def test_run_deadline_cancels_a_batch_wait(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    gen = Generator(
+        factorial_test,
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        deadline=0.5,
+    )
+
+    start = time.monotonic()
+    gen.generate_batched(SlowBatchSubmitter("nav", 60.0), job_dir=tmp_path / "jobs")
+
+    assert time.monotonic() - start < 10
+    assert gen.results == [(gen.pipelines[0]._id, "")]
+    assert list(gen.stop_reasons.values()) == ["run deadline of 0.5s passed"]
+
+
+def test_batch_tokens_count_against_the_budget(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path))
+    gen = Generator(
+        factorial_test,
+        cache=CompletionCache(tmp_path / "completions.sqlite"),
+        pipeline_token_budget=100,
+    )
+
+    gen.generate_batched(LocalBatchSubmitter(respond), job_dir=tmp_path / "jobs")
+
+    # the Navigator's answer alone spends the budget, so no later stage is submitted
+    assert gen.pipelines[0].budget.used_tokens > 100
+    assert list(gen.stop_reasons.values()) == ["pipeline budget of 100 tokens spent"]
+    assert not list((tmp_path / "jobs").glob(f"{gen._id}_test*.jsonl"))
@@ -0,0 +1,105 @@
+import asyncio
+import threading
+from pathlib import Path
+
+from tdg.cache import (
+    CompletionCache,
+    SqliteCache,
+    completion_key,
+    default_completion_cache,
+    default_report_cache,
+)
+
+MESSAGES = [
+    {"role": "system", "content": "You are a Navigator."},
+    {"role": "user", "content": "Reason about factorial."},
+]
+CONFIG = {"model": "gpt-4-turbo-preview", "stream": False}
+
+
+def test_completion_key_is_content_addressed():
+    assert completion_key(MESSAGES, CONFIG) == completion_key(
+        [dict(m) for m in MESSAGES], dict(CONFIG)
+    )
+    # transport-only fields do not change the address
+    assert completion_key(MESSAGES, CONFIG) == completion_key(
+        MESSAGES, {**CONFIG, "stream": True}
+    )
+    assert completion_key(MESSAGES, CONFIG) != completion_key(
+        MESSAGES, {**CONFIG, "model": "gpt-3.5-turbo"}
+    )
+    assert completion_key(MESSAGES, CONFIG) != completion_key(
+        MESSAGES, {**CONFIG, "temperature": 0.5}
+    )
+    assert completion_key(MESSAGES, CONFIG) != completion_key(MESSAGES[:1], CONFIG)
+
+
+def test_completion_cache_hits_and_misses(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    choices = [{"role": "assistant", "content": "Think about 0!."}]
+
+    assert cache.get_choices(MESSAGES, CONFIG) is None
+    cache.set_choices(MESSAGES, CONFIG, choices)
+    assert cache.get_choices(MESSAGES, CONFIG) == choices
+
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_cache_persists_across_instances(tmp_path):
+    path = tmp_path / "completions.sqlite"
+    SqliteCache(path).set("key", {"a": 1})
+    assert SqliteCache(path).get("key") == {"a": 1}
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = SqliteCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    # touch a, so b is now the least recently used
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert len(cache) == 2
+    assert cache.evictions == 1
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_default_caches_live_under_home_at_first_use(tmp_path, monkeypatch):
+    monkeypatch.setenv("HOME", str(tmp_path / "elsewhere"))
+
+    assert (
+        default_completion_cache().path == Path.home() / ".tdg" / "completions.sqlite"
+    )
+    assert default_report_cache().path.parent == tmp_path / "elsewhere" / ".tdg"
+
+
+def test_hits_defer_last_used_until_the_next_write(tmp_path):
+    cache = SqliteCache(tmp_path / "cache.sqlite", max_entries=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+
+    assert cache.get("a") == 1
+    assert cache._touched.keys() == {"a"}
+    # the write brings a's use up to date first, so b is the least recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+
+
+def test_async_access_runs_off_the_event_loop(tmp_path):
+    cache = CompletionCache(tmp_path / "completions.sqlite")
+    choices = [{"role": "assistant", "content": "Think about 0!."}]
+    threads = []
+    get = cache.get
+    cache.get = lambda key: threads.append(threading.get_ident()) or get(key)
+
+    async def use():
+        await cache.aset_choices(MESSAGES, CONFIG, choices)
+        return await cache.aget_choices(MESSAGES, CONFIG)
+
+    assert asyncio.run(use()) == choices
+    assert threads and threading.get_ident() not in threads
+    cache.close()
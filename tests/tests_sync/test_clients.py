@@ -0,0 +1,49 @@
+import asyncio
+
+from tdg.agents import NavAgent
+from tdg.agents.base import CodeContext
+from tdg.clients import ClientRegistry
+from tdg.config import Settings
+from tests.helpers import factorial_test
+
+
+def registry(**kwargs) -> ClientRegistry:
+    return ClientRegistry(Settings(OPENAI_API_KEY="sk-test"), **kwargs)
+
+
+def test_registry_limits_from_settings_and_overrides():
+    limits = registry(max_connections=7).limits
+    assert limits.max_connections == 7
+    assert limits.max_keepalive_connections == 20
+    assert limits.keepalive_expiry == 30.0
+
+
+def test_registry_limits_keep_explicit_zeros():
+    limits = registry(max_keepalive_connections=0, keepalive_expiry=0).limits
+    assert limits.max_keepalive_connections == 0
+    assert limits.keepalive_expiry == 0
+
+
+def test_agents_share_one_client_per_loop():
+    clients = registry()
+
+    async def build():
+        agents = [
+            NavAgent(CodeContext(factorial_test), clients=clients) for _ in range(3)
+        ]
+        first, *rest = [agent.client for agent in agents]
+        assert all(client is first for client in rest)
+        return first
+
+    first = asyncio.run(build())
+    # a new event loop gets a new pool, since connections are bound to their loop
+    second = asyncio.run(build())
+    assert first is not second
+    assert len(clients._clients) == 1
+
+
+def test_clients_leave_retries_to_the_rate_limiter():
+    async def build():
+        return registry().client()
+
+    assert asyncio.run(build()).max_retries == 0
@@ -1,6 +1,8 @@
+import math
+
 import pytest
 
-from tdg.executors.base import Executor
+from tdg.executors.base import Executor, compile_code, freeze
 
 basic = """
 x += 1
@@ -60,3 +62,33 @@ def test_exec_class_class_stuff():
 
     # outer b obj not modified
     assert b.a == "asdf"
+
+
+def test_layered_executors_share_a_frozen_base():
+    # modules can't be deep-copied, and are shared instead
+    base = freeze(x=1, items=[1], double=lambda n: 2 * n, math=math)
+
+    e = Executor.over(base)
+    e.run(
+        "x += 1\nitems.append(2)\ndef f():\n    return double(x)\ny = f()\nroot = math.isqrt(16)"
+    )
+    assert e.x == 2
+    assert e.items == [1, 2]
+    assert e.y == 4
+    assert e.root == 4
+    # the base is untouched, so the next executor starts afresh
+    assert base["x"] == 1 and base["items"] == [1]
+    assert Executor.over(base).items == [1]
+
+    with pytest.raises(NameError):
+        Executor.over(base).run("undefined_name")
+
+
+def test_snippets_are_compiled_once():
+    snippet = "result = sum(range(10))"
+    compile_code.cache_clear()
+    for _ in range(3):
+        e = Executor.over(freeze())
+        e.run(snippet)
+        assert e.result == 45
+    assert compile_code.cache_info().hits == 2
@@ -0,0 +1,49 @@
+from tdg.agents.base import GenerationHistory, Message, window_messages
+from tdg.limits import estimate_tokens
+
+
+def repair_chain(rounds: int) -> list[Message]:
+    chain = [Message.system("You are a Developer."), Message.user("Implement it.")]
+    for i in range(rounds):
+        chain.append(Message.assistant(f"def attempt_{i}():\n" + "    pass\n" * 50))
+        chain.append(Message.user(f"Attempt {i} failed:\n" + "Traceback...\n" * 50))
+    return chain
+
+
+def cost(chain: list[Message]) -> int:
+    return sum(estimate_tokens(m.content) + 4 for m in chain)
+
+
+def test_window_keeps_chain_that_fits():
+    chain = repair_chain(3)
+    assert window_messages(chain, cost(chain)) == chain
+
+
+def test_window_keeps_head_and_latest_exchanges():
+    chain = repair_chain(5)
+    latest_two = chain[-4:]
+    budget = cost(chain[:2] + latest_two) + 20
+
+    windowed = window_messages(chain, budget)
+
+    assert windowed[:2] == chain[:2]
+    assert windowed[2].role == "system"
+    assert "6 earlier messages" in windowed[2].content
+    # whole exchanges, starting from a response
+    assert windowed[3:] == latest_two
+    assert windowed[3].role == "assistant"
+    assert cost(windowed) <= budget
+
+
+def test_window_always_keeps_latest_message():
+    chain = repair_chain(4)
+    windowed = window_messages(chain, budget=1)
+    assert windowed[:2] == chain[:2]
+    assert windowed[-1] == chain[-1]
+    assert len(windowed) == 4
+
+
+def test_history_window_is_opt_in():
+    history = GenerationHistory(messages=repair_chain(5))
+    assert history.windowed_messages_dict(None) == history.messages_dict()
+    assert len(history.windowed_messages_dict(1)) < len(history.messages)
@@ -0,0 +1,38 @@
+import pytest
+
+from tdg.metrics import CallRecord, UsageSummary, usage_report
+
+
+def record(**kwargs) -> CallRecord:
+    return CallRecord(
+        **{"agent": "NavAgent", "pipeline_id": "p", "model": "gpt-4", **kwargs}
+    )
+
+
+def test_cost_by_model():
+    assert record(prompt_tokens=1_000_000).cost == pytest.approx(30.0)
+    assert record(completion_tokens=1_000).cost == pytest.approx(0.06)
+    assert record(prompt_tokens=1_000, cache_hit=True).cost == 0
+    assert record(prompt_tokens=1_000, model="local").cost == 0
+    assert record(prompt_tokens=1_000_000, batched=True).cost == pytest.approx(15.0)
+
+
+def test_usage_report_groups_by_agent_and_pipeline():
+    records = [
+        record(prompt_tokens=10, completion_tokens=5, latency=1.0, retries=1),
+        record(agent="DevAgent", prompt_tokens=20, latency=3.0),
+        record(pipeline_id="q", cache_hit=True, latency=0.01),
+    ]
+
+    report = usage_report(records)
+
+    assert report["total"]["calls"] == 3
+    assert report["total"]["cache_hits"] == 1
+    assert report["total"]["retries"] == 1
+    assert report["total"]["prompt_tokens"] == 30
+    assert report["total"]["max_latency"] == 3.0
+    assert report["by_agent"]["NavAgent"]["calls"] == 2
+    assert report["by_agent"]["DevAgent"]["latency"] == 3.0
+    assert report["by_pipeline"]["p"]["calls"] == 2
+    assert report["by_pipeline"]["q"]["cost"] == 0
+    assert UsageSummary.model_validate(report["total"]) == UsageSummary.of(records)
@@ -60,3 +60,61 @@ def test_raises_syntax_error_bad_raw_code():
 
 def test_parses_entire_file():
     assert parsing.clean_openai_code_or_error(Path(__file__).read_text())
+
+
+# built up, so that test_parses_entire_file doesn't see extra code blocks in this file
+FENCE = "`" * 3
+PY = FENCE + "python"
+
+
+def test_split_streamed_code():
+    closed, open_block = parsing.split_streamed_code(
+        f"Here you go\n{PY}\nx = 1\n{FENCE}\nand\n{PY}\nimport os\ny ="
+    )
+    assert closed == ["\nx = 1\n"]
+    assert open_block == "\nimport os\ny ="
+
+    closed, open_block = parsing.split_streamed_code(example)
+    assert len(closed) == 2
+    assert open_block is None
+
+
+def test_streamed_code_is_valid():
+    assert parsing.streamed_code_is_valid(f"{PY}\nimport os\ndef f(")
+    # a closed block can no longer be fixed by the rest of the stream
+    assert not parsing.streamed_code_is_valid(bad_example)
+    # a closed block using a missing module can't be either
+    uses_bad = f"{PY}\nimport bad_doesnt_exist\n\nbad_doesnt_exist.f()\n{FENCE}"
+    assert not parsing.streamed_code_is_valid(uses_bad)
+    # but the repair drops unavailable imports that turn out unused, and dedents blocks
+    assert parsing.streamed_code_is_valid(f"{PY}\nimport bad_doesnt_exist\ndef f(")
+    assert parsing.streamed_code_is_valid(f"{PY}\n    x = 1\n    y = 2\n{FENCE}")
+
+
+def test_streamed_code_is_judged_before_its_block_closes():
+    # a completed line uses the missing module, even in a function still being written
+    uses_bad = f"{PY}\nimport bad_doesnt_exist\n\ndef f():\n    bad_doesnt_exist.g()\n"
+    assert not parsing.streamed_code_is_valid(uses_bad)
+    # but not an attribute or a string of the same name
+    mentions = f"{PY}\nimport bad_doesnt_exist\nx = y.bad_doesnt_exist\nprint('bad_doesnt_exist')\n"
+    assert parsing.streamed_code_is_valid(mentions)
+    # a top-level statement is complete once the next one starts, and this one won't parse
+    assert not parsing.streamed_code_is_valid(f"{PY}\nx = = 1\ny = 2\n")
+    assert parsing.streamed_code_is_valid(f"{PY}\nx = = 1\n")
+    # statements that go on past the margin aren't cut short
+    for partial in [
+        "if x:\n    pass\nelse:\n    pass\n",
+        "import functools\n@functools.cache\ndef f():\n    pass\n",
+        "x = f(\n1,\n)\ny = 2\n",
+        's = """\nhello\n',
+        "def f():\n# a comment\n    return 1\n",
+    ]:
+        assert parsing.streamed_code_is_valid(f"{PY}\n{partial}")
+
+
+def test_dedupe_code_by_ast():
+    a = "def f(x):\n    return x + 1\n"
+    a_reformatted = "def f( x ):  # same thing\n    return (x + 1)\n"
+    b = "def f(x):\n    return 1 + x\n"
+
+    assert parsing.dedupe_code(a, a_reformatted, b, a) == [a, b]
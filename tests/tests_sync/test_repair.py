@@ -0,0 +1,94 @@
+from tdg import parsing
+from tdg.repair import drop_unused_imports, is_prose, repair_code
+
+FENCE = "`" * 3
+
+FACTORIAL = "import math\n\n\ndef factorial(n):\n    return math.factorial(n)\n"
+
+
+def test_valid_code_needs_no_fixes():
+    repaired = repair_code(f"Here you go:\n{FENCE}python\n{FACTORIAL}{FENCE}\nEnjoy!")
+    assert repaired.fixes == []
+    assert parsing.code_eq(repaired.code, FACTORIAL)
+
+
+def test_strips_prose_around_unfenced_code():
+    text = f"Sure! Here is the implementation:\n{FACTORIAL}\nThis runs in linear time."
+    repaired = repair_code(text)
+    assert repaired.fixes == ["stripped 2 prose lines"]
+    assert parsing.code_eq(repaired.code, FACTORIAL)
+
+
+def test_strips_markdown_and_dedents_indented_code():
+    indented = "\n".join("    " + line for line in FACTORIAL.splitlines())
+    text = f"**Solution**\n{indented}\n- uses the standard library"
+    repaired = repair_code(text)
+    assert repaired.fixes == ["stripped 2 prose lines", "dedented"]
+    assert parsing.code_eq(repaired.code, FACTORIAL)
+
+
+def test_reads_fences_without_a_language():
+    repaired = repair_code(f"{FENCE}\n{FACTORIAL}{FENCE}")
+    assert parsing.code_eq(repaired.code, FACTORIAL)
+
+
+def test_leaves_real_syntax_errors_to_the_llm():
+    assert repair_code("def factorial(n)\n    return n\n").code is None
+    assert not is_prose("def factorial(n)")
+    assert not is_prose("return x if x else y")
+    assert is_prose("The function below computes it.")
+
+
+def test_never_drops_code_that_reads_like_prose():
+    assert not is_prose("print(a, b, c)")
+    # the syntax error is real, so the print beside it stays for the LLM to see
+    assert repair_code("print(a, b, c)\nx = = 1\n").code is None
+    assert repair_code("Here it is:\nprint(a, b, c)\n").code == "print(a, b, c)\n"
+
+
+def test_ignores_fences_of_other_languages():
+    assert repair_code(f"{FENCE}bash\npip install foo\n{FENCE}").code is None
+    assert repair_code("").code is None
+
+
+def test_drops_only_unused_unavailable_imports():
+    code = (
+        "import numpy_doesnt_exist as np\n"
+        "from bad_doesnt_exist import helper\n"
+        "import math\n\n"
+        "def f(x):\n    return helper(math.sqrt(x))\n"
+    )
+    repaired, still_bad = drop_unused_imports(
+        code,
+        ["import numpy_doesnt_exist as np", "from bad_doesnt_exist import helper"],
+    )
+    assert still_bad == ["from bad_doesnt_exist import helper"]
+    assert "numpy_doesnt_exist" not in repaired
+    assert "import math" in repaired
+
+
+def test_repair_reports_needed_unavailable_imports():
+    unused = repair_code(f"import bad_doesnt_exist\n{FACTORIAL}")
+    assert unused.bad_imports == []
+    assert unused.fixes == ["dropped unused imports ['import bad_doesnt_exist']"]
+
+    used = repair_code("import bad_doesnt_exist\n\nbad_doesnt_exist.run()\n")
+    assert used.bad_imports == ["import bad_doesnt_exist"]
+
+
+def test_dropping_an_import_keeps_its_block():
+    guarded = (
+        "try:\n    import bad_doesnt_exist\nexcept ImportError:\n    pass\n\n"
+        "def f():\n    import bad_doesnt_exist\n\n" + FACTORIAL
+    )
+    repaired = repair_code(guarded)
+    assert repaired.bad_imports == []
+    assert "bad_doesnt_exist" not in repaired.code
+    assert parsing.is_valid_python(repaired.code)[0]
+    # and black can format it, as the agent will
+    assert "def f():\n    pass" in parsing.format_code(repaired.code)
+
+
+def test_imports_sharing_a_line_are_left_to_the_llm():
+    repaired = repair_code("import bad_doesnt_exist; x = 1\n")
+    assert repaired.bad_imports == ["import bad_doesnt_exist"]
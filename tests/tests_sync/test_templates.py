@@ -0,0 +1,37 @@
+from tdg.agents import DevAgent, templates
+from tdg.agents.base import CodeContext, Message
+from tests.helpers import factorial_test
+
+
+def test_relevant_packages_filters_by_context():
+    context = "import yaml\nfrom pydantic import BaseModel\nimport os\n"
+    packages = templates.relevant_packages(context)
+
+    assert {"yaml", "pydantic", "pytest"} <= set(packages)
+    # stdlib is offered wholesale by the prompt, not by name
+    assert "os" not in packages
+    assert "black" not in packages
+
+    assert templates.relevant_packages(context, allowlist=["black"]) == sorted(
+        ["black", "pydantic", "yaml"]
+    )
+
+
+def test_code_generator_prompt_is_slim_by_default():
+    slim = templates.code_generator("import yaml")
+    full = templates.code_generator(full=True)
+
+    assert "pytest, yaml" in slim
+    assert templates.list_installed_packages() in full
+    assert len(slim) < len(full)
+
+
+def test_dev_agent_offers_packages_from_tests():
+    tests = Message.assistant("import yaml\n\ndef test_factorial():\n    ...")
+    dev = DevAgent(tests, code_context=CodeContext(factorial_test))
+    assert "pytest, yaml" in dev.system_prompt()
+
+    everything = DevAgent(
+        tests, code_context=CodeContext(factorial_test), full_package_list=True
+    )
+    assert templates.list_installed_packages() in everything.system_prompt()